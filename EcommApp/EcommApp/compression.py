@@ -0,0 +1,153 @@
+"""
+Response compression with gzip or brotli negotiation
+
+CompressionMiddleware compresses responses the client accepts in
+compressed form, picking brotli when the ``brotli`` package is
+installed and preferred by the client, and gzip otherwise. Streaming
+responses, sync and async, go through one incremental compressor, so a
+streamed export is a single compressed stream rather than one member
+per chunk as with Django's GZipMiddleware.
+
+Bodies shorter than ``COMPRESSION_MIN_SIZE`` bytes and content types
+outside ``COMPRESSIBLE_TYPES`` are sent as is.
+"""
+import zlib
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = ('application/json', 'text/')
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+class GzipCompressor:
+    """
+    Incremental gzip compressor
+    """
+    encoding = 'gzip'
+
+    def __init__(self):
+        # wbits 16 + MAX_WBITS writes a gzip header and trailer
+        self.compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        return self.compressor.compress(data)
+
+    def finish(self):
+        return self.compressor.flush()
+
+
+class BrotliCompressor:
+    """
+    Incremental brotli compressor
+    """
+    encoding = 'br'
+
+    def __init__(self):
+        self.compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def compress(self, data):
+        return self.compressor.process(data)
+
+    def finish(self):
+        return self.compressor.finish()
+
+
+def accepted_encodings(header):
+    """
+    Returns the content codings accepted by an Accept-Encoding header,
+    leaving out those with q=0
+    """
+    accepted = set()
+    for item in header.split(','):
+        coding, _, params = item.strip().partition(';')
+        quality = params.strip().replace(' ', '')
+        if quality.startswith('q='):
+            try:
+                if float(quality[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        if coding:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+def choose_compressor(header):
+    """
+    Returns the compressor class for an Accept-Encoding header, None when
+    the client accepts no supported coding
+    """
+    accepted = accepted_encodings(header)
+    if brotli is not None and 'br' in accepted:
+        return BrotliCompressor
+    if 'gzip' in accepted or '*' in accepted:
+        return GzipCompressor
+    return None
+
+
+def compress_stream(chunks, compressor):
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+async def acompress_stream(chunks, compressor):
+    async for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Middleware compressing responses, keep it above every middleware that
+    reads or changes the response body
+    """
+    def process_response(self, request, response):
+        if response.has_header('Content-Encoding'):
+            return response
+        content_type = response.get('Content-Type', '')
+        if not content_type.startswith(COMPRESSIBLE_TYPES):
+            return response
+        if not response.streaming and len(response.content) < getattr(
+                settings, 'COMPRESSION_MIN_SIZE', 1024):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        compressor_class = choose_compressor(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if compressor_class is None:
+            return response
+
+        compressor = compressor_class()
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = acompress_stream(response.streaming_content,
+                                                              compressor)
+            else:
+                response.streaming_content = compress_stream(response.streaming_content,
+                                                             compressor)
+            del response.headers['Content-Length']
+        else:
+            content = compressor.compress(response.content) + compressor.finish()
+            if len(content) >= len(response.content):
+                return response
+            response.content = content
+            response.headers['Content-Length'] = str(len(content))
+
+        # a compressed body is not byte for byte the one the strong ETag was
+        # made for (RFC 9110 section 8.8.1)
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = compressor.encoding
+        return response
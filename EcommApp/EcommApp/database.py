@@ -0,0 +1,93 @@
+"""
+SQLite database profiles and the read/write router
+
+The ``development`` profile is a plain sqlite3 file with default
+settings. The ``production`` profile opens the same file twice:
+
+* ``default`` is the primary, used for writes. Its transactions start
+  with BEGIN IMMEDIATE, so a writer takes the write lock up front and
+  waits on ``busy_timeout`` instead of failing when it tries to upgrade
+  a read lock.
+* ``replica`` is a query_only connection used for reads outside
+  transactions.
+
+Both run in WAL mode, so readers see the last committed state without
+waiting for writers. Both connections read the same file, so a write is
+visible to reads as soon as it commits. There is no replication lag.
+"""
+from django.db import connections
+
+PROFILES = ('development', 'production')
+
+# Applied by every production connection when it is opened
+PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    # durable at WAL checkpoints, a power loss may drop the last commits
+    # but never corrupts the database
+    'PRAGMA synchronous=NORMAL',
+    # negative sizes are in KiB: 64 MiB page cache per connection
+    'PRAGMA cache_size=-65536',
+    'PRAGMA mmap_size=268435456',
+    'PRAGMA temp_store=MEMORY',
+)
+
+# Seconds a production connection waits for a lock before failing
+BUSY_TIMEOUT = 20
+# Seconds a production connection is kept open between requests
+CONN_MAX_AGE = 600
+
+
+def sqlite_databases(name, profile='development'):
+    """
+    Returns the DATABASES setting of a profile
+
+    Args:
+        name (str): path of the SQLite file
+        profile (str): one of PROFILES
+    """
+    if profile not in PROFILES:
+        raise ValueError("Unknown database profile {!r}, use one of {}".format(
+            profile, ", ".join(PROFILES)))
+    if profile == 'development':
+        return {'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': name}}
+
+    def database(*pragmas, **options):
+        return {'ENGINE': 'django.db.backends.sqlite3',
+                'NAME': name,
+                'CONN_MAX_AGE': CONN_MAX_AGE,
+                'CONN_HEALTH_CHECKS': True,
+                'OPTIONS': {'init_command': ';'.join(PRAGMAS + pragmas),
+                            'timeout': BUSY_TIMEOUT,
+                            **options}}
+
+    replica = database('PRAGMA query_only=ON')
+    # the test runner points the replica at the test copy of the primary
+    replica['TEST'] = {'MIRROR': 'default'}
+    return {'default': database(transaction_mode='IMMEDIATE'),
+            'replica': replica}
+
+
+class ReadWriteRouter:
+    """
+    Sends writes to ``default`` and reads to ``replica``
+
+    Reads made while ``default`` is inside a transaction stay on
+    ``default`` so they see the transaction's own writes.
+    """
+    read_alias = 'replica'
+    write_alias = 'default'
+
+    def db_for_read(self, model, **hints):
+        if connections[self.write_alias].in_atomic_block:
+            return self.write_alias
+        return self.read_alias
+
+    def db_for_write(self, model, **hints):
+        return self.write_alias
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # both aliases are the same database
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == self.write_alias
@@ -0,0 +1,297 @@
+"""
+Per-endpoint latency and query instrumentation
+
+RequestMetricsMiddleware records, for each resolved URL name, the wall
+time, number of database queries, database time and serialization time
+of every request into in-process histograms. Queries slower than
+``METRICS_SLOW_QUERY_MS`` are kept with their SQL. The numbers are served
+by the ``metrics`` view and written to the ``EcommApp.metrics`` logger
+every ``METRICS_LOG_INTERVAL`` seconds.
+
+Queries are timed by an execute wrapper installed on every database
+connection. It reads the request being measured from a context variable,
+so queries run through sync_to_async by async views are counted too.
+
+Streamed bodies are produced after the middleware returned: their chunks
+are generated with the request's timings set, and the request is recorded
+once the response is closed, so its queries and wall time include the
+body.
+"""
+import bisect
+import json
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import JsonResponse
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the histogram buckets, in milliseconds for timings and
+# plain counts for queries
+BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, float('inf'))
+
+_current = ContextVar('request_metrics', default=None)
+
+
+class Histogram:
+    """
+    Fixed bucket histogram with count, sum and max
+    """
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, value):
+        """
+        Returns the upper bound of the bucket holding the percentile,
+        capped at the largest value seen
+        """
+        if not self.count:
+            return 0.0
+        rank = value * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def as_dict(self):
+        return {'count': self.count,
+                'mean': round(self.total / self.count, 3) if self.count else 0.0,
+                'p50': self.percentile(0.50),
+                'p90': self.percentile(0.90),
+                'p99': self.percentile(0.99),
+                'max': round(self.max, 3)}
+
+
+class Registry:
+    """
+    Thread safe store of the histograms and slow queries of a process
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.slow_queries = deque(maxlen=50)
+        self.last_dump = time.monotonic()
+
+    def record(self, url_name, values):
+        with self.lock:
+            for metric, value in values.items():
+                key = (url_name, metric)
+                if key not in self.histograms:
+                    self.histograms[key] = Histogram()
+                self.histograms[key].add(value)
+
+    def record_slow_query(self, url_name, sql, duration_ms):
+        with self.lock:
+            self.slow_queries.append({'url_name': url_name,
+                                      'sql': sql,
+                                      'ms': round(duration_ms, 3)})
+
+    def snapshot(self):
+        with self.lock:
+            endpoints = {}
+            for (url_name, metric), histogram in self.histograms.items():
+                endpoints.setdefault(url_name, {})[metric] = histogram.as_dict()
+            return {'endpoints': endpoints,
+                    'slow_queries': list(self.slow_queries)}
+
+    def reset(self):
+        with self.lock:
+            self.histograms.clear()
+            self.slow_queries.clear()
+
+    def should_dump(self, interval):
+        with self.lock:
+            now = time.monotonic()
+            if now - self.last_dump < interval:
+                return False
+            self.last_dump = now
+            return True
+
+
+registry = Registry()
+
+
+class RequestTimings:
+    """
+    Accumulates the timings of the request being measured
+    """
+    def __init__(self, request):
+        self.request = request
+        self.queries = 0
+        self.db_ms = 0.0
+        self.serialization_ms = 0.0
+
+    @property
+    def url_name(self):
+        match = getattr(self.request, 'resolver_match', None)
+        return (match.url_name if match else None) or 'unresolved'
+
+
+@contextmanager
+def timed_serialization():
+    """
+    Adds the time spent in the block to the serialization time of the
+    current request
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings = _current.get()
+        if timings is not None:
+            timings.serialization_ms += (time.perf_counter() - started) * 1000
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Execute wrapper timing every query of a measured request
+    """
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration_ms = (time.perf_counter() - started) * 1000
+        timings.queries += 1
+        timings.db_ms += duration_ms
+        if duration_ms >= getattr(settings, 'METRICS_SLOW_QUERY_MS', 100):
+            registry.record_slow_query(timings.url_name, sql, duration_ms)
+
+
+def install_query_recorder(connection, **kwargs):
+    # insert first: connection.execute_wrapper() pops its own wrapper off
+    # the end of the list
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+connection_created.connect(install_query_recorder)
+
+
+def _measured(chunks, timings):
+    """
+    Yields the chunks of a streamed body, generating each with
+    ``timings`` as the request being measured
+    """
+    chunks = iter(chunks)
+    while True:
+        token = _current.set(timings)
+        try:
+            chunk = next(chunks)
+        except StopIteration:
+            return
+        finally:
+            _current.reset(token)
+        yield chunk
+
+
+async def _ameasured(chunks, timings):
+    """
+    Async version of _measured
+    """
+    chunks = aiter(chunks)
+    while True:
+        token = _current.set(timings)
+        try:
+            chunk = await anext(chunks)
+        except StopAsyncIteration:
+            return
+        finally:
+            _current.reset(token)
+        yield chunk
+
+
+class RequestMetricsMiddleware:
+    """
+    Middleware recording per URL name request metrics, keep it first in
+    MIDDLEWARE so the whole stack is measured
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        for connection in connections.all(initialized_only=True):
+            install_query_recorder(connection)
+        timings, token, started = self.start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.end(response, timings, started)
+        return response
+
+    async def __acall__(self, request):
+        timings, token, started = self.start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.end(response, timings, started)
+        return response
+
+    def start(self, request):
+        timings = RequestTimings(request)
+        return timings, _current.set(timings), time.perf_counter()
+
+    def end(self, response, timings, started):
+        """
+        Records the request now, or once a streamed body has been sent
+        """
+        if not response.streaming:
+            self.finish(timings, started)
+            return
+        content = response.streaming_content
+        if response.is_async:
+            response.streaming_content = _ameasured(content, timings)
+        else:
+            response.streaming_content = _measured(content, timings)
+        response._resource_closers.append(partial(self.finish, timings, started))
+
+    def finish(self, timings, started):
+        registry.record(timings.url_name, {
+            'wall_ms': (time.perf_counter() - started) * 1000,
+            'queries': timings.queries,
+            'db_ms': timings.db_ms,
+            'serialization_ms': timings.serialization_ms,
+        })
+        if registry.should_dump(getattr(settings, 'METRICS_LOG_INTERVAL', 60)):
+            logger.info("request metrics %s", json.dumps(registry.snapshot()))
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def metrics(request):
+    """
+    method returning the request metrics of this process
+    """
+    return JsonResponse(registry.snapshot())
@@ -10,7 +10,9 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
+from EcommApp.database import sqlite_databases
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -41,6 +43,7 @@ INSTALLED_APPS = [
     'rest_framework',
     'user',
     'product',
+    'tasks',
 ]
 
 # I added the line below
@@ -48,6 +51,8 @@ INSTALLED_APPS = [
 AUTH_USER_MODEL = "user.CustomUser"
 
 MIDDLEWARE = [
+    'EcommApp.metrics.RequestMetricsMiddleware',
+    'EcommApp.compression.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -77,17 +82,110 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'EcommApp.wsgi.application'
 
+# Serve the product list and detail with native async views. Turn on when
+# running under ASGI (EcommApp.asgi), leave off under WSGI.
+PRODUCT_ASYNC_VIEWS = False
+
+# Serialize product list pages with ProductListSerializer, which skips the
+# DRF field pipeline and renders the same JSON
+PRODUCT_FAST_LIST = False
+
+# Catalog snapshot file (product.snapshot) built by the
+# build_catalog_snapshot command. While it is fresh, anonymous product list
+# pages and product lookups are read from it instead of the database.
+# None turns it off.
+CATALOG_SNAPSHOT_PATH = None
+
+# Products served per category leaderboard (product.leaderboards), each
+# board stores twice as many so that most updates need no query
+LEADERBOARD_SIZE = 20
+
+# Related products stored per product by product.recommendations
+RELATED_PRODUCTS_SIZE = 20
+
+# Seconds a stock reservation holds its units before it may be released
+RESERVATION_TTL = 900
+
 
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
+# ECOMM_DATABASE_PROFILE=production enables WAL, tuned pragmas, persistent
+# connections and a read-only replica connection (see EcommApp.database)
+DATABASE_PROFILE = os.environ.get('ECOMM_DATABASE_PROFILE', 'development')
+
+DATABASES = sqlite_databases(BASE_DIR / 'db.sqlite3', DATABASE_PROFILE)
+
+DATABASE_ROUTERS = (['EcommApp.database.ReadWriteRouter']
+                    if DATABASE_PROFILE == 'production' else [])
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
 }
 
+# Cache alias holding row version tokens and cached product payloads
+MODEL_CACHE_ALIAS = 'default'
+
+# Seconds a cached product payload is fresh, and how much longer it may be
+# served stale while one request reloads it
+PRODUCT_CACHE_TIMEOUT = 300
+PRODUCT_CACHE_GRACE = 30
+
+
+# Django REST framework
+# https://www.django-rest-framework.org/api-guide/settings/
+
+REST_FRAMEWORK = {
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        # builds request.user from the token claims, without a query
+        'rest_framework_simplejwt.authentication.JWTStatelessUserAuthentication',
+        'rest_framework.authentication.SessionAuthentication',
+        'rest_framework.authentication.BasicAuthentication',
+    ],
+}
+
+SIMPLE_JWT = {
+    'TOKEN_USER_CLASS': 'user.authentication.ClaimsUser',
+    'TOKEN_OBTAIN_SERIALIZER': 'user.authentication.ClaimsTokenObtainPairSerializer',
+}
+
+# Seconds ClaimsUser.get_full_user() keeps a loaded user in memory
+AUTH_FULL_USER_TTL = 30
+
+
+# Smallest response body, in bytes, compressed by
+# EcommApp.compression.CompressionMiddleware, streamed bodies are always
+# compressed
+COMPRESSION_MIN_SIZE = 1024
+
+
+# Request metrics (EcommApp.metrics)
+# Queries at least this slow are kept with their SQL
+METRICS_SLOW_QUERY_MS = 100
+# Seconds between two dumps of the metrics to the EcommApp.metrics logger
+METRICS_LOG_INTERVAL = 60
+
+
+# Background tasks (tasks.queue)
+# 'thread' runs queued tasks in an in-process pool after the enqueuing
+# transaction commits and when a delayed or retried task comes due, but
+# leaves worker only tasks (product.tasks.refresh_related) to run_tasks,
+# 'worker' leaves them all to the run_tasks command and 'eager' runs
+# them inline when enqueued
+TASKS_MODE = 'thread'
+TASKS_THREADS = 2
+# Seconds a worker holds a claimed task before another may run it again
+TASKS_LEASE = 300
+# Seconds the run_tasks command keeps done tasks, whose idempotency keys
+# drop duplicate calls meanwhile
+TASKS_KEEP_DONE = 7 * 24 * 3600
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
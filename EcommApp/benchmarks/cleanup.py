@@ -0,0 +1,122 @@
+#!/usr/bin/python3
+"""Benchmark of deleting a large category
+
+One of two categories is deleted while a writer thread keeps updating a
+product of the other one, on a scratch SQLite database in the
+production profile (EcommApp.database). Two strategies are run in child
+processes: ``cascade`` (Category.delete(), Django collecting every
+product, review and wishlist item) and ``soft_delete``
+(Basemodel.soft_delete() followed by shared_model.purging). Each run
+reports the time until the category is hidden and until its rows are
+gone, the growth of the peak memory and the writer's latency.
+
+usage:
+    python -m benchmarks.cleanup --products 20000
+"""
+
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.concurrency import percentile
+from benchmarks.environment import configure
+
+
+def child(options):
+    """Deletes the first category with one strategy"""
+    os.environ['ECOMM_DATABASE_PROFILE'] = 'production'
+    configure(options.database, TASKS_MODE='worker')
+
+    from django.db import OperationalError, connections
+    from product.models import Category, Product
+    from shared_model.purging import purge
+
+    doomed, kept = Category.objects.order_by('created_at')[:2]
+    doomed_id = doomed.pk
+    other = Product.objects.filter(category=kept).values_list('pk', flat=True).first()
+    latencies = []
+    done = threading.Event()
+
+    lock_errors = [0]
+
+    def writer():
+        try:
+            while not done.is_set():
+                started = time.perf_counter()
+                try:
+                    Product.add_rating(other, 5)
+                except OperationalError:
+                    # waited longer than the busy timeout
+                    lock_errors[0] += 1
+                latencies.append(time.perf_counter() - started)
+                time.sleep(0.001)
+        finally:
+            connections.close_all()
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    time.sleep(0.2)
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    if options.strategy == 'cascade':
+        doomed.delete()
+        hidden = time.perf_counter() - started
+    else:
+        doomed.soft_delete()
+        hidden = time.perf_counter() - started
+        for model in (Category, Product):
+            purge(model, batch_size=options.batch_size)
+    removed = time.perf_counter() - started
+    # kilobytes on Linux
+    growth = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline
+    time.sleep(0.2)
+    done.set()
+    thread.join()
+
+    print(json.dumps({"hidden_seconds": round(hidden, 3),
+                      "removed_seconds": round(removed, 3),
+                      "peak_rss_growth_mb": round(growth / 1024, 1),
+                      "remaining_products": Product.all_objects.filter(category_id=doomed_id).count(),
+                      "writer_p99_ms": percentile(latencies, 0.99),
+                      "writer_max_ms": round(max(latencies) * 1000, 1),
+                      "writer_lock_errors": lock_errors[0]}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--products", type=int, default=20_000)
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--strategy", help=argparse.SUPPRESS)
+    parser.add_argument("--database", help=argparse.SUPPRESS)
+    options = parser.parse_args()
+
+    if options.strategy:
+        return child(options)
+
+    with tempfile.TemporaryDirectory() as directory:
+        seeded = os.path.join(directory, "seed.sqlite3")
+        configure(seeded)
+        from benchmarks.seed import seed
+        seed(users=50, categories=2, products=options.products,
+             reviews=options.products * 2, wishlist_items=options.products // 2)
+        results = {}
+        for strategy in ("cascade", "soft_delete"):
+            database = os.path.join(directory, "{}.sqlite3".format(strategy))
+            shutil.copyfile(seeded, database)
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.cleanup", "--strategy", strategy,
+                 "--database", database, "--batch-size", str(options.batch_size)],
+                check=True, stdout=subprocess.PIPE, text=True).stdout
+            results[strategy] = json.loads(output)
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
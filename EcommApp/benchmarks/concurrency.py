@@ -0,0 +1,153 @@
+#!/usr/bin/python3
+"""Read throughput of the SQLite profiles while writes are in flight
+
+Seeds a scratch SQLite database, then runs each database profile
+(EcommApp.database) in a child process on its own copy of the file. Reader
+threads load product details and list pages while writer threads create
+and update products through the ORM, so every write also fires the
+counter and search index signals. Reads and writes are reported per
+second with read latency percentiles and the number of operations that
+failed on a locked database.
+
+usage:
+    python -m benchmarks.concurrency --readers 8 --writers 2 --seconds 10
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.environment import configure
+
+
+def percentile(samples, value):
+    """Returns a percentile of latencies in seconds as milliseconds"""
+    if not samples:
+        return None
+    samples = sorted(samples)
+    return round(samples[min(len(samples) - 1, int(len(samples) * value))] * 1000, 3)
+
+
+def child(options):
+    """Runs readers and writers against one profile"""
+    os.environ['ECOMM_DATABASE_PROFILE'] = options.profile
+    configure(options.database)
+
+    from django.db import OperationalError, connections, transaction
+    from product.models import Category, Product
+    from product.serializer import ProductSerializer
+    from user.models import User
+
+    ids = json.loads(options.ids)
+    user = User.objects.order_by('created_at').first()
+    category = Category.objects.order_by('created_at').first()
+    deadline = time.monotonic() + options.seconds
+    lock = threading.Lock()
+    results = {'reads': [], 'writes': 0, 'read_errors': 0, 'write_errors': 0}
+
+    def reader(seed_value):
+        rng = random.Random(seed_value)
+        products = ProductSerializer.setup_eager_loading(Product.objects.all())
+        latencies, errors = [], 0
+        try:
+            while time.monotonic() < deadline:
+                started = time.perf_counter()
+                try:
+                    if rng.random() < 0.8:
+                        ProductSerializer(products.get(pk=rng.choice(ids))).data
+                    else:
+                        ProductSerializer(products.order_by('created_at', 'id')[:20], many=True).data
+                except OperationalError:
+                    errors += 1
+                    continue
+                latencies.append(time.perf_counter() - started)
+        finally:
+            connections.close_all()
+        with lock:
+            results['reads'].extend(latencies)
+            results['read_errors'] += errors
+
+    def writer(seed_value):
+        rng = random.Random(seed_value)
+        writes, errors = 0, 0
+        try:
+            while time.monotonic() < deadline:
+                try:
+                    with transaction.atomic():
+                        product = Product.objects.create(name="concurrent lamp",
+                                                         price=rng.randint(1, 500),
+                                                         quantity=1,
+                                                         user=user,
+                                                         category=category)
+                        product.quantity = rng.randint(1, 100)
+                        product.save(update_fields=['quantity'])
+                except OperationalError:
+                    errors += 1
+                    continue
+                writes += 1
+        finally:
+            connections.close_all()
+        with lock:
+            results['writes'] += writes
+            results['write_errors'] += errors
+
+    with ThreadPoolExecutor(options.readers + options.writers) as pool:
+        started = time.perf_counter()
+        futures = ([pool.submit(reader, index) for index in range(options.readers)] +
+                   [pool.submit(writer, -index) for index in range(1, options.writers + 1)])
+        for future in futures:
+            future.result()
+        elapsed = time.perf_counter() - started
+
+    print(json.dumps({"reads_per_second": round(len(results['reads']) / elapsed, 1),
+                      "read_p50_ms": percentile(results['reads'], 0.50),
+                      "read_p99_ms": percentile(results['reads'], 0.99),
+                      "writes_per_second": round(results['writes'] / elapsed, 1),
+                      "read_errors": results['read_errors'],
+                      "write_errors": results['write_errors']}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--products", type=int, default=10_000)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--profile", help=argparse.SUPPRESS)
+    parser.add_argument("--database", help=argparse.SUPPRESS)
+    parser.add_argument("--ids", help=argparse.SUPPRESS)
+    options = parser.parse_args()
+
+    if options.profile:
+        return child(options)
+
+    with tempfile.TemporaryDirectory() as directory:
+        seeded = os.path.join(directory, "seed.sqlite3")
+        configure(seeded)
+        from benchmarks.seed import seed
+        ids = [str(pk) for pk in seed(products=options.products)["products"][:1000]]
+        results = {}
+        for profile in ("development", "production"):
+            # WAL mode is stored in the file, so each profile gets its own copy
+            database = os.path.join(directory, "{}.sqlite3".format(profile))
+            shutil.copyfile(seeded, database)
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.concurrency", "--profile", profile,
+                 "--database", database, "--ids", json.dumps(ids),
+                 "--readers", str(options.readers), "--writers", str(options.writers),
+                 "--seconds", str(options.seconds)],
+                check=True, capture_output=True, text=True).stdout
+            results[profile] = json.loads(output)
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
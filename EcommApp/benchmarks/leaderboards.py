@@ -0,0 +1,109 @@
+#!/usr/bin/python3
+"""Category leaderboards read from the stored boards and from the products
+
+Seeds a scratch SQLite database with reviews, rebuilds the leaderboards
+(product.leaderboards) and, for every board of every category, times
+reading the top products from the stored board against running the
+ranking query over the products table, board by board. Then times the incremental update
+run after a product price change and a new review, and drives the
+category_leaderboard endpoint with the metrics of benchmarks.suite.
+
+usage:
+    python -m benchmarks.leaderboards --products 100000 --reviews 200000
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from benchmarks.environment import configure
+from benchmarks.suite import measure
+
+
+def timed(function, arguments, repeat):
+    """Returns the median milliseconds of ``function`` over the arguments"""
+    timings = []
+    for _ in range(repeat):
+        for argument in arguments:
+            started = time.perf_counter()
+            function(*argument)
+            timings.append(time.perf_counter() - started)
+    return round(statistics.median(timings) * 1000, 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--products", type=int, default=100_000)
+    parser.add_argument("--reviews", type=int, default=200_000)
+    parser.add_argument("--categories", type=int, default=20)
+    parser.add_argument("--updates", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--warmup", type=int, default=200)
+    options = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        configure(os.path.join(directory, "bench.sqlite3"), ALLOWED_HOSTS=["*"],
+                  TASKS_MODE="eager")
+        from django.test import Client
+        from django.urls import reverse
+        from benchmarks.seed import seed
+        from product import leaderboards
+        from product.models import Leaderboard, Product, Review
+        ids = seed(users=200, categories=options.categories, products=options.products,
+                   reviews=options.reviews)
+
+        started = time.perf_counter()
+        boards = leaderboards.rebuild()
+        rebuild_seconds = time.perf_counter() - started
+
+        size = leaderboards.size()
+        slots = [(category_id, board) for category_id in ids["categories"]
+                 for board in leaderboards.BOARDS]
+
+        def ranking_query(category_id, board):
+            products = Product.objects.filter(category_id=category_id)
+            return list(leaderboards.BOARDS[board].candidates(products)
+                        .values_list("id", flat=True)[:size])
+
+        reads = {board: {"stored_board_ms": timed(leaderboards.top, board_slots, 3),
+                         "ranking_query_ms": timed(ranking_query, board_slots, 3)}
+                 for board in leaderboards.BOARDS
+                 for board_slots in [[slot for slot in slots if slot[1] == board]]}
+
+        rng = random.Random(0)
+        changed = rng.sample(ids["products"], options.updates)
+
+        def reprice(pk):
+            Product.objects.filter(pk=pk).update(price=rng.randint(100, 50_000) / 100)
+            leaderboards.update([pk])
+
+        def review(pk):
+            # signals move the rating aggregates and the boards
+            Review.objects.create(product_id=pk, user_id=rng.choice(ids["users"]),
+                                  rating=rng.randint(1, 5), review="benchmark review")
+
+        updates = {"price_change_ms": timed(reprice, [(pk,) for pk in changed], 1),
+                   "new_review_ms": timed(review, [(pk,) for pk in changed], 1)}
+
+        client = Client()
+        requests = [(reverse("category_leaderboard", args=[category_id, board]), None)
+                    for category_id, board in slots]
+        endpoint = measure(client, requests, options.requests, options.warmup)
+        stored = Leaderboard.objects.count()
+
+    print(json.dumps({"products": options.products,
+                      "reviews": options.reviews,
+                      "boards": boards,
+                      "stored_boards": stored,
+                      "rebuild_seconds": round(rebuild_seconds, 2),
+                      "reads": reads,
+                      "updates": updates,
+                      "endpoint": endpoint}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
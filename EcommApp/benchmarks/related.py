@@ -0,0 +1,98 @@
+#!/usr/bin/python3
+""""Also wishlisted" related products computed from the wishlists
+
+Seeds a scratch SQLite database with clustered wishlists (see
+benchmarks.seed) and times the full computation of
+product.recommendations phase by phase: loading the wishlist items into
+the sparse matrix, computing the top neighbours of every product and
+storing them. Then times refresh() after single product wishlist changes
+and drives the related products endpoint with the metrics of
+benchmarks.suite.
+
+usage:
+    python -m benchmarks.related --wishlist-items 1000000
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from benchmarks.environment import configure
+from benchmarks.suite import measure
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--products", type=int, default=100_000)
+    parser.add_argument("--users", type=int, default=50_000)
+    parser.add_argument("--wishlist-items", type=int, default=1_000_000)
+    parser.add_argument("--block-size", type=int, default=2000)
+    parser.add_argument("--refreshes", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--warmup", type=int, default=200)
+    options = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        configure(os.path.join(directory, "bench.sqlite3"), ALLOWED_HOSTS=["*"])
+        import numpy as np
+        from django.test import Client
+        from django.urls import reverse
+        from benchmarks.seed import seed
+        from product import recommendations
+        from product.models import RelatedProduct, WishlistItem
+        ids = seed(users=options.users, categories=20, products=options.products,
+                   wishlist_items=options.wishlist_items)
+        items = WishlistItem.objects.count()
+
+        phases = {}
+        started = time.perf_counter()
+        pairs = (WishlistItem.objects.filter(product__deleted_at__isnull=True)
+                 .values_list("wishlist__user_id", "product_id"))
+        wishlists = recommendations.Wishlists(pairs.iterator(chunk_size=10_000))
+        phases["load_seconds"] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        targets = np.arange(len(wishlists.product_ids))
+        blocks = list(recommendations.neighbours(wishlists, targets, recommendations.size(),
+                                                 options.block_size))
+        phases["compute_seconds"] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        written = recommendations.store(wishlists, blocks)
+        phases["store_seconds"] = time.perf_counter() - started
+        phases = {name: round(value, 2) for name, value in phases.items()}
+
+        rng = random.Random(0)
+        changed = rng.sample(wishlists.product_ids, options.refreshes)
+        timings = []
+        for pk in changed:
+            started = time.perf_counter()
+            recommendations.refresh([pk], block_size=options.block_size)
+            timings.append(time.perf_counter() - started)
+
+        client = Client()
+        requests = [(reverse("related_products", args=[pk]), None)
+                    for pk in rng.sample(ids["products"], 500)]
+        endpoint = measure(client, requests, options.requests, options.warmup)
+        stored = RelatedProduct.objects.count()
+
+    print(json.dumps({"products": options.products,
+                      "users": options.users,
+                      "wishlist_items": items,
+                      "matrix": {"users": wishlists.matrix.shape[0],
+                                 "products": wishlists.matrix.shape[1],
+                                 "nonzero": int(wishlists.matrix.nnz)},
+                      "rows_written": written,
+                      "rows_stored": stored,
+                      "full": dict(phases, total_seconds=round(sum(phases.values()), 2)),
+                      "refresh_ms": {"median": round(statistics.median(timings) * 1000, 1),
+                                     "max": round(max(timings) * 1000, 1)},
+                      "endpoint": endpoint}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/python3
+"""Benchmark of FTS5 product search against icontains scans
+
+Seeds a scratch SQLite database with products, builds the search table
+and times the same queries through product.search (FTS5) and through
+the icontains queryset it replaces.
+
+usage:
+    python -m benchmarks.search --products 1000000
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from benchmarks.environment import configure
+
+QUERIES = ["lamp", "brass lamp", "oak shelf", "kaloni", "vas"]
+
+
+def timed(function, repeat):
+    """Returns the median run time of ``function`` in milliseconds"""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        samples.append((time.perf_counter() - started) * 1000)
+    return round(sorted(samples)[len(samples) // 2], 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--products", type=int, default=1_000_000)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5)
+    options = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        configure(os.path.join(directory, "bench.sqlite3"))
+        from benchmarks.seed import seed
+        from product import search
+
+        started = time.perf_counter()
+        seed(users=1, categories=50, products=options.products)
+        seed_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        search.rebuild()
+        index_seconds = time.perf_counter() - started
+
+        results = {"products": options.products,
+                   "seed_seconds": round(seed_seconds, 1),
+                   "index_seconds": round(index_seconds, 1),
+                   "queries": {}}
+        for query in QUERIES:
+            results["queries"][query] = {
+                "fts5_ms": timed(lambda: search.search_ids(query, options.limit),
+                                 options.repeat),
+                "icontains_ms": timed(lambda: list(search.icontains_queryset(query)
+                                                   .values_list("pk", flat=True)
+                                                   [:options.limit]),
+                                      options.repeat),
+                "icontains_count_ms": timed(lambda: search.icontains_queryset(query).count(),
+                                            options.repeat),
+            }
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
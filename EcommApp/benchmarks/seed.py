@@ -0,0 +1,110 @@
+#!/usr/bin/python3
+"""Seeding of scratch databases for the benchmarks
+
+Rows are written with bulk_create, so the denormalized columns (category
+product counts, product rating aggregates) and the search table are
+rebuilt afterwards with the repo's own repair commands.
+"""
+
+import io
+import random
+from itertools import islice
+from django.core.management import call_command
+
+COMMON = ("lamp desk chair oak brass steel linen wool cotton shade table "
+          "sofa rug mirror clock vase frame bench stool shelf basket "
+          "candle pillow blanket kettle mug plate bowl glass").split()
+SYLLABLES = "ka lo mi ne ru sa ti vo pe da zu ri mo na le".split()
+# A long tail of rarer words so searches are selective, like a real catalog
+_random = random.Random(0)
+WORDS = COMMON + ["".join(_random.choices(SYLLABLES, k=3)) for _ in range(3000)]
+
+SCALES = {
+    "small": {"users": 50, "categories": 10, "products": 2_000,
+              "reviews": 5_000, "wishlist_items": 2_000},
+    "medium": {"users": 500, "categories": 50, "products": 50_000,
+               "reviews": 100_000, "wishlist_items": 50_000},
+    "large": {"users": 5_000, "categories": 200, "products": 1_000_000,
+              "reviews": 2_000_000, "wishlist_items": 1_000_000},
+}
+
+
+def _batches(total, batch_size):
+    """Yields (start, count) pairs covering ``total`` rows"""
+    for start in range(0, total, batch_size):
+        yield start, min(batch_size, total - start)
+
+
+def seed(users=1, categories=1, products=0, reviews=0, wishlist_items=0,
+         batch_size=10_000, seed_value=0):
+    """Fills the database and returns the created ids by model
+
+    Reviews and wishlist items get distinct (product, user) pairs as
+    long as there are enough products and users.
+
+    args:
+        users, categories, products, reviews, wishlist_items: int, row counts
+        batch_size: int, rows per bulk_create
+        seed_value: int, seed of the random generator
+    """
+    from product.models import Category, Product, Review, Wishlist, WishlistItem
+    from user.models import User, UserProfile
+
+    rng = random.Random(seed_value)
+    # Passwords are left unusable, hashing them would dominate seeding time
+    user_rows = [User(email="user{}@example.com".format(index),
+                      username="user{}".format(index),
+                      password="!")
+                 for index in range(users)]
+    User.objects.bulk_create(user_rows, batch_size=batch_size)
+    UserProfile.objects.bulk_create([UserProfile(user=user) for user in user_rows],
+                                    batch_size=batch_size)
+    category_rows = Category.objects.bulk_create(
+        [Category(name="{} {}".format(rng.choice(COMMON), index)) for index in range(categories)])
+
+    product_ids = []
+    for _, count in _batches(products, batch_size):
+        created = Product.objects.bulk_create([
+            Product(name=" ".join(rng.sample(WORDS, 3)),
+                    description=" ".join(rng.choices(WORDS, k=12)),
+                    price=rng.randint(100, 50_000) / 100,
+                    quantity=rng.randint(1, 100),
+                    user=rng.choice(user_rows),
+                    category=rng.choice(category_rows))
+            for _ in range(count)])
+        product_ids.extend(product.pk for product in created)
+
+    if not product_ids:
+        reviews = wishlist_items = 0
+    for start, count in _batches(reviews, batch_size):
+        Review.objects.bulk_create([
+            Review(product_id=product_ids[index % len(product_ids)],
+                   user=user_rows[(index // len(product_ids)) % len(user_rows)],
+                   rating=rng.randint(1, 5),
+                   review="benchmark review")
+            for index in range(start, start + count)])
+
+    wishlists = Wishlist.objects.bulk_create([Wishlist(user=user) for user in user_rows],
+                                             batch_size=batch_size)
+
+    def wishlist_rows():
+        # Each user saves products from one neighbourhood of the catalog,
+        # so products co-occur in wishlists the way related items do
+        per_user, extra = divmod(wishlist_items, len(wishlists))
+        for position, wishlist in enumerate(wishlists):
+            count = min(per_user + (position < extra), len(product_ids))
+            window = min(len(product_ids), max(count * 20, 100))
+            start = rng.randrange(len(product_ids) - window + 1)
+            for index in rng.sample(range(start, start + window), count):
+                yield WishlistItem(wishlist=wishlist, product_id=product_ids[index])
+
+    rows = wishlist_rows()
+    while batch := list(islice(rows, batch_size)):
+        WishlistItem.objects.bulk_create(batch)
+
+    for command in ('reconcile_category_counts', 'recompute_ratings', 'rebuild_search_index',
+                    'rebuild_leaderboards'):
+        call_command(command, stdout=io.StringIO())
+    return {"users": [user.pk for user in user_rows],
+            "categories": [category.pk for category in category_rows],
+            "products": product_ids}
@@ -0,0 +1,82 @@
+#!/usr/bin/python3
+"""Per-row cost of product list serialization
+
+Seeds a scratch SQLite database and times, for the same rows, the
+ProductSerializer path (model instances through the DRF field pipeline)
+and the ProductListSerializer fast path (named rows formatted by plain
+functions). Fetching, serializing and JSON encoding are timed
+separately and reported in microseconds per row, with the best of
+``--repeat`` runs.
+
+usage:
+    python -m benchmarks.serialization --products 20000 --page 100
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from benchmarks.environment import configure
+
+
+def best(function, repeat):
+    """Returns the result of the fastest of ``repeat`` calls and its time"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - started)
+    return result, min(timings)
+
+
+def measure(fetch, serialize, rows_count, repeat):
+    """Times the three stages of one path, in microseconds per row"""
+    from django.core.serializers.json import DjangoJSONEncoder
+
+    rows, fetch_time = best(fetch, repeat)
+    data, serialize_time = best(lambda: serialize(rows), repeat)
+    body, encode_time = best(lambda: json.dumps(data, cls=DjangoJSONEncoder), repeat)
+    per_row = 1_000_000 / rows_count
+    return body, {"fetch_us": round(fetch_time * per_row, 2),
+                  "serialize_us": round(serialize_time * per_row, 2),
+                  "encode_us": round(encode_time * per_row, 2),
+                  "total_us": round((fetch_time + serialize_time + encode_time) * per_row, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--products", type=int, default=20_000)
+    parser.add_argument("--page", type=int, default=100,
+                        help="rows per list page, the whole catalog is also timed")
+    parser.add_argument("--repeat", type=int, default=5)
+    options = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        configure(os.path.join(directory, "bench.sqlite3"))
+        from benchmarks.seed import seed
+        from product.models import Product
+        from product.serializer import ProductListSerializer, ProductSerializer
+        seed(products=options.products)
+
+        results = {}
+        for name, size in (("page", options.page), ("catalog", options.products)):
+            products = Product.objects.order_by("created_at", "id")[:size]
+            slow_body, slow = measure(
+                lambda: list(ProductSerializer.setup_eager_loading(products)),
+                lambda rows: ProductSerializer(rows, many=True).data,
+                size, options.repeat)
+            fast_body, fast = measure(
+                lambda: list(ProductListSerializer.setup_queryset(products)),
+                ProductListSerializer.many,
+                size, options.repeat)
+            assert fast_body == slow_body, "fast path output differs"
+            results[name] = {"rows": size, "ProductSerializer": slow,
+                             "ProductListSerializer": fast,
+                             "speedup": round(slow["total_us"] / fast["total_us"], 2)}
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
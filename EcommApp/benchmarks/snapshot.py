@@ -0,0 +1,81 @@
+#!/usr/bin/python3
+"""Anonymous catalog browsing from the database and from the snapshot
+
+Seeds a scratch SQLite database, builds the catalog snapshot
+(product.snapshot) and drives the same anonymous list pages, spread over
+the whole catalog, and product lookups through Django's test client
+three ways: the database with ProductSerializer, the database with the
+ProductListSerializer fast path, and the snapshot. Reports the snapshot
+build time and size with the metrics of benchmarks.suite.
+
+usage:
+    python -m benchmarks.snapshot --products 100000 --requests 2000
+"""
+
+import argparse
+import io
+import json
+import os
+import tempfile
+import time
+
+from benchmarks.environment import configure
+from benchmarks.suite import measure
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--products", type=int, default=100_000)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--warmup", type=int, default=200)
+    options = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        configure(os.path.join(directory, "bench.sqlite3"), ALLOWED_HOSTS=["*"])
+        from django.conf import settings
+        from django.core.management import call_command
+        from django.test import Client
+        from django.urls import reverse
+        from benchmarks.seed import seed
+        ids = seed(users=50, categories=20, products=options.products)
+
+        path = os.path.join(directory, "catalog.snapshot")
+        started = time.perf_counter()
+        call_command("build_catalog_snapshot", path=path, stdout=io.StringIO())
+        build_seconds = time.perf_counter() - started
+        size = os.path.getsize(path)
+
+        # every hundredth page of the catalog, walked once up front
+        client = Client()
+        url = reverse("list_create")
+        pages, cursor, number = [], None, 0
+        while True:
+            params = {"limit": 20, "cursor": cursor} if cursor else {"limit": 20}
+            if number % 100 == 0:
+                pages.append((url, params))
+            cursor = client.get(url, params).json()["next"]
+            number += 1
+            if cursor is None:
+                break
+        step = max(1, len(ids["products"]) // 500)
+        lookups = [(reverse("retrieve_update_delete", args=[pk]), None)
+                   for pk in ids["products"][::step]]
+
+        results = {}
+        for name, fast_list, snapshot in (("database", False, None),
+                                          ("database_fast_list", True, None),
+                                          ("snapshot", False, path)):
+            settings.PRODUCT_FAST_LIST = fast_list
+            settings.CATALOG_SNAPSHOT_PATH = snapshot
+            results[name] = {
+                endpoint: measure(client, requests, options.requests, options.warmup)
+                for endpoint, requests in (("list", pages), ("detail", lookups))}
+
+    print(json.dumps({"products": options.products,
+                      "build_seconds": round(build_seconds, 2),
+                      "snapshot_mb": round(size / 2 ** 20, 1),
+                      "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+#!/usr/bin/python3
+"""Stress benchmark of stock reservations on one hot product
+
+Many threads buy one unit of a single product at a time until its stock
+runs out, on a scratch SQLite database in the production profile
+(EcommApp.database). Two strategies are run in child processes:
+``reserve`` (product.reservations, a conditional UPDATE per item) and
+``read_modify_write``, which loads the product, checks the quantity and
+saves it back, the way updates went through ProductSerializer before.
+Each run reports purchases per second, latency percentiles and how many
+units were sold beyond the stock.
+
+usage:
+    python -m benchmarks.stock --threads 32 --stock 2000
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.concurrency import percentile
+from benchmarks.environment import configure
+
+
+def child(options):
+    """Runs one strategy against the seeded database"""
+    os.environ['ECOMM_DATABASE_PROFILE'] = 'production'
+    configure(options.database)
+
+    from django.db import OperationalError, connections
+    from product.models import Product, Reservation
+    from product.reservations import OutOfStock, reserve
+    from user.models import User
+
+    user = User.objects.order_by('created_at').first()
+    product = Product.objects.order_by('created_at').first()
+    Product.objects.filter(pk=product.pk).update(quantity=options.stock)
+
+    def read_modify_write():
+        # autocommit, like the request handling of ProductSerializer.update
+        current = Product.objects.get(pk=product.pk)
+        if current.quantity < 1:
+            raise OutOfStock(product.pk)
+        current.quantity -= 1
+        current.save(update_fields=['quantity'])
+        Reservation.objects.create(user=user, expires_at=current.updated_at)
+
+    def buy_reserved():
+        reserve(user.pk, [(product.pk, 1)])
+
+    buy = read_modify_write if options.strategy == 'read_modify_write' else buy_reserved
+    lock = threading.Lock()
+    latencies, errors = [], [0]
+
+    def worker(_):
+        local, failed = [], 0
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    buy()
+                except OutOfStock:
+                    break
+                except OperationalError:
+                    failed += 1
+                    continue
+                local.append(time.perf_counter() - started)
+        finally:
+            connections.close_all()
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    with ThreadPoolExecutor(options.threads) as pool:
+        started = time.perf_counter()
+        list(pool.map(worker, range(options.threads)))
+        elapsed = time.perf_counter() - started
+
+    print(json.dumps({"purchases": len(latencies),
+                      "purchases_per_second": round(len(latencies) / elapsed, 1),
+                      "p50_ms": percentile(latencies, 0.50),
+                      "p99_ms": percentile(latencies, 0.99),
+                      "oversold": len(latencies) - options.stock,
+                      "lock_errors": errors[0]}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--stock", type=int, default=2000)
+    parser.add_argument("--strategy", help=argparse.SUPPRESS)
+    parser.add_argument("--database", help=argparse.SUPPRESS)
+    options = parser.parse_args()
+
+    if options.strategy:
+        return child(options)
+
+    with tempfile.TemporaryDirectory() as directory:
+        seeded = os.path.join(directory, "seed.sqlite3")
+        configure(seeded)
+        from benchmarks.seed import seed
+        seed(products=1)
+        results = {}
+        for strategy in ("reserve", "read_modify_write"):
+            database = os.path.join(directory, "{}.sqlite3".format(strategy))
+            shutil.copyfile(seeded, database)
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.stock", "--strategy", strategy,
+                 "--database", database, "--threads", str(options.threads),
+                 "--stock", str(options.stock)],
+                check=True, capture_output=True, text=True).stdout
+            results[strategy] = json.loads(output)
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+#!/usr/bin/python3
+"""Reproducible performance benchmark suite for the API
+
+Seeds a scratch SQLite database at the requested scale, drives the real
+URL routes through Django's test client and reports, per endpoint, the
+throughput, latency percentiles and database queries per request. The
+results are written as JSON together with the commit they were measured
+on, and two result files can be compared to spot regressions.
+
+usage:
+    python -m benchmarks.suite run --scale small --output results.json
+    python -m benchmarks.suite run --products 200000 --reviews 0
+    python -m benchmarks.suite compare before.json after.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, UTC
+
+from benchmarks.environment import configure
+from benchmarks.seed import SCALES
+
+METRICS = ("requests_per_second", "p50_ms", "p90_ms", "p99_ms", "queries_per_request")
+# Metrics where a larger value is a regression
+HIGHER_IS_WORSE = {"p50_ms", "p90_ms", "p99_ms", "queries_per_request"}
+
+
+# Seeded rows the endpoints cannot be driven without
+REQUIRED_ROWS = ("users", "categories", "products")
+
+
+def endpoints(ids):
+    """Returns the endpoints to drive as {name: [(url, params), ...]}
+
+    Each endpoint cycles through its list of requests.
+
+    args:
+        ids: dict, ids returned by benchmarks.seed.seed
+    """
+    from django.urls import reverse
+    from product.models import Product
+    from product.pagination import encode_cursor
+
+    products = ids["products"]
+    middle = Product.objects.order_by("created_at", "id")[len(products) // 2]
+    return {
+        "list_create": [(reverse("list_create"), {"limit": 20})],
+        "list_create_deep_page": [(reverse("list_create"),
+                                   {"limit": 20, "cursor": encode_cursor(middle)})],
+        "retrieve_update_delete": [(reverse("retrieve_update_delete", args=[pk]), {})
+                                   for pk in products[:200]],
+        "list_create_filtered": [(reverse("list_create"),
+                                  {"limit": 20, "category": str(category), "in_stock": "1",
+                                   "min_price": "10", "max_price": "500"})
+                                 for category in ids["categories"][:20]],
+        "facets": [(reverse("facets"), {})],
+        "category_list": [(reverse("category_list"), {"limit": 50})],
+        "search": [(reverse("search"), {"q": query})
+                   for query in ("lamp", "brass lamp", "oak shelf", "vas")],
+    }
+
+
+def percentile(samples, value):
+    return samples[min(len(samples) - 1, int(len(samples) * value))]
+
+
+def measure(client, requests, count, warmup):
+    """Drives one endpoint and returns its metrics
+
+    args:
+        client: django.test.Client
+        requests: list, (url, params) pairs cycled through
+        count: int, measured requests
+        warmup: int, requests sent before measuring
+    """
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    for index in range(warmup):
+        url, params = requests[index % len(requests)]
+        client.get(url, params)
+
+    latencies, queries = [], 0
+    started = time.perf_counter()
+    for index in range(count):
+        url, params = requests[index % len(requests)]
+        with CaptureQueriesContext(connection) as captured:
+            request_started = time.perf_counter()
+            response = client.get(url, params)
+            latencies.append(time.perf_counter() - request_started)
+        if response.status_code != 200:
+            raise RuntimeError("{} returned {}".format(url, response.status_code))
+        queries += len(captured)
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {"requests": count,
+            "requests_per_second": round(count / elapsed, 1),
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+            "p90_ms": round(percentile(latencies, 0.90) * 1000, 3),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+            "queries_per_request": round(queries / count, 2)}
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(options):
+    scale = dict(SCALES[options.scale])
+    for name in scale:
+        value = getattr(options, name)
+        if value is not None:
+            scale[name] = value
+
+    with tempfile.TemporaryDirectory() as directory:
+        configure(os.path.join(directory, "bench.sqlite3"), ALLOWED_HOSTS=["*"])
+        import django
+        from django.test import Client
+        from benchmarks.seed import seed
+
+        started = time.perf_counter()
+        ids = seed(seed_value=options.seed, **scale)
+        seed_seconds = time.perf_counter() - started
+
+        client = Client()
+        only = set(options.endpoint or [])
+        results = {name: measure(client, requests, options.requests, options.warmup)
+                   for name, requests in endpoints(ids).items()
+                   if not only or name in only}
+
+    report = {
+        "commit": git_commit(),
+        "created_at": datetime.now(UTC).isoformat(),
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "scale": scale,
+        "seed_seconds": round(seed_seconds, 1),
+        "endpoints": results,
+    }
+    output = json.dumps(report, indent=2)
+    if options.output:
+        with open(options.output, "w") as file:
+            file.write(output + "\n")
+    print(output)
+
+
+def compare(options):
+    """Prints the change of every metric and fails on regressions"""
+    with open(options.before) as file:
+        before = json.load(file)
+    with open(options.after) as file:
+        after = json.load(file)
+
+    regressions = 0
+    for name, metrics in after["endpoints"].items():
+        if name not in before["endpoints"]:
+            continue
+        for metric in METRICS:
+            old, new = before["endpoints"][name][metric], metrics[metric]
+            change = (new - old) / old * 100 if old else 0.0
+            worse = change > 0 if metric in HIGHER_IS_WORSE else change < 0
+            flag = ""
+            if worse and abs(change) > options.threshold:
+                flag = "  REGRESSION"
+                regressions += 1
+            print("{:<26} {:<22} {:>12} -> {:<12} {:+7.1f}%{}".format(
+                name, metric, old, new, change, flag))
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="seed a database and run the benchmarks")
+    run_parser.add_argument("--scale", choices=SCALES, default="small")
+    for name in SCALES["small"]:
+        run_parser.add_argument("--" + name.replace("_", "-"), dest=name, type=int,
+                                help="override the {} count of the scale".format(name))
+    run_parser.add_argument("--requests", type=int, default=200,
+                            help="measured requests per endpoint")
+    run_parser.add_argument("--warmup", type=int, default=20)
+    run_parser.add_argument("--endpoint", action="append",
+                            help="only run this endpoint, may be repeated")
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--output", help="file to write the JSON results to")
+
+    compare_parser = commands.add_parser("compare", help="diff two result files")
+    compare_parser.add_argument("before")
+    compare_parser.add_argument("after")
+    compare_parser.add_argument("--threshold", type=float, default=10.0,
+                                help="percent change reported as a regression")
+
+    options = parser.parse_args()
+    if options.command == "run":
+        for name in REQUIRED_ROWS:
+            if getattr(options, name) is not None and getattr(options, name) < 1:
+                run_parser.error("--{} must be at least 1, the endpoints read "
+                                 "seeded {}".format(name, name))
+        return run(options)
+    return compare(options)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+#!/usr/bin/python3
+"""Benchmark of uuid4 against time-ordered uuid7 primary keys on SQLite
+
+Inserts the same number of rows into two tables shaped like the Basemodel
+tables (Django stores a UUIDField as ``char(32)`` on SQLite) and reports
+the insert rate and the size of the primary key index for each.
+
+usage:
+    python -m benchmarks.uuid_keys --rows 2000000
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, UTC
+from uuid import uuid4
+
+from shared_model.ids import uuid7
+
+SCHEMA = """
+CREATE TABLE bench (
+    id char(32) NOT NULL PRIMARY KEY,
+    created_at datetime NOT NULL,
+    name varchar(150) NOT NULL
+)
+"""
+
+
+def index_size(connection):
+    """Returns the size in bytes of the primary key index"""
+    try:
+        row = connection.execute(
+            "SELECT SUM(pgsize) FROM dbstat WHERE name = 'sqlite_autoindex_bench_1'"
+        ).fetchone()
+        return row[0]
+    except sqlite3.OperationalError:
+        # SQLite built without the dbstat virtual table
+        return None
+
+
+def run(generator, rows, batch_size):
+    """Inserts ``rows`` rows keyed by ``generator`` into a fresh database
+
+    args:
+        generator: callable returning a UUID
+        rows: int, number of rows to insert
+        batch_size: int, rows per transaction
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bench.sqlite3")
+        connection = sqlite3.connect(path, isolation_level=None)
+        connection.execute(SCHEMA)
+        started = time.perf_counter()
+        inserted = 0
+        while inserted < rows:
+            count = min(batch_size, rows - inserted)
+            now = datetime.now(UTC).isoformat()
+            batch = [(generator().hex, now, "product") for _ in range(count)]
+            connection.execute("BEGIN")
+            connection.executemany(
+                "INSERT INTO bench (id, created_at, name) VALUES (?, ?, ?)", batch)
+            connection.execute("COMMIT")
+            inserted += count
+        elapsed = time.perf_counter() - started
+        result = {
+            "rows": rows,
+            "seconds": round(elapsed, 3),
+            "rows_per_second": round(rows / elapsed),
+            "index_bytes": index_size(connection),
+            "file_bytes": os.path.getsize(path),
+        }
+        connection.close()
+        return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    options = parser.parse_args()
+
+    results = {name: run(generator, options.rows, options.batch_size)
+               for name, generator in (("uuid4", uuid4), ("uuid7", uuid7))}
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
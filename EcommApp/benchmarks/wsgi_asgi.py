@@ -0,0 +1,155 @@
+#!/usr/bin/python3
+"""Load benchmark of the product API under WSGI and ASGI
+
+Seeds a scratch SQLite database, then drives the product list and
+detail routes in two child processes: the sync views through the WSGI
+handler from a thread pool, and the async views (PRODUCT_ASYNC_VIEWS)
+through the ASGI handler from an event loop. Requests are handed to the
+handlers in-process, so the numbers measure Django and the views rather
+than a particular server.
+
+usage:
+    python -m benchmarks.wsgi_asgi --requests 2000 --concurrency 32
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from wsgiref.util import setup_testing_defaults
+
+from benchmarks.environment import configure
+
+SETTINGS = {'ALLOWED_HOSTS': ['*']}
+
+
+def summary(latencies, elapsed):
+    """Returns throughput and latency percentiles in milliseconds"""
+    latencies = sorted(latencies)
+
+    def percentile(value):
+        return round(latencies[min(len(latencies) - 1, int(len(latencies) * value))] * 1000, 3)
+
+    return {"requests": len(latencies),
+            "requests_per_second": round(len(latencies) / elapsed, 1),
+            "p50_ms": percentile(0.50),
+            "p99_ms": percentile(0.99)}
+
+
+def run_wsgi(targets, concurrency):
+    from django.core.wsgi import get_wsgi_application
+    application = get_wsgi_application()
+
+    def call(target):
+        path, query = target
+        environ = {'PATH_INFO': path, 'QUERY_STRING': query, 'REQUEST_METHOD': 'GET'}
+        setup_testing_defaults(environ)
+        statuses = []
+        started = time.perf_counter()
+        body = application(environ, lambda status, headers: statuses.append(status))
+        b"".join(body)
+        assert statuses[0].startswith("200"), statuses[0]
+        return time.perf_counter() - started
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        started = time.perf_counter()
+        latencies = list(pool.map(call, targets))
+        return summary(latencies, time.perf_counter() - started)
+
+
+def run_asgi(targets, concurrency):
+    from django.core.asgi import get_asgi_application
+    application = get_asgi_application()
+
+    async def call(target):
+        path, query = target
+        scope = {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+                 'method': 'GET', 'scheme': 'http', 'path': path,
+                 'raw_path': path.encode(), 'query_string': query.encode(),
+                 'root_path': '', 'headers': [(b'host', b'localhost')],
+                 'client': ('127.0.0.1', 1), 'server': ('localhost', 80)}
+        sent_body = False
+        statuses = []
+
+        async def receive():
+            nonlocal sent_body
+            if not sent_body:
+                sent_body = True
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            # the client never disconnects, Django cancels this wait
+            await asyncio.Event().wait()
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                statuses.append(message['status'])
+
+        started = time.perf_counter()
+        await application(scope, receive, send)
+        assert statuses[0] == 200, statuses[0]
+        return time.perf_counter() - started
+
+    async def main():
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def limited(target):
+            async with semaphore:
+                return await call(target)
+
+        started = time.perf_counter()
+        latencies = await asyncio.gather(*(limited(target) for target in targets))
+        return summary(latencies, time.perf_counter() - started)
+
+    return asyncio.run(main())
+
+
+def child(options):
+    """Runs one server mode against the seeded database"""
+    configure(options.database, PRODUCT_ASYNC_VIEWS=options.mode == 'asgi', **SETTINGS)
+    ids = json.loads(options.ids)
+    endpoints = {
+        "list": [("/products", "limit=20")] * options.requests,
+        "detail": [("/products/{}".format(ids[index % len(ids)]), "")
+                   for index in range(options.requests)],
+    }
+    run = run_asgi if options.mode == 'asgi' else run_wsgi
+    print(json.dumps({name: run(targets, options.concurrency)
+                      for name, targets in endpoints.items()}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--products", type=int, default=10_000)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--mode", choices=("wsgi", "asgi"), help=argparse.SUPPRESS)
+    parser.add_argument("--database", help=argparse.SUPPRESS)
+    parser.add_argument("--ids", help=argparse.SUPPRESS)
+    options = parser.parse_args()
+
+    if options.mode:
+        return child(options)
+
+    with tempfile.TemporaryDirectory() as directory:
+        database = os.path.join(directory, "bench.sqlite3")
+        configure(database, **SETTINGS)
+        from benchmarks.seed import seed
+        ids = [str(pk) for pk in seed(products=options.products)["products"][:100]]
+        results = {}
+        for mode in ("wsgi", "asgi"):
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.wsgi_asgi", "--mode", mode,
+                 "--database", database, "--ids", json.dumps(ids),
+                 "--requests", str(options.requests),
+                 "--concurrency", str(options.concurrency)],
+                check=True, capture_output=True, text=True).stdout
+            results[mode] = json.loads(output)
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
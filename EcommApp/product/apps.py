@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class ProductConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'product'
+
+    def ready(self):
+        """
+        Method to import signal handlers
+        """
+        import product.signal
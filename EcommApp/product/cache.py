@@ -0,0 +1,170 @@
+"""
+Read-through cache for serialized product payloads
+
+Entries are stamped with the version tokens (see shared_model.cache) of
+the product, its category and its seller, so saving any of those rows
+turns the entry into a miss. Entries are served until
+``PRODUCT_CACHE_TIMEOUT`` and may then be served stale for
+``PRODUCT_CACHE_GRACE`` seconds while a single caller, holding a short
+lock, reloads them. Callers that find neither an entry nor the lock wait
+for that caller instead of all hitting the database at once.
+
+Rating summaries are cached the same way, stamped with the product's
+token and its ``ratings`` token, which is replaced whenever a review of
+the product changes.
+"""
+import asyncio
+import time
+from django.conf import settings
+from shared_model.cache import (acurrent_versions,
+                                current_versions,
+                                get_async_cache,
+                                get_cache,
+                                version_key,
+                                )
+
+LOCK_TIMEOUT = 10
+WAIT_INTERVAL = 0.05
+
+
+def detail_key(pk):
+    return "product:detail:{}".format(pk)
+
+
+def ratings_key(pk):
+    return "product:ratings:{}".format(pk)
+
+
+def _is_current(entry):
+    return current_versions(list(entry['versions'])) == entry['versions']
+
+
+async def _ais_current(entry):
+    return await acurrent_versions(list(entry['versions'])) == entry['versions']
+
+
+def _entry(payload, versions):
+    """
+    Returns the cache entry for a payload and its cache timeout
+    """
+    timeout = getattr(settings, 'PRODUCT_CACHE_TIMEOUT', 300)
+    grace = getattr(settings, 'PRODUCT_CACHE_GRACE', 30)
+    return ({'payload': payload,
+             'expires': time.time() + timeout,
+             'versions': versions},
+            timeout + grace)
+
+
+def _load(cache, pk, load):
+    """
+    Loads the payload and stores it with the versions read before loading
+
+    ``load`` returns a (payload, dependencies) pair where dependencies is
+    a list of (model_name, pk) the payload was built from.
+    """
+    versions = current_versions([version_key('product', pk)])
+    payload, dependencies = load()
+    versions.update(current_versions([version_key(name, dependency)
+                                      for name, dependency in dependencies]))
+    cache.set(detail_key(pk), *_entry(payload, versions))
+    return payload
+
+
+async def _aload(cache, pk, load):
+    """
+    Async version of _load, ``load`` is a coroutine function
+    """
+    versions = await acurrent_versions([version_key('product', pk)])
+    payload, dependencies = await load()
+    versions.update(await acurrent_versions([version_key(name, dependency)
+                                             for name, dependency in dependencies]))
+    await cache.aset(detail_key(pk), *_entry(payload, versions))
+    return payload
+
+
+def get_product_payload(pk, load):
+    """
+    Returns the cached payload of a product, loading it on a miss
+
+    Exceptions raised by ``load`` (e.g. DoesNotExist) propagate and
+    nothing is cached.
+
+    Args:
+        pk (str): primary key of the product
+        load (callable): returns (payload, dependencies), see _load
+    """
+    cache = get_cache()
+    key = detail_key(pk)
+    lock = key + ":lock"
+
+    entry = cache.get(key)
+    if entry is not None and _is_current(entry):
+        if entry['expires'] > time.time() or not cache.add(lock, 1, LOCK_TIMEOUT):
+            return entry['payload']
+    elif not cache.add(lock, 1, LOCK_TIMEOUT):
+        deadline = time.monotonic() + LOCK_TIMEOUT
+        while time.monotonic() < deadline:
+            time.sleep(WAIT_INTERVAL)
+            entry = cache.get(key)
+            if entry is not None and _is_current(entry):
+                return entry['payload']
+            if cache.add(lock, 1, LOCK_TIMEOUT):
+                break
+        else:
+            return load()[0]
+
+    try:
+        return _load(cache, pk, load)
+    finally:
+        cache.delete(lock)
+
+
+async def aget_product_payload(pk, load):
+    """
+    Async version of get_product_payload, ``load`` is a coroutine function
+    """
+    cache = get_async_cache()
+    key = detail_key(pk)
+    lock = key + ":lock"
+
+    entry = await cache.aget(key)
+    if entry is not None and await _ais_current(entry):
+        if entry['expires'] > time.time() or not await cache.aadd(lock, 1, LOCK_TIMEOUT):
+            return entry['payload']
+    elif not await cache.aadd(lock, 1, LOCK_TIMEOUT):
+        deadline = time.monotonic() + LOCK_TIMEOUT
+        while time.monotonic() < deadline:
+            await asyncio.sleep(WAIT_INTERVAL)
+            entry = await cache.aget(key)
+            if entry is not None and await _ais_current(entry):
+                return entry['payload']
+            if await cache.aadd(lock, 1, LOCK_TIMEOUT):
+                break
+        else:
+            return (await load())[0]
+
+    try:
+        return await _aload(cache, pk, load)
+    finally:
+        await cache.adelete(lock)
+
+
+def get_rating_summary(pk, load):
+    """
+    Returns the cached rating summary of a product, loading it on a miss
+
+    Args:
+        pk (UUID): primary key of the product
+        load (callable): returns the summary, may raise DoesNotExist
+    """
+    cache = get_cache()
+    key = ratings_key(pk)
+    entry = cache.get(key)
+    if entry is not None and _is_current(entry):
+        return entry['payload']
+    versions = current_versions([version_key('product', pk), version_key('ratings', pk)])
+    summary = load()
+    cache.set(key,
+              {'payload': summary, 'versions': versions},
+              getattr(settings, 'PRODUCT_CACHE_TIMEOUT', 300))
+    return summary
@@ -0,0 +1,125 @@
+"""
+Conditional GET support for the catalog
+
+Responses carry an ETag and a Last-Modified header derived from the
+``updated_at`` of the rows they render:
+
+* a product detail from its cached payload
+* a list page from the fetched rows (count, ids and the ``updated_at`` of
+  each product and of its seller, whose email the page renders), plus
+  the wishlisted flags of the requesting user
+* a streamed export from one ``max(updated_at)``/``count`` aggregate of
+  the filtered catalog and of its sellers
+
+The validators are computed before serialization, so a matching
+``If-None-Match`` (or ``If-Modified-Since``) is answered with a 304
+without building the body.
+"""
+import hashlib
+from datetime import datetime
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+
+
+def make_etag(*parts):
+    """
+    Returns a strong ETag built from the repr of ``parts``
+    """
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=16).hexdigest()
+    return '"{}"'.format(digest)
+
+
+def payload_validators(payload):
+    """
+    Returns the (etag, last_modified) of a serialized product
+    """
+    return make_etag(payload), payload['updated_at']
+
+
+def _row_modified(row):
+    """
+    Returns when a listed product last changed, counting changes to its
+    seller, whose email the row renders
+    """
+    # list rows and snapshot rows carry the seller's updated_at, model
+    # instances have the seller loaded
+    seller = getattr(row, 'user__updated_at', None)
+    if seller is None:
+        seller = row.user.updated_at
+    return max(row.updated_at, seller)
+
+
+def page_validators(page, wishlisted=None):
+    """
+    Returns the (etag, last_modified) of a page of products
+
+    Args:
+        page (Page): page returned by product.pagination.paginate
+        wishlisted (set): wishlisted ids of the requesting user, if any
+    """
+    modified = [(row.id, _row_modified(row)) for row in page.items]
+    last_modified = max((changed for _, changed in modified), default=None)
+    etag = make_etag(len(page.items), last_modified, modified, page.next, page.previous,
+                     sorted(wishlisted) if wishlisted is not None else None)
+    return etag, last_modified
+
+
+def _aggregate_validators(totals):
+    last_modified = max(filter(None, (totals['last_modified'], totals['seller_modified'])),
+                        default=None)
+    return make_etag(totals['count'], last_modified), last_modified
+
+
+def queryset_validators(queryset):
+    """
+    Returns the (etag, last_modified) of a whole product listing with one
+    aggregate query
+    """
+    return _aggregate_validators(queryset.order_by().aggregate(
+        count=Count('id'), last_modified=Max('updated_at'),
+        seller_modified=Max('user__updated_at')))
+
+
+async def aqueryset_validators(queryset):
+    """
+    Async version of queryset_validators
+    """
+    return _aggregate_validators(await queryset.order_by().aaggregate(
+        count=Count('id'), last_modified=Max('updated_at'),
+        seller_modified=Max('user__updated_at')))
+
+
+def _timestamp(last_modified):
+    if last_modified is None:
+        return None
+    if isinstance(last_modified, str):
+        # serialized payloads hold ISO 8601 strings
+        last_modified = datetime.fromisoformat(last_modified.replace('Z', '+00:00'))
+    return int(last_modified.timestamp())
+
+
+def set_validators(response, etag, last_modified):
+    """
+    Sets the ETag and Last-Modified headers of a response
+    """
+    response.headers['ETag'] = etag
+    timestamp = _timestamp(last_modified)
+    if timestamp is not None:
+        response.headers['Last-Modified'] = http_date(timestamp)
+    # lists carry the wishlisted flags of the authenticated user
+    patch_vary_headers(response, ('Authorization',))
+    return response
+
+
+def conditional_response(request, etag, last_modified):
+    """
+    Returns the 304 (or, for a failed If-Match, 412) response called for
+    by the request preconditions, None when the full response is due
+    """
+    response = get_conditional_response(request,
+                                        etag=etag,
+                                        last_modified=_timestamp(last_modified))
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
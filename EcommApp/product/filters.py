@@ -0,0 +1,144 @@
+"""
+Product listing filters and facet counts
+
+Filters are read from the query string:
+
+* ``category``: category id, may be repeated
+* ``min_price`` / ``max_price``: inclusive price range
+* ``in_stock=1``: only products with a positive quantity
+* ``min_rating``: minimum average rating, between 1 and 5
+
+The composite indexes on Product are laid out for these filters
+followed by the ``(created_at, id)`` listing order.
+"""
+from decimal import Decimal, InvalidOperation
+from uuid import UUID
+from django.db.models import (Case,
+                              Count,
+                              ExpressionWrapper,
+                              F,
+                              FloatField,
+                              IntegerField,
+                              Value,
+                              When,
+                              )
+
+# Lower bounds of the price facet buckets, the last bucket is open ended
+PRICE_BUCKETS = (Decimal(0), Decimal(10), Decimal(25), Decimal(50),
+                 Decimal(100), Decimal(250), Decimal(500), Decimal(1000))
+
+
+# Query parameters read by filter_products
+FILTER_PARAMS = ('category', 'min_price', 'max_price', 'in_stock', 'min_rating')
+
+
+class FilterError(ValueError):
+    """
+    Raised when the filter query parameters are invalid
+    """
+
+
+def _decimal(params, name):
+    value = params.get(name)
+    if value in (None, ""):
+        return None
+    try:
+        value = Decimal(value)
+    except InvalidOperation as exc:
+        raise FilterError("{} must be a number".format(name)) from exc
+    if not value.is_finite() or value < 0:
+        raise FilterError("{} must not be negative".format(name))
+    return value
+
+
+def has_filters(params):
+    """
+    Returns whether the query parameters ask for any filter
+    """
+    return any(params.get(name) not in (None, '') for name in FILTER_PARAMS)
+
+
+def filter_products(queryset, params):
+    """
+    Applies the filters given in the query parameters to a product
+    queryset
+
+    Args:
+        queryset (QuerySet): product queryset
+        params (QueryDict): request query parameters
+    """
+    categories = params.getlist('category')
+    if categories:
+        try:
+            queryset = queryset.filter(category_id__in=[UUID(pk) for pk in categories])
+        except ValueError as exc:
+            raise FilterError("category must be a category id") from exc
+
+    min_price = _decimal(params, 'min_price')
+    max_price = _decimal(params, 'max_price')
+    if min_price is not None:
+        queryset = queryset.filter(price__gte=min_price)
+    if max_price is not None:
+        queryset = queryset.filter(price__lte=max_price)
+
+    if params.get('in_stock') in ('1', 'true'):
+        queryset = queryset.filter(quantity__gt=0)
+
+    min_rating = params.get('min_rating')
+    if min_rating not in (None, ""):
+        try:
+            min_rating = float(min_rating)
+        except ValueError as exc:
+            raise FilterError("min_rating must be a number") from exc
+        if not 1 <= min_rating <= 5:
+            raise FilterError("min_rating must be between 1 and 5")
+        # compares the stored aggregates, average >= min_rating without a
+        # division per row
+        queryset = queryset.filter(rating_count__gt=0,
+                                   rating_sum__gte=ExpressionWrapper(
+                                       F('rating_count') * Value(min_rating),
+                                       output_field=FloatField()))
+    return queryset
+
+
+def price_bucket():
+    """
+    Returns an expression giving the index of the price bucket of a
+    product
+    """
+    return Case(*[When(price__lt=bound, then=Value(index - 1))
+                  for index, bound in enumerate(PRICE_BUCKETS) if index],
+                default=Value(len(PRICE_BUCKETS) - 1),
+                output_field=IntegerField())
+
+
+def facet_counts(queryset):
+    """
+    Returns the number of products per category and per price bucket
+
+    Both facets come from one query grouped by (category, price bucket).
+
+    Args:
+        queryset (QuerySet): filtered product queryset
+    """
+    rows = (queryset.order_by()
+            .annotate(bucket=price_bucket())
+            .values('category_id', 'category__name', 'bucket')
+            .annotate(count=Count('id')))
+
+    categories = {}
+    buckets = [0] * len(PRICE_BUCKETS)
+    for row in rows:
+        category = categories.setdefault(row['category_id'], {'id': row['category_id'],
+                                                              'name': row['category__name'],
+                                                              'count': 0})
+        category['count'] += row['count']
+        buckets[row['bucket']] += row['count']
+
+    bounds = PRICE_BUCKETS[1:] + (None,)
+    return {
+        'categories': sorted(categories.values(),
+                             key=lambda category: (-category['count'], category['name'])),
+        'price': [{'min': low, 'max': high, 'count': count}
+                  for low, high, count in zip(PRICE_BUCKETS, bounds, buckets)],
+    }
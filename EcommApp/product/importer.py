@@ -0,0 +1,93 @@
+"""
+Bulk product import from CSV or JSON lines input
+
+Rows are read lazily, validated in chunks and written with one
+``bulk_create`` per chunk inside its own transaction, so a bad row is
+reported without aborting the rest of the file.
+
+Rows name their category. When several categories share the name, the
+oldest one is used.
+"""
+from itertools import islice
+from django.db import transaction
+from tasks.queue import enqueue
+from shared_model.importing import (DEFAULT_CHUNK_SIZE,
+                                    FORMATS,
+                                    ImportReport,
+                                    read_rows,
+                                    )
+from . import search
+from .snapshot import mark_stale
+from .models import Category, Product
+from .serializer import ProductImportSerializer
+from .tasks import update_leaderboards
+
+
+def import_products(lines, user, fmt, chunk_size=DEFAULT_CHUNK_SIZE, encoding=None):
+    """
+    Imports products sold by ``user`` and returns an ImportReport
+
+    Args:
+        lines (iterable): lines of CSV (with a header) or JSON lines text,
+            or bytes when ``encoding`` is given
+        user (User): seller of the imported products, or a ClaimsUser
+        fmt (str): one of FORMATS
+        chunk_size (int): number of rows validated and written together
+        encoding (str): encoding of byte lines, rows that do not decode
+            are reported as malformed
+    """
+    report = ImportReport()
+    rows = read_rows(lines, fmt, encoding)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        _import_chunk(chunk, user, report)
+    return report
+
+
+def _import_chunk(chunk, user, report):
+    """
+    Validates one chunk, resolves its categories with a single query and
+    writes the valid rows
+    """
+    valid = []
+    for row_number, row in chunk:
+        if row is None:
+            report.add_error(row_number, {'non_field_errors': ['Malformed row']})
+            continue
+        serializer = ProductImportSerializer(data=row)
+        if serializer.is_valid():
+            valid.append((row_number, serializer.validated_data))
+        else:
+            report.add_error(row_number, serializer.errors)
+
+    names = {data['category'] for _, data in valid}
+    categories = {}
+    for category in Category.objects.filter(name__in=names).order_by('created_at', 'id'):
+        # names are not unique, the oldest category wins
+        categories.setdefault(category.name, category)
+
+    products = []
+    for row_number, data in valid:
+        category = categories.get(data.pop('category'))
+        if category is None:
+            report.add_error(row_number, {'category': ['Category does not exist']})
+            continue
+        products.append(Product(user_id=user.pk, category=category, **data))
+
+    with transaction.atomic():
+        Product.objects.bulk_create(products)
+        # bulk_create sends no post_save, so keep the category counters,
+        # the search table, the leaderboards and the catalog snapshot up
+        # to date here
+        search.index_products(products, new=True)
+        per_category = {}
+        for product in products:
+            per_category[product.category_id] = per_category.get(product.category_id, 0) + 1
+        for category_id, count in per_category.items():
+            Category.add_products(category_id, delta=count)
+        if products:
+            enqueue(update_leaderboards, product_ids=[str(product.pk) for product in products])
+            transaction.on_commit(mark_stale)
+    report.created += len(products)
@@ -0,0 +1,238 @@
+"""
+Per category product leaderboards
+
+A Leaderboard row keeps, for one category and one ordering of BOARDS,
+the sort keys of the best products of the category, best first, so
+reading a board is one row lookup whatever the size of the catalog.
+Keys are lists compared element by element, smaller is better, and end
+with the product id to break ties.
+
+A row holds up to ``capacity()`` keys, twice the ``LEADERBOARD_SIZE``
+served, so that products dropping out of a board can be replaced
+without a query. Unless the row is ``complete`` (it holds every
+eligible product of the category), every product left out ranks after
+its last key. update() keeps that true as products and reviews change,
+and the board is read again from the database only when fewer than
+``LEADERBOARD_SIZE`` keys are left. rebuild() recomputes every board in
+one pass over the product table.
+
+Rows are written with a conditional UPDATE on their version, concurrent
+updates of a board retry on the row written by the other.
+"""
+import bisect
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone, UTC
+from django.conf import settings
+from django.db import transaction
+from django.db.models import ExpressionWrapper, F, FloatField
+from .models import Category, Leaderboard, Product
+
+FIELDS = ('id', 'category_id', 'created_at', 'price', 'rating_count', 'rating_sum')
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+# Conflicting writes of a board tolerated before giving up
+MAX_RETRIES = 5
+
+Board = namedtuple('Board', ['key', 'candidates'])
+
+
+class LeaderboardConflict(RuntimeError):
+    """
+    Raised when a board kept changing under an update
+    """
+
+
+def _top_rated_key(product):
+    if not product.rating_count:
+        return None
+    return [-(product.rating_sum / product.rating_count), -product.rating_count, str(product.id)]
+
+
+def _top_rated(queryset):
+    average = ExpressionWrapper(F('rating_sum') * 1.0 / F('rating_count'),
+                                output_field=FloatField())
+    return (queryset.filter(rating_count__gt=0)
+            .annotate(average=average)
+            .order_by('-average', '-rating_count', 'id'))
+
+
+def _newest_key(product):
+    return [-((product.created_at - EPOCH) // MICROSECOND), str(product.id)]
+
+
+def _cheapest_key(product):
+    return [int(product.price * 100), str(product.id)]
+
+
+# key(product) returns the sort key of a product, None when it is not
+# ranked, candidates(queryset) orders the products of a category the
+# same way
+BOARDS = {
+    Leaderboard.TOP_RATED: Board(_top_rated_key, _top_rated),
+    Leaderboard.NEWEST: Board(_newest_key,
+                              lambda queryset: queryset.order_by('-created_at', 'id')),
+    Leaderboard.CHEAPEST: Board(_cheapest_key,
+                                lambda queryset: queryset.order_by('price', 'id')),
+}
+
+
+def size():
+    return getattr(settings, 'LEADERBOARD_SIZE', 20)
+
+
+def capacity():
+    return 2 * size()
+
+
+def _load(category_id, board):
+    """
+    Reads the best products of a category from the product table,
+    returns (entries, complete)
+    """
+    limit = capacity()
+    rows = BOARDS[board].candidates(Product.objects.filter(category_id=category_id))
+    rows = rows.values_list(*FIELDS, named=True)[:limit + 1]
+    entries = sorted(BOARDS[board].key(row) for row in rows)
+    return entries[:limit], len(entries) <= limit
+
+
+def _write(row, entries, complete):
+    """
+    Stores new entries if the board was not changed since ``row`` was
+    read, returns whether it was stored
+    """
+    return bool(Leaderboard.objects.filter(pk=row['pk'], version=row['version']).update(
+        entries=entries,
+        complete=complete,
+        version=F('version') + 1,
+        updated_at=datetime.now(UTC),
+    ))
+
+
+def _board_row(category_id, board):
+    """
+    Returns the stored board as a dict, loading it from the product
+    table when the category has none yet
+    """
+    fields = ('pk', 'entries', 'complete', 'version')
+    row = Leaderboard.objects.filter(category_id=category_id, board=board).values(*fields).first()
+    if row is None:
+        entries, complete = _load(category_id, board)
+        Leaderboard.objects.bulk_create(
+            [Leaderboard(category_id=category_id, board=board, entries=entries,
+                         complete=complete)],
+            ignore_conflicts=True)
+        row = Leaderboard.objects.filter(category_id=category_id, board=board).values(*fields).get()
+    return row
+
+
+def _place(entries, complete, product_ids, products, key):
+    """
+    Returns the (entries, complete) of a board once the given products
+    are moved to their current keys
+
+    Args:
+        entries (list): stored keys, best first
+        complete (bool): whether entries hold every eligible product
+        product_ids (set): ids, as strings, of the products to move
+        products (list): those of the products still in the category
+        key (callable): sort key of the board
+    """
+    entries = [entry for entry in entries if entry[-1] not in product_ids]
+    for product in products:
+        product_key = key(product)
+        # without every product at hand, a key after the last stored one
+        # may rank after products that are not stored
+        if product_key is not None and (complete or (entries and product_key < entries[-1])):
+            bisect.insort(entries, product_key)
+    limit = capacity()
+    if len(entries) > limit:
+        entries, complete = entries[:limit], False
+    return entries, complete
+
+
+def update(product_ids, category_ids=()):
+    """
+    Moves products to their current place on the boards of their
+    category, and off the boards of the given categories
+
+    Deleted products and products moved to another category are removed.
+    Running it again for the same products changes nothing.
+
+    Args:
+        product_ids (list): ids of the changed products
+        category_ids (list): categories the products may have left
+    """
+    products = list(Product.objects.filter(pk__in=product_ids).values_list(*FIELDS, named=True))
+    categories = {str(pk) for pk in category_ids} | {str(product.category_id) for product in products}
+    # boards of a deleted category go with it
+    categories = Category.objects.filter(pk__in=categories).values_list('pk', flat=True)
+    moved = {str(pk) for pk in product_ids}
+    for category_id in categories:
+        members = [product for product in products if product.category_id == category_id]
+        for board, definition in BOARDS.items():
+            for _ in range(MAX_RETRIES):
+                row = _board_row(category_id, board)
+                entries, complete = _place(row['entries'], row['complete'], moved,
+                                           members, definition.key)
+                if len(entries) < size() and not complete:
+                    entries, complete = _load(category_id, board)
+                # most saves change nothing a board ranks by
+                if (entries, complete) == (row['entries'], row['complete']):
+                    break
+                if _write(row, entries, complete):
+                    break
+            else:
+                raise LeaderboardConflict(
+                    "Leaderboard {} of category {} kept changing".format(board, category_id))
+
+
+def top(category_id, board, limit=None):
+    """
+    Returns the ids of the best products of a category on a board, best
+    first
+
+    Args:
+        category_id (UUID): id of the category
+        board (str): one of BOARDS
+        limit (int): number of ids, at most LEADERBOARD_SIZE
+    """
+    limit = min(limit or size(), size())
+    return [entry[-1] for entry in _board_row(category_id, board)['entries'][:limit]]
+
+
+def rebuild(chunk_size=2000):
+    """
+    Recomputes every board in one pass over the product table and
+    returns the number of boards written
+
+    Each board keeps its best keys in a sorted list bounded by
+    ``capacity()``, so memory does not grow with the catalog.
+
+    Args:
+        chunk_size (int): number of products fetched at a time
+    """
+    limit = capacity()
+    boards = {}
+    seen = {}
+    rows = Product.objects.values_list(*FIELDS, named=True).iterator(chunk_size=chunk_size)
+    for product in rows:
+        for board, definition in BOARDS.items():
+            key = definition.key(product)
+            if key is None:
+                continue
+            slot = (product.category_id, board)
+            seen[slot] = seen.get(slot, 0) + 1
+            entries = boards.setdefault(slot, [])
+            if len(entries) < limit or key < entries[-1]:
+                bisect.insort(entries, key)
+                if len(entries) > limit:
+                    entries.pop()
+
+    with transaction.atomic():
+        Leaderboard.objects.all().delete()
+        Leaderboard.objects.bulk_create([
+            Leaderboard(category_id=category_id, board=board, entries=entries,
+                        complete=seen[(category_id, board)] <= limit)
+            for (category_id, board), entries in boards.items()])
+    return len(boards)
@@ -0,0 +1,46 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from product import snapshot
+from product.models import Product
+from product.serializer import ProductListSerializer
+
+
+class Command(BaseCommand):
+    """
+    Writes the catalog snapshot served to anonymous product list requests
+    """
+    help = "Build the catalog snapshot file, optionally rebuilding it periodically"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', help="Snapshot file, defaults to CATALOG_SNAPSHOT_PATH")
+        parser.add_argument('--interval', type=float, default=0,
+                            help="Rebuild every INTERVAL seconds, build once when 0")
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help="Seconds between checks for a stale snapshot")
+
+    def handle(self, *args, **options):
+        path = options['path'] or getattr(settings, 'CATALOG_SNAPSHOT_PATH', None)
+        if not path:
+            raise CommandError("Set CATALOG_SNAPSHOT_PATH or pass --path")
+        built_at = self.build(path)
+        while options['interval']:
+            time.sleep(options['poll_interval'])
+            changed = snapshot.stale_since(path)
+            if ((changed is not None and changed >= built_at)
+                    or time.time_ns() - built_at >= options['interval'] * 1e9):
+                close_old_connections()
+                built_at = self.build(path)
+
+    def build(self, path):
+        """
+        Writes the snapshot and returns when the build started
+        """
+        started = time.time_ns()
+        rows = ProductListSerializer.setup_queryset(Product.objects.order_by('created_at', 'id'))
+        count = snapshot.write(path, rows.iterator(chunk_size=2000),
+                               ProductListSerializer.serializer())
+        self.stdout.write(self.style.SUCCESS("Wrote {} products to {} in {:.2f}s".format(
+            count, path, (time.time_ns() - started) / 1e9)))
+        return started
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from product import recommendations
+
+
+class Command(BaseCommand):
+    """
+    Computes the related products of every product, or of the products a
+    wishlist change of the given products affects
+    """
+    help = "Recompute the \"also wishlisted\" related products from the wishlists"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--product', action='append', dest='products', default=[],
+                            help="Only refresh what a wishlist change of this product "
+                                 "affects, may be repeated")
+        parser.add_argument('--block-size', type=int,
+                            default=recommendations.DEFAULT_BLOCK_SIZE,
+                            help="Number of products computed at a time")
+
+    def handle(self, *args, **options):
+        if options['products']:
+            written = recommendations.refresh(options['products'],
+                                              block_size=options['block_size'])
+        else:
+            written = recommendations.rebuild(block_size=options['block_size'])
+        self.stdout.write(self.style.SUCCESS("Stored {} related products".format(written)))
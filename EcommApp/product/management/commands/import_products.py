@@ -0,0 +1,40 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from product.importer import import_products
+from shared_model.importing import DEFAULT_CHUNK_SIZE, FORMATS
+from user.models import User
+
+
+class Command(BaseCommand):
+    """
+    Imports products from a CSV or JSON lines file
+    """
+    help = "Bulk import products for a seller from a CSV or JSON lines file"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import")
+        parser.add_argument('--seller', required=True,
+                            help="Email of the user selling the products")
+        parser.add_argument('--format', choices=FORMATS,
+                            help="Input format, guessed from the file extension by default")
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                            help="Number of rows validated and written per transaction")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or path.rsplit('.', 1)[-1].lower()
+        if fmt not in FORMATS:
+            raise CommandError("Cannot guess the format of {}, use --format".format(path))
+        try:
+            seller = User.objects.get(email=options['seller'])
+        except User.DoesNotExist:
+            raise CommandError("No user with email {}".format(options['seller']))
+
+        with open(path, newline='', encoding='utf-8') as lines:
+            report = import_products(lines, seller, fmt, chunk_size=options['chunk_size'])
+
+        for error in report.errors:
+            self.stderr.write(json.dumps(error))
+        self.stdout.write(self.style.SUCCESS(
+            "Imported {} products, rejected {} rows".format(report.created,
+                                                             report.error_count)))
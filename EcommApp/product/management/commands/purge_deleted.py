@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from product.models import Category, Product
+from shared_model.purging import purge
+
+
+class Command(BaseCommand):
+    """
+    Removes soft deleted categories and products with their dependents
+    """
+    help = "Delete soft deleted categories and products, and everything depending on them, in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200,
+                            help="Number of rows deleted at a time")
+
+    def handle(self, *args, **options):
+        deleted = sum(purge(model, batch_size=options['batch_size'])
+                      for model in (Category, Product))
+        self.stdout.write(self.style.SUCCESS("Deleted {} rows".format(deleted)))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from product.leaderboards import rebuild
+
+
+class Command(BaseCommand):
+    """
+    Recomputes the category leaderboards from the products table
+    """
+    help = "Rebuild every category leaderboard in one pass over the products"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help="Number of products fetched at a time")
+
+    def handle(self, *args, **options):
+        boards = rebuild(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS("Rebuilt {} leaderboards".format(boards)))
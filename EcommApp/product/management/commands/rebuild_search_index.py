@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from product import search
+
+
+class Command(BaseCommand):
+    """
+    Rebuilds the full-text product search table
+    """
+    help = "Drop and rebuild the product_search FTS5 table from the product table"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default',
+                            help="Database alias to rebuild")
+
+    def handle(self, *args, **options):
+        using = connections[options['database']]
+        if not search.is_supported(using):
+            self.stdout.write("Full-text search needs SQLite, nothing to rebuild")
+            return
+        with transaction.atomic(using=using.alias):
+            count = search.rebuild(using)
+        self.stdout.write(self.style.SUCCESS(
+            "Indexed {} products".format(count)))
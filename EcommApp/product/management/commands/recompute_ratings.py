@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from product.models import Product, Review, RATING_CHOICES
+from product.signal import invalidate_rating_summary
+
+RATING_FIELDS = ['rating_count', 'rating_sum'] + [
+    'rating_{}'.format(rating) for rating, _ in RATING_CHOICES]
+
+
+class Command(BaseCommand):
+    """
+    Recomputes the stored product rating aggregates from the reviews table
+    """
+    help = "Recompute rating_count, rating_sum and the rating histogram of every product"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help="Number of products updated per transaction")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        ids = Product.objects.order_by('pk').values_list('pk', flat=True)
+        batch, repaired = [], 0
+        for product_id in ids.iterator(chunk_size=batch_size):
+            batch.append(product_id)
+            if len(batch) == batch_size:
+                repaired += self.recompute(batch)
+                batch = []
+        if batch:
+            repaired += self.recompute(batch)
+        self.stdout.write(self.style.SUCCESS(
+            "Repaired rating aggregates of {} products".format(repaired)))
+
+    def recompute(self, product_ids):
+        """
+        Recomputes the aggregates of a batch of products with one grouped
+        query and writes back only the rows that drifted
+
+        Args:
+            product_ids (list): ids of the products in the batch
+        """
+        histogram = {'rating_{}'.format(rating): Count('pk', filter=Q(rating=rating))
+                     for rating, _ in RATING_CHOICES}
+        totals = {row.pop('product'): row for row in
+                  Review.objects.filter(product__in=product_ids)
+                                .values('product')
+                                .annotate(rating_count=Count('pk'),
+                                          rating_sum=Sum('rating'),
+                                          **histogram)
+                                .order_by()}
+        empty = dict.fromkeys(RATING_FIELDS, 0)
+        with transaction.atomic():
+            drifted = []
+            for product in Product.objects.filter(pk__in=product_ids).only(*RATING_FIELDS):
+                expected = totals.get(product.pk, empty)
+                if any(getattr(product, field) != expected[field] for field in RATING_FIELDS):
+                    for field in RATING_FIELDS:
+                        setattr(product, field, expected[field])
+                    drifted.append(product)
+                    invalidate_rating_summary(product.pk)
+            Product.objects.bulk_update(drifted, RATING_FIELDS)
+        return len(drifted)
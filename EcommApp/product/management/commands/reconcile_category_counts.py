@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from product.models import Category, Product
+
+
+class Command(BaseCommand):
+    """
+    Reconciles the stored category product counts with the products table
+    """
+    help = "Recompute the product_count of every category"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help="Number of categories updated per transaction")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        ids = Category.objects.order_by('pk').values_list('pk', flat=True)
+        batch, repaired = [], 0
+        for category_id in ids.iterator(chunk_size=batch_size):
+            batch.append(category_id)
+            if len(batch) == batch_size:
+                repaired += self.reconcile(batch)
+                batch = []
+        if batch:
+            repaired += self.reconcile(batch)
+        self.stdout.write(self.style.SUCCESS(
+            "Repaired product counts of {} categories".format(repaired)))
+
+    def reconcile(self, category_ids):
+        """
+        Counts the products of a batch of categories with one grouped query
+        and writes back only the counters that drifted
+
+        Args:
+            category_ids (list): ids of the categories in the batch
+        """
+        counts = dict(Product.objects.filter(category__in=category_ids)
+                                     .values_list('category')
+                                     .annotate(Count('pk'))
+                                     .order_by())
+        with transaction.atomic():
+            drifted = []
+            for category in Category.objects.filter(pk__in=category_ids).only('product_count'):
+                expected = counts.get(category.pk, 0)
+                if category.product_count != expected:
+                    category.product_count = expected
+                    drifted.append(category)
+            Category.objects.bulk_update(drifted, ['product_count'])
+        return len(drifted)
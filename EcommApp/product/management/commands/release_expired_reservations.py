@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from product.reservations import release_expired
+
+
+class Command(BaseCommand):
+    """
+    Puts the stock of expired reservations back on sale
+    """
+    help = "Release every held stock reservation past its expiry"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help="Number of reservations read at a time")
+
+    def handle(self, *args, **options):
+        released = release_expired(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            "Released {} expired reservations".format(released)))
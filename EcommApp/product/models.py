@@ -19,12 +19,39 @@ class Category(Basemodel):
     description = models.TextField(null=True,
                                    blank=True,
                                    help_text="Enter the category description")
+    product_count = models.PositiveIntegerField(default=0, editable=False)
+
+    counter_fields = ('product_count',)
+
+    class Meta:
+        # finds soft deleted rows for shared_model.purging
+        indexes = [
+            models.Index(fields=['deleted_at'],
+                         condition=models.Q(deleted_at__isnull=False),
+                         name='category_deleted_idx'),
+        ]
 
     def total_products(self):
         """
         Method to calculate the total number of products in the category
+
+        Reads the stored counter, so no query is run.
+        """
+        return self.product_count
+
+    @classmethod
+    def add_products(cls, category_id, delta=1):
+        """
+        Adds (or, with a negative delta, removes) products from the stored
+        product count of a category in one UPDATE statement
+
+        Args:
+            category_id (UUID): id of the category
+            delta (int): number of products to add
         """
-        return self.products.count()
+        return cls.objects.filter(pk=category_id).update(
+            product_count=models.F('product_count') + delta
+        )
 
 class Product(Basemodel):
     """
@@ -48,19 +75,129 @@ class Product(Basemodel):
                              on_delete=models.CASCADE,
                              related_name='products'
                              )
+    # indexed by the composite indexes below, which lead with category
     category = models.ForeignKey(Category,
                                  on_delete=models.CASCADE,
-                                 related_name='products'
+                                 related_name='products',
+                                 db_index=False
                                  )
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_1 = models.PositiveIntegerField(default=0, editable=False)
+    rating_2 = models.PositiveIntegerField(default=0, editable=False)
+    rating_3 = models.PositiveIntegerField(default=0, editable=False)
+    rating_4 = models.PositiveIntegerField(default=0, editable=False)
+    rating_5 = models.PositiveIntegerField(default=0, editable=False)
+
+    # quantity is only changed with conditional UPDATEs (take_stock and
+    # return_stock), so a stale instance cannot oversell. Restocks use
+    # return_stock, or set it explicitly with
+    # save(update_fields=['quantity', 'updated_at']).
+    counter_fields = ('quantity', 'rating_count', 'rating_sum', 'rating_1',
+                      'rating_2', 'rating_3', 'rating_4', 'rating_5')
 
     class Meta:
         ordering = ['created_at']
+        # Laid out for the listing filters (product.filters) followed by the
+        # (created_at, id) keyset order
+        indexes = [
+            models.Index(fields=['created_at', 'id'],
+                         name='product_created_idx'),
+            models.Index(fields=['category', 'created_at', 'id'],
+                         name='product_category_created_idx'),
+            models.Index(fields=['category', 'price'],
+                         name='product_category_price_idx'),
+            models.Index(fields=['price'],
+                         name='product_price_idx'),
+            models.Index(fields=['created_at', 'id'],
+                         condition=models.Q(quantity__gt=0),
+                         name='product_in_stock_idx'),
+            models.Index(fields=['deleted_at'],
+                         condition=models.Q(deleted_at__isnull=False),
+                         name='product_deleted_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """
+        Remembers the stored category so that the category product counts
+        can be moved when the product changes category
+        """
+        instance = super().from_db(db, field_names, values)
+        if 'category_id' in instance.__dict__:
+            instance._loaded_category_id = instance.category_id
+        return instance
 
     def average_rating(self):
         """
         Method to calculate the average rating of the product
+
+        Reads the stored rating aggregates, so no query is run.
+        """
+        if not self.rating_count:
+            return 0.0
+        return self.rating_sum / self.rating_count
+
+    def rating_histogram(self):
         """
-        return self.reviews.aggregate(AVG('rating')).get("rating", 0.0)
+        Method returning the number of reviews for each rating
+        """
+        return {rating: getattr(self, 'rating_{}'.format(rating))
+                for rating, _ in RATING_CHOICES}
+
+    def rating_summary(self):
+        """
+        Method returning the review count, average rating and histogram
+        shown in the product page header
+        """
+        return {'count': self.rating_count,
+                'average': round(self.average_rating(), 2),
+                'histogram': self.rating_histogram()}
+
+    @classmethod
+    def add_rating(cls, product_id, rating, delta=1):
+        """
+        Adds (or, with a negative delta, removes) a rating from the stored
+        aggregates of a product in one UPDATE statement
+
+        Args:
+            product_id (UUID): id of the rated product
+            rating (int): rating between 1 and 5
+            delta (int): number of ratings to add
+        """
+        histogram_field = 'rating_{}'.format(rating)
+        return cls.objects.filter(pk=product_id).update(
+            rating_count=models.F('rating_count') + delta,
+            rating_sum=models.F('rating_sum') + delta * rating,
+            **{histogram_field: models.F(histogram_field) + delta}
+        )
+
+    @classmethod
+    def take_stock(cls, product_id, count):
+        """
+        Removes ``count`` units from the stock of a product with one
+        conditional UPDATE, returns False when fewer units are left
+
+        Args:
+            product_id (UUID): id of the product
+            count (int): number of units to take
+        """
+        return bool(cls.objects.filter(pk=product_id, quantity__gte=count).update(
+            quantity=models.F('quantity') - count
+        ))
+
+    @classmethod
+    def return_stock(cls, product_id, count):
+        """
+        Puts ``count`` units back into the stock of a product in one UPDATE
+
+        Args:
+            product_id (UUID): id of the product
+            count (int): number of units to return
+        """
+        return cls.objects.filter(pk=product_id).update(
+            quantity=models.F('quantity') + count
+        )
 
 class Review(Basemodel):
     """
@@ -68,7 +205,8 @@ class Review(Basemodel):
     """
     product = models.ForeignKey(Product,
                                 on_delete=models.CASCADE,
-                                related_name='reviews'
+                                related_name='reviews',
+                                db_index=False
                                 )
     user = models.ForeignKey(User,
                              on_delete=models.CASCADE, 
@@ -82,6 +220,26 @@ class Review(Basemodel):
                               help_text="Enter the product review"
                               )
 
+    class Meta:
+        # serves the keyset pages of a product's reviews, and the product FK
+        indexes = [
+            models.Index(fields=['product', 'created_at', 'id'],
+                         name='review_product_created_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """
+        Remembers the stored product and rating so that the rating
+        aggregates can be moved when either of them changes. Reviews
+        loaded without them read them again before saving (see
+        product.signal.load_stored_rating).
+        """
+        instance = super().from_db(db, field_names, values)
+        if {'product_id', 'rating'} <= instance.__dict__.keys():
+            instance._loaded_rating = (instance.product_id, instance.rating)
+        return instance
+
 class Wishlist(Basemodel):
     """
     Wishlist model
@@ -90,6 +248,24 @@ class Wishlist(Basemodel):
                              on_delete=models.CASCADE,
                              related_name='wishlist')
 
+    class Meta:
+        # one wishlist per user, so concurrent first adds cannot create
+        # two, the unique index also serves the user FK
+        constraints = [
+            models.UniqueConstraint(fields=['user'],
+                                    name='unique_user_wishlist'),
+        ]
+
+    @classmethod
+    def for_user(cls, user_id):
+        """
+        Returns the wishlist of a user, creating it when the user has none
+
+        Args:
+            user_id (UUID): id of the user
+        """
+        return cls.objects.get_or_create(user_id=user_id)[0]
+
 class WishlistItem(Basemodel):
     """
     Model to store user wishlist items
@@ -99,4 +275,126 @@ class WishlistItem(Basemodel):
                                  related_name="items")
     product = models.ForeignKey(Product,
                                 on_delete=models.CASCADE,
-                                related_name="items")
\ No newline at end of file
+                                related_name="items")
+
+    class Meta:
+        # the unique index also serves (wishlist, product) lookups
+        constraints = [
+            models.UniqueConstraint(fields=['wishlist', 'product'],
+                                    name='unique_wishlist_product'),
+        ]
+
+class Reservation(Basemodel):
+    """
+    Model for stock held for a user until it is confirmed, released or
+    expires
+    """
+    HELD = 'held'
+    CONFIRMED = 'confirmed'
+    RELEASED = 'released'
+    STATUS_CHOICES = [
+        (HELD, 'Held'),
+        (CONFIRMED, 'Confirmed'),
+        (RELEASED, 'Released'),
+    ]
+
+    user = models.ForeignKey(User,
+                             on_delete=models.CASCADE,
+                             related_name='reservations')
+    status = models.CharField(max_length=10,
+                              choices=STATUS_CHOICES,
+                              default=HELD)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        # serves the sweep of expired held reservations
+        indexes = [
+            models.Index(fields=['status', 'expires_at'],
+                         name='reservation_status_expiry_idx'),
+        ]
+
+class ReservationItem(Basemodel):
+    """
+    Model for the stock of one product held by a reservation
+    """
+    reservation = models.ForeignKey(Reservation,
+                                    on_delete=models.CASCADE,
+                                    related_name='items')
+    product = models.ForeignKey(Product,
+                                on_delete=models.CASCADE,
+                                related_name='reservation_items')
+    quantity = models.PositiveIntegerField(validators=[MinValueValidator(1)])
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['reservation', 'product'],
+                                    name='unique_reservation_product'),
+        ]
+
+class Leaderboard(Basemodel):
+    """
+    Model for the best products of a category by one ordering, kept up
+    to date by product.leaderboards
+
+    Attributes:
+        category: Category, category ranked
+        board: str, one of the BOARD_CHOICES
+        entries: list, sort keys of the best products, best first, each
+            ending with the product id
+        complete: bool, whether entries hold every eligible product of
+            the category
+        version: int, bumped by every write, guards concurrent updates
+    """
+    TOP_RATED = 'top_rated'
+    NEWEST = 'newest'
+    CHEAPEST = 'cheapest'
+    BOARD_CHOICES = [
+        (TOP_RATED, 'Top rated'),
+        (NEWEST, 'Newest'),
+        (CHEAPEST, 'Cheapest'),
+    ]
+
+    category = models.ForeignKey(Category,
+                                 on_delete=models.CASCADE,
+                                 related_name='leaderboards')
+    board = models.CharField(max_length=20, choices=BOARD_CHOICES)
+    entries = models.JSONField(default=list)
+    complete = models.BooleanField(default=True)
+    version = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        # the unique index also serves the (category, board) lookups
+        constraints = [
+            models.UniqueConstraint(fields=['category', 'board'],
+                                    name='unique_category_board'),
+        ]
+
+class RelatedProduct(Basemodel):
+    """
+    Model for a product often wishlisted together with another, computed
+    by product.recommendations
+
+    Attributes:
+        product: Product, product the recommendation is shown for
+        related: Product, product recommended
+        rank: int, position of the recommendation, 0 first
+        score: float, cosine similarity of the users wishlisting both
+    """
+    product = models.ForeignKey(Product,
+                                on_delete=models.CASCADE,
+                                related_name='related',
+                                db_index=False)
+    # indexed to find the products recommending a changed product
+    related = models.ForeignKey(Product,
+                                on_delete=models.CASCADE,
+                                related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        # the unique index also serves reads in rank order and the
+        # product FK
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'rank'],
+                                    name='unique_product_rank'),
+        ]
@@ -0,0 +1,182 @@
+"""
+Keyset (cursor) pagination and streaming helpers for product listings
+
+Pages are keyed on ``(created_at, id)`` so that each page is a single
+indexed range scan instead of an OFFSET over the whole table.
+"""
+import base64
+import binascii
+import json
+from collections import namedtuple
+from datetime import datetime
+from uuid import UUID
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+STREAM_CHUNK_SIZE = 500
+
+Page = namedtuple("Page", ["items", "next", "previous"])
+
+
+class PaginationError(ValueError):
+    """
+    Raised when the pagination query parameters are invalid
+    """
+
+
+def encode_cursor(instance, reverse=False):
+    """
+    Encodes the position of an instance into an opaque cursor
+
+    Args:
+        instance (Basemodel): row the cursor points at
+        reverse (bool): whether the cursor walks backwards
+    """
+    payload = {
+        "c": instance.created_at.isoformat(),
+        "i": str(instance.id),
+        "r": reverse,
+    }
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """
+    Decodes a cursor into a (created_at, id, reverse) tuple
+
+    Args:
+        cursor (str): cursor previously returned by encode_cursor
+    """
+    padded = cursor + "=" * (-len(cursor) % 4)
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(padded))
+        return (datetime.fromisoformat(payload["c"]),
+                UUID(payload["i"]),
+                bool(payload.get("r", False)))
+    except (binascii.Error, ValueError, KeyError, TypeError) as exc:
+        raise PaginationError("Invalid cursor") from exc
+
+
+def get_page_size(value):
+    """
+    Parses the requested page size and clamps it to MAX_PAGE_SIZE
+
+    Args:
+        value (str): raw ``limit`` query parameter, may be None
+    """
+    if value in (None, ""):
+        return DEFAULT_PAGE_SIZE
+    try:
+        page_size = int(value)
+    except ValueError as exc:
+        raise PaginationError("limit must be an integer") from exc
+    if page_size < 1:
+        raise PaginationError("limit must be a positive integer")
+    return min(page_size, MAX_PAGE_SIZE)
+
+
+def _page_queryset(queryset, cursor, page_size):
+    """
+    Returns the queryset slice holding one page plus one extra row, and
+    whether it walks backwards
+    """
+    reverse = False
+    if cursor:
+        created_at, pk, reverse = decode_cursor(cursor)
+        if reverse:
+            queryset = queryset.filter(Q(created_at__lt=created_at) |
+                                       Q(created_at=created_at, id__lt=pk))
+        else:
+            queryset = queryset.filter(Q(created_at__gt=created_at) |
+                                       Q(created_at=created_at, id__gt=pk))
+
+    ordering = ("-created_at", "-id") if reverse else ("created_at", "id")
+    return queryset.order_by(*ordering)[:page_size + 1], reverse
+
+
+def make_page(rows, cursor, page_size, reverse):
+    """
+    Builds the Page and its cursors from the fetched rows
+
+    Args:
+        rows (list): up to ``page_size + 1`` rows in the direction of
+            travel, anything with ``created_at`` and ``id``
+        cursor (str): cursor the rows were fetched with, may be None
+        page_size (int): maximum number of rows on the page
+        reverse (bool): whether the rows walk backwards
+    """
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if reverse:
+        rows.reverse()
+
+    if not rows:
+        return Page(rows, None, None)
+
+    has_next = has_more if not reverse else True
+    has_previous = has_more if reverse else bool(cursor)
+    return Page(rows,
+                encode_cursor(rows[-1]) if has_next else None,
+                encode_cursor(rows[0], reverse=True) if has_previous else None)
+
+
+def paginate(queryset, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    """
+    Returns one page of the queryset ordered by (created_at, id)
+
+    Only ``page_size + 1`` rows are fetched, the extra row tells whether
+    another page exists in the direction of travel.
+
+    Args:
+        queryset (QuerySet): queryset of Basemodel rows
+        cursor (str): cursor returned with a previous page, may be None
+        page_size (int): maximum number of rows on the page
+    """
+    page_queryset, reverse = _page_queryset(queryset, cursor, page_size)
+    return make_page(list(page_queryset), cursor, page_size, reverse)
+
+
+async def apaginate(queryset, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    """
+    Async version of paginate using the async ORM
+    """
+    page_queryset, reverse = _page_queryset(queryset, cursor, page_size)
+    rows = [row async for row in page_queryset]
+    return make_page(rows, cursor, page_size, reverse)
+
+
+def stream_json_array(queryset, serialize, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Yields a JSON array one row at a time for a StreamingHttpResponse
+
+    Rows are read with ``.iterator()`` so the full result set is never
+    held in memory.
+
+    Args:
+        queryset (QuerySet): rows to write out
+        serialize (callable): turns one row into a JSON serializable object
+        chunk_size (int): number of rows fetched from the cursor at a time
+    """
+    yield "["
+    for index, row in enumerate(queryset.iterator(chunk_size=chunk_size)):
+        if index:
+            yield ","
+        yield json.dumps(serialize(row), cls=DjangoJSONEncoder)
+    yield "]"
+
+
+async def astream_json_array(queryset, serialize, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Async version of stream_json_array reading rows with ``.aiterator()``
+    """
+    yield "["
+    index = 0
+    async for row in queryset.aiterator(chunk_size=chunk_size):
+        if index:
+            yield ","
+        index += 1
+        yield json.dumps(serialize(row), cls=DjangoJSONEncoder)
+    yield "]"
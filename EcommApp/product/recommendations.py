@@ -0,0 +1,214 @@
+"""
+"Also wishlisted" product recommendations
+
+Products saved by the same users are related. The wishlists are loaded
+into a sparse users × products matrix A holding a one where a user
+wishlisted a product, so the number of users wishlisting both products
+of every pair is an entry of Aᵀ·A. That product is computed a block of
+products at a time, which bounds memory. A pair is scored by cosine
+similarity, its count divided by the geometric mean of the number of
+users wishlisting each product, and the best ``RELATED_PRODUCTS_SIZE``
+of every product are stored as RelatedProduct rows, which the related
+products endpoint reads.
+
+rebuild() recomputes every product. refresh() recomputes only the
+products whose neighbours a wishlist change can move: the changed
+products, the products wishlisted by the same users and the products
+recommending a changed product. It loads only the wishlists of the users
+of those products.
+
+Only the computation needs NumPy and SciPy. The module is imported by
+the command and the refresh_related task, which is worker only (see
+tasks.queue), so web processes never load them, in thread mode too.
+"""
+from datetime import datetime, UTC
+from functools import partial
+from uuid import UUID
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from scipy import sparse
+from shared_model.ids import uuid7
+from .models import RelatedProduct, WishlistItem
+
+DEFAULT_BLOCK_SIZE = 2000
+# columns written by store(), deleted_at is left NULL
+INSERT_FIELDS = ('id', 'created_at', 'updated_at', 'product', 'related', 'rank', 'score')
+
+
+def size():
+    return getattr(settings, 'RELATED_PRODUCTS_SIZE', 20)
+
+
+def _items():
+    # wishlist items of soft deleted products are left for the purge
+    return WishlistItem.objects.filter(product__deleted_at__isnull=True)
+
+
+class Wishlists:
+    """
+    Wishlists as a sparse users × products matrix
+
+    Attributes:
+        matrix: scipy.sparse.csr_array, one where a user wishlisted a
+            product
+        product_ids: list, id of the product of each column, sorted so
+            that ties are broken by product id
+        users: numpy.ndarray, number of users wishlisting the product of
+            each column
+    """
+    def __init__(self, pairs):
+        """
+        Args:
+            pairs (iterable): (user id, product id) of every wishlist item
+        """
+        user_index, product_index = {}, {}
+        rows, columns = [], []
+        for user_id, product_id in pairs:
+            rows.append(user_index.setdefault(user_id, len(user_index)))
+            columns.append(product_index.setdefault(product_id, len(product_index)))
+        ids = list(product_index)
+        order = sorted(range(len(ids)), key=ids.__getitem__)
+        position = np.empty(len(ids), dtype=np.int64)
+        position[order] = np.arange(len(ids))
+        self.product_ids = [ids[number] for number in order]
+        self.matrix = sparse.csr_array(
+            (np.ones(len(rows), dtype=np.int32),
+             (np.array(rows, dtype=np.int64), position[np.array(columns, dtype=np.int64)])),
+            shape=(len(user_index), len(ids)))
+        # a user may hold the same product on several wishlists
+        self.matrix.sum_duplicates()
+        self.matrix.data[:] = 1
+        self.users = np.bincount(self.matrix.indices, minlength=len(ids)).astype(np.float64)
+
+    def columns(self, product_ids):
+        """
+        Returns the columns of the given products, skipping products that
+        are on no wishlist
+        """
+        index = {pk: number for number, pk in enumerate(self.product_ids)}
+        return np.array(sorted(index[pk] for pk in product_ids if pk in index), dtype=np.int64)
+
+
+def neighbours(wishlists, targets, limit, block_size=DEFAULT_BLOCK_SIZE):
+    """
+    Yields the best neighbours of the given products, one block of
+    products at a time, as (block, sources, related, ranks, scores)
+    arrays of column numbers, ranks and scores
+
+    Args:
+        wishlists (Wishlists): the wishlist matrix
+        targets (numpy.ndarray): columns of the products to compute
+        limit (int): number of neighbours kept per product
+        block_size (int): number of products computed at a time
+    """
+    transposed = wishlists.matrix.T.tocsr()
+    for start in range(0, len(targets), block_size):
+        block = targets[start:start + block_size]
+        together = transposed[block] @ wishlists.matrix
+        rows = np.repeat(np.arange(len(block)), np.diff(together.indptr))
+        columns = together.indices
+        others = columns != block[rows]
+        rows, columns, counts = rows[others], columns[others], together.data[others]
+        scores = counts / np.sqrt(wishlists.users[block[rows]] * wishlists.users[columns])
+        # best score first within each row, then lowest product id
+        order = np.lexsort((columns, -scores, rows))
+        rows, columns, scores = rows[order], columns[order], scores[order]
+        ranks = np.arange(len(rows)) - np.searchsorted(rows, rows)
+        best = ranks < limit
+        yield block, block[rows[best]], columns[best], ranks[best], scores[best]
+
+
+def _insert_sql(using):
+    meta = RelatedProduct._meta
+    columns = [meta.get_field(name).column for name in INSERT_FIELDS]
+    return 'INSERT INTO {} ({}) VALUES ({})'.format(
+        using.ops.quote_name(meta.db_table),
+        ', '.join(using.ops.quote_name(column) for column in columns),
+        ', '.join(['%s'] * len(columns)))
+
+
+def store(wishlists, blocks):
+    """
+    Replaces the stored neighbours of every block in its own transaction
+    and returns the number of rows written
+
+    Rows are inserted with one executemany per block, values prepared for
+    the database once per product rather than once per row as
+    bulk_create does, which made up nearly all of the storing time.
+    """
+    meta = RelatedProduct._meta
+    # the wrapper itself, the ``connection`` proxy is resolved on every use
+    using = transaction.get_connection()
+    prepare_id = partial(meta.get_field('product').get_db_prep_save, connection=using)
+    ids = [prepare_id(pk) for pk in wishlists.product_ids]
+    prepare_pk = partial(meta.pk.get_db_prep_save, connection=using)
+    sql = _insert_sql(using)
+    written = 0
+    for block, sources, related, ranks, scores in blocks:
+        now = meta.get_field('created_at').get_db_prep_save(datetime.now(UTC), using)
+        rows = [(prepare_pk(uuid7()), now, now, ids[source], ids[other], rank, score)
+                for source, other, rank, score in zip(sources.tolist(), related.tolist(),
+                                                      ranks.tolist(), scores.tolist())]
+        with transaction.atomic():
+            RelatedProduct.objects.filter(product_id__in=[wishlists.product_ids[number]
+                                                          for number in block.tolist()]).delete()
+            with using.cursor() as cursor:
+                cursor.executemany(sql, rows)
+        written += len(rows)
+    return written
+
+
+def rebuild(block_size=DEFAULT_BLOCK_SIZE):
+    """
+    Recomputes the neighbours of every wishlisted product and returns the
+    number of rows written
+
+    Args:
+        block_size (int): number of products computed and written at a
+            time
+    """
+    pairs = _items().values_list('wishlist__user_id', 'product_id')
+    wishlists = Wishlists(pairs.iterator(chunk_size=10_000))
+    targets = np.arange(len(wishlists.product_ids))
+    written = store(wishlists, neighbours(wishlists, targets, size(), block_size))
+    # products on no wishlist any more
+    RelatedProduct.objects.exclude(product_id__in=_items().values('product_id')).delete()
+    return written
+
+
+def refresh(product_ids, block_size=DEFAULT_BLOCK_SIZE):
+    """
+    Recomputes the neighbours of the products a wishlist change of the
+    given products can affect and returns the number of rows written
+
+    Args:
+        product_ids (list): ids of the products added to or removed from
+            wishlists
+        block_size (int): number of products computed at a time
+    """
+    items = _items()
+    changed = {UUID(str(pk)) for pk in product_ids}
+    users = items.filter(product_id__in=changed).values('wishlist__user_id')
+    affected = (changed
+                | set(items.filter(wishlist__user_id__in=users)
+                           .values_list('product_id', flat=True))
+                | set(RelatedProduct.objects.filter(related_id__in=changed)
+                                            .values_list('product_id', flat=True)))
+    # every wishlist of every user of an affected product, enough to
+    # count how often an affected product is wishlisted with any other
+    scope = items.filter(wishlist__user_id__in=items.filter(product_id__in=affected)
+                                                    .values('wishlist__user_id'))
+    wishlists = Wishlists(scope.values_list('wishlist__user_id', 'product_id'))
+    # scores divide by the users of each product over all wishlists
+    totals = dict(items.filter(product_id__in=scope.values('product_id'))
+                       .values_list('product_id')
+                       .annotate(users=Count('wishlist__user_id', distinct=True))
+                       .order_by())
+    wishlists.users = np.array([totals[pk] for pk in wishlists.product_ids], dtype=np.float64)
+    targets = wishlists.columns(affected)
+    written = store(wishlists, neighbours(wishlists, targets, size(), block_size))
+    gone = affected.difference(wishlists.product_ids)
+    RelatedProduct.objects.filter(product_id__in=gone).delete()
+    return written
@@ -0,0 +1,130 @@
+"""
+Stock reservations
+
+Stock is taken with one conditional ``UPDATE ... WHERE quantity >= n``
+per product (Product.take_stock), so concurrent buyers never read and
+write back the quantity and cannot oversell. The items of a reservation
+are taken in one transaction, in product id order, and all of them are
+put back when any is short.
+
+A reservation holds its stock until it is confirmed, released, or
+expires after ``RESERVATION_TTL`` seconds and is released by
+release_expired (the ``release_expired_reservations`` command).
+Status changes are conditional UPDATEs as well, so a reservation is
+released at most once even when a release races a confirm or the
+expiry sweep.
+"""
+from collections import Counter
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .models import Product, Reservation, ReservationItem
+
+
+class ReservationError(ValueError):
+    """
+    Raised when a reservation cannot be made or changed
+    """
+
+
+class OutOfStock(ReservationError):
+    """
+    Raised when a product has fewer units left than requested
+    """
+    def __init__(self, product_id):
+        super().__init__("Not enough stock for product {}".format(product_id))
+        self.product_id = product_id
+
+
+def reserve(user_id, items, ttl=None):
+    """
+    Holds stock for a user and returns the Reservation
+
+    Args:
+        user_id (UUID): id of the user
+        items (list): (product_id, quantity) pairs, repeated products are
+            added up
+        ttl (int): seconds the stock is held, defaults to RESERVATION_TTL
+    """
+    if ttl is None:
+        ttl = getattr(settings, 'RESERVATION_TTL', 900)
+    counts = Counter()
+    for product_id, quantity in items:
+        counts[product_id] += quantity
+
+    with transaction.atomic():
+        # a fixed order keeps concurrent multi-item reservations from
+        # waiting on each other's rows
+        for product_id in sorted(counts):
+            if not Product.take_stock(product_id, counts[product_id]):
+                raise OutOfStock(product_id)
+        reservation = Reservation.objects.create(
+            user_id=user_id,
+            expires_at=timezone.now() + timedelta(seconds=ttl))
+        ReservationItem.objects.bulk_create([
+            ReservationItem(reservation=reservation, product_id=product_id, quantity=count)
+            for product_id, count in counts.items()])
+    return reservation
+
+
+def _claim(reservation_id, status, **filters):
+    """
+    Moves a held reservation to ``status``, returns False when it is not
+    held (or does not match ``filters``)
+    """
+    return bool(Reservation.objects.filter(pk=reservation_id,
+                                           status=Reservation.HELD,
+                                           **filters).update(status=status,
+                                                             updated_at=timezone.now()))
+
+
+def release(reservation_id, **filters):
+    """
+    Puts the stock of a held reservation back, returns False when it was
+    not held
+
+    Args:
+        reservation_id (UUID): id of the reservation
+        filters: extra conditions on the reservation, e.g. ``user_id``
+    """
+    with transaction.atomic():
+        if not _claim(reservation_id, Reservation.RELEASED, **filters):
+            return False
+        items = ReservationItem.objects.filter(reservation_id=reservation_id)
+        for product_id, quantity in items.values_list('product_id', 'quantity'):
+            Product.return_stock(product_id, quantity)
+    return True
+
+
+def confirm(reservation_id, **filters):
+    """
+    Turns a held, unexpired reservation into a sale, returns False when
+    it was not held or has expired
+
+    Args:
+        reservation_id (UUID): id of the reservation
+        filters: extra conditions on the reservation, e.g. ``user_id``
+    """
+    return _claim(reservation_id, Reservation.CONFIRMED,
+                  expires_at__gt=timezone.now(), **filters)
+
+
+def release_expired(batch_size=500):
+    """
+    Releases every held reservation past its expiry and returns how many
+    were released
+
+    Args:
+        batch_size (int): number of reservations read at a time
+    """
+    released = 0
+    while True:
+        ids = list(Reservation.objects.filter(status=Reservation.HELD,
+                                              expires_at__lte=timezone.now())
+                                      .order_by('expires_at')
+                                      .values_list('pk', flat=True)[:batch_size])
+        # a reservation confirmed or released meanwhile is skipped by release
+        released += sum(release(pk) for pk in ids)
+        if len(ids) < batch_size:
+            return released
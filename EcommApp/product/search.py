@@ -0,0 +1,185 @@
+"""
+Full-text product search backed by an SQLite FTS5 table
+
+``product_search`` holds one row per product with its name, description
+and category name. The product and category ids are stored as indexed
+FTS columns so a row can be found by id through the FTS index itself;
+text queries are restricted to the searchable columns. Rows are kept in
+sync by the product signals and can be rebuilt with the
+``rebuild_search_index`` command.
+
+On other database backends search falls back to ``icontains`` scans.
+"""
+import re
+from uuid import UUID
+from django.db import connection
+from django.db.models import Q
+from .models import Product
+
+TABLE = 'product_search'
+SEARCH_COLUMNS = '{name description category}'
+# bm25 weights in column order: product_id, category_id, name, description, category
+RANK = 'bm25({}, 0.0, 0.0, 10.0, 1.0, 3.0)'.format(TABLE)
+
+CREATE_TABLE = """
+CREATE VIRTUAL TABLE IF NOT EXISTS {} USING fts5(
+    product_id, category_id, name, description, category,
+    tokenize = 'unicode61 remove_diacritics 2'
+)
+""".format(TABLE)
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+# Product ids matched by one DELETE
+REMOVE_BATCH_SIZE = 500
+
+
+def is_supported(using=connection):
+    return using.vendor == 'sqlite'
+
+
+def _id_match(column, value):
+    return '{} : "{}"'.format(column, value.hex)
+
+
+def _ids_match(column, values):
+    return '{} : ({})'.format(column, ' OR '.join('"{}"'.format(value.hex) for value in values))
+
+
+def build_query(text):
+    """
+    Turns user input into a safe FTS5 query over the searchable columns
+
+    Every word must match and the last one is matched as a prefix, so
+    results narrow while the user types. Returns None when the input
+    has no words.
+
+    Args:
+        text (str): raw search input
+    """
+    tokens = TOKEN_RE.findall(text.lower())
+    if not tokens:
+        return None
+    terms = ['"{}"'.format(token) for token in tokens]
+    terms[-1] += '*'
+    return '{} : ({})'.format(SEARCH_COLUMNS, ' '.join(terms))
+
+
+def create_table(using=connection):
+    """
+    Creates the FTS5 table if it does not exist yet
+    """
+    if is_supported(using):
+        with using.cursor() as cursor:
+            cursor.execute(CREATE_TABLE)
+
+
+def rebuild(using=connection):
+    """
+    Recreates the FTS5 table from the product and category tables in a
+    single INSERT ... SELECT, leaving out soft deleted rows
+    """
+    if not is_supported(using):
+        return 0
+    category = Product._meta.get_field('category').related_model
+    with using.cursor() as cursor:
+        cursor.execute('DROP TABLE IF EXISTS {}'.format(TABLE))
+        cursor.execute(CREATE_TABLE)
+        cursor.execute(
+            """
+            INSERT INTO {table} (product_id, category_id, name, description, category)
+            SELECT p.id, p.category_id, p.name, COALESCE(p.description, ''), c.name
+            FROM {product} p JOIN {category} c ON c.id = p.category_id
+            WHERE p.deleted_at IS NULL AND c.deleted_at IS NULL
+            """.format(table=TABLE,
+                       product=Product._meta.db_table,
+                       category=category._meta.db_table))
+        count = cursor.rowcount
+        cursor.execute("INSERT INTO {0} ({0}) VALUES ('optimize')".format(TABLE))
+    return count
+
+
+def index_products(products, using=connection, new=False):
+    """
+    Inserts or replaces the search rows of the given products
+
+    Args:
+        products (iterable): Product instances with their category loaded
+        new (bool): whether the products were just created and cannot
+            have rows yet, which skips deleting their old rows
+    """
+    if not is_supported(using):
+        return
+    products = list(products)
+    if not new:
+        remove_products([product.pk for product in products], using=using)
+    with using.cursor() as cursor:
+        cursor.executemany(
+            'INSERT INTO {} (product_id, category_id, name, description, category) '
+            'VALUES (%s, %s, %s, %s, %s)'.format(TABLE),
+            [(product.pk.hex, product.category_id.hex, product.name,
+              product.description or '', product.category.name)
+             for product in products])
+
+
+def remove_products(product_ids, using=connection):
+    """
+    Deletes the search rows of the given product ids
+    """
+    if not is_supported(using):
+        return
+    product_ids = list(product_ids)
+    with using.cursor() as cursor:
+        for start in range(0, len(product_ids), REMOVE_BATCH_SIZE):
+            cursor.execute(
+                'DELETE FROM {0} WHERE rowid IN '
+                '(SELECT rowid FROM {0} WHERE {0} MATCH %s)'.format(TABLE),
+                [_ids_match('product_id', product_ids[start:start + REMOVE_BATCH_SIZE])])
+
+
+def rename_category(category, using=connection):
+    """
+    Updates the category name stored in the search rows of its products
+    """
+    if not is_supported(using):
+        return
+    with using.cursor() as cursor:
+        cursor.execute(
+            'UPDATE {0} SET category = %s WHERE rowid IN '
+            '(SELECT rowid FROM {0} WHERE {0} MATCH %s)'.format(TABLE),
+            [category.name, _id_match('category_id', category.pk)])
+
+
+def search_ids(text, limit, offset=0, using=connection):
+    """
+    Returns the ids of the best matching products, best first
+
+    Args:
+        text (str): raw search input
+        limit (int): maximum number of ids
+        offset (int): number of ids to skip
+    """
+    query = build_query(text)
+    if query is None:
+        return []
+    if not is_supported(using):
+        return list(icontains_queryset(text).values_list('pk', flat=True)
+                    [offset:offset + limit])
+    with using.cursor() as cursor:
+        cursor.execute(
+            'SELECT product_id FROM {0} WHERE {0} MATCH %s '
+            'ORDER BY {1} LIMIT %s OFFSET %s'.format(TABLE, RANK),
+            [query, limit, offset])
+        return [UUID(row[0]) for row in cursor.fetchall()]
+
+
+def icontains_queryset(text):
+    """
+    Returns products matching every word of ``text`` with LIKE scans,
+    the behaviour full-text search replaces
+    """
+    queryset = Product.objects.all()
+    for token in TOKEN_RE.findall(text):
+        queryset = queryset.filter(Q(name__icontains=token) |
+                                   Q(description__icontains=token) |
+                                   Q(category__name__icontains=token))
+    return queryset
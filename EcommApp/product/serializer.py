@@ -1,3 +1,6 @@
+from decimal import Decimal
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
 from rest_framework import serializers
 from .models import (Product,
                      Category,
@@ -14,12 +17,14 @@ class CategorySerializer(serializers.Serializer):
         name (CharField): name of the category
         description (TextField): description of the category
         image (ImageField): image of the category
+        total_products (IntegerField): number of products in the category
         created_at (DateTimeField): date and time the category was created
         updated_at (DateTimeField): date and time the category was updated
     """
     id = serializers.UUIDField(read_only=True)
     name = serializers.CharField(max_length=150)
-    description = serializers.TextField()
+    description = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+    total_products = serializers.IntegerField(source='product_count', read_only=True)
     created_at = serializers.DateTimeField(read_only=True)
     updated_at = serializers.DateTimeField(read_only=True)
 
@@ -53,13 +58,24 @@ class ProductSerializer(serializers.Serializer):
     """
     id  = serializers.UUIDField(read_only=True)
     name = serializers.CharField(max_length=255)
-    description = serializers.TextField()
+    description = serializers.CharField(required=False, allow_blank=True, allow_null=True)
     price = serializers.DecimalField(max_digits=10, decimal_places=2)
     category = serializers.StringRelatedField()
     created_at = serializers.DateTimeField(read_only=True)
     updated_at = serializers.DateTimeField(read_only=True)
     user = serializers.StringRelatedField()
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """
+        Joins the related rows rendered by the serializer so that
+        serializing many products does not run one query per row
+
+        Args:
+            queryset (QuerySet): product queryset to be serialized
+        """
+        return queryset.select_related('user', 'category')
+
     def create(self, validated_data):
         """
         method to create a product
@@ -71,10 +87,123 @@ class ProductSerializer(serializers.Serializer):
     def update(self, instance, validated_data):
         """
         Updates the object based on the request data
+
+        Only the given fields are written, stock is changed through
+        product.reservations.
         """
-        for attr, value in validated_data:
+        for attr, value in validated_data.items():
             setattr(instance, attr, value)
-        instance.save()
+        instance.save(update_fields=[*validated_data, 'updated_at'])
+        return instance
+
+class ProductListSerializer:
+    """
+    Read-only fast path for product list pages
+
+    Reads only the rendered columns, with the seller's email joined in, as
+    named rows instead of model instances, and formats them with plain
+    functions instead of the DRF field pipeline. The values are formatted
+    to strings up front, so the stdlib C JSON encoder writes them without
+    calling back into the encoder's ``default``. The representation is
+    the one of ProductSerializer, field by field, and the encoded
+    response is byte for byte the same.
+    """
+    # the seller's updated_at is not rendered, the page validators read it
+    fields = ('id', 'name', 'description', 'price', 'category_id',
+              'created_at', 'updated_at', 'user__email', 'user__updated_at')
+    cent = Decimal('0.01')
+
+    @classmethod
+    def setup_queryset(cls, queryset):
+        """
+        Returns the rows to serialize, keeping the queryset filters
+
+        Args:
+            queryset (QuerySet): product queryset
+        """
+        return queryset.values_list(*cls.fields, named=True)
+
+    @classmethod
+    def serializer(cls):
+        """
+        Returns a function turning one row into its representation
+        """
+        tz = timezone.get_current_timezone()
+        cent = cls.cent
+
+        def datetime(value):
+            value = value.astimezone(tz).isoformat()
+            return value[:-6] + 'Z' if value.endswith('+00:00') else value
+
+        def serialize(row):
+            description = row.description
+            return {'id': str(row.id),
+                    'name': str(row.name),
+                    'description': None if description is None else str(description),
+                    'price': f'{row.price.quantize(cent):f}',
+                    # str() of a Category (Basemodel.__str__) and of a user
+                    # (its email), as rendered by StringRelatedField
+                    'category': 'Category - {}'.format(row.category_id),
+                    'created_at': datetime(row.created_at),
+                    'updated_at': datetime(row.updated_at),
+                    'user': row.user__email}
+        return serialize
+
+    @classmethod
+    def many(cls, rows):
+        """
+        Returns the representation of a list of rows
+        """
+        serialize = cls.serializer()
+        return [serialize(row) for row in rows]
+
+class ProductImportSerializer(serializers.Serializer):
+    """
+    Validates one row of a bulk product import
+
+    Attributes:
+        name (CharField): name of the product
+        description (CharField): description of the product
+        price (DecimalField): price of the product
+        quantity (IntegerField): quantity in stock
+        category (CharField): name of an existing category
+    """
+    name = serializers.CharField(max_length=150)
+    description = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+    price = serializers.DecimalField(max_digits=10, decimal_places=2)
+    quantity = serializers.IntegerField(min_value=1, max_value=32767)
+    category = serializers.CharField(max_length=150)
+
+class WishlistItemsSerializer(serializers.Serializer):
+    """
+    Validates a batch wishlist add or remove
+
+    Attributes:
+        products (ListField): ids of the products to add or remove
+    """
+    products = serializers.ListField(child=serializers.UUIDField(),
+                                     allow_empty=False,
+                                     max_length=100)
+
+class ReservationItemSerializer(serializers.Serializer):
+    """
+    Validates one product of a stock reservation
+
+    Attributes:
+        product (UUIDField): id of the product
+        quantity (IntegerField): number of units to hold
+    """
+    product = serializers.UUIDField()
+    quantity = serializers.IntegerField(min_value=1, max_value=32767)
+
+class ReservationSerializer(serializers.Serializer):
+    """
+    Validates a stock reservation request
+
+    Attributes:
+        items (ListField): products and quantities to hold
+    """
+    items = ReservationItemSerializer(many=True, allow_empty=False, max_length=100)
 
 class ReviewSerializer(serializers.Serializer):
     """
@@ -92,11 +221,22 @@ class ReviewSerializer(serializers.Serializer):
     id = serializers.UUIDField(read_only=True)
     product = serializers.StringRelatedField()
     user = serializers.StringRelatedField()
-    rating = serializers.PositiveSmallIntegerField()
-    comment = serializers.TextField()
+    rating = serializers.IntegerField(min_value=1, max_value=5)
+    comment = serializers.CharField(source='review', required=False, allow_blank=True, allow_null=True)
     created_at = serializers.DateTimeField(read_only=True)
     updated_at = serializers.DateTimeField(read_only=True)
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """
+        Joins the author and product rendered by the serializer so that
+        serializing many reviews does not run queries per row
+
+        Args:
+            queryset (QuerySet): review queryset to be serialized
+        """
+        return queryset.select_related('user', 'product')
+
     def create(self, validated_data):
         """
         method to create a review
@@ -110,9 +250,10 @@ class ReviewSerializer(serializers.Serializer):
         """
         Updates the object based on the request data
         """
-        for attr, value in validated_data:
+        for attr, value in validated_data.items():
             setattr(instance, attr, value)
         instance.save()
+        return instance
 
     def validate(self, attrs):
         """
@@ -124,9 +265,18 @@ class ReviewSerializer(serializers.Serializer):
         product = self.context.get('product_pk')
         user = self.context.get('user_pk')
 
-        if self.context["request"].method == "POST":
-            if Review.objects.filter(product=product, user=user).exists():
-                raise serializers.ValidationError("You have already reviewed this product")
-        
-        if not Product.objects.filter(pk=product).exists():
-            raise serializers.ValidationError("Product does not exist")
\ No newline at end of file
+        # the product and previous review lookups are independent, so run
+        # them as one query instead of two round trips
+        target = (Product.objects.filter(pk=product)
+                  .annotate(already_reviewed=Exists(
+                      Review.objects.filter(product=OuterRef('pk'), user=user)))
+                  .values('already_reviewed')
+                  .first())
+
+        if target is None:
+            raise serializers.ValidationError("Product does not exist")
+
+        if self.context["request"].method == "POST" and target['already_reviewed']:
+            raise serializers.ValidationError("You have already reviewed this product")
+
+        return attrs
\ No newline at end of file
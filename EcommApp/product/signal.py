@@ -0,0 +1,216 @@
+from functools import partial
+from django.db import connections, transaction
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_save
+from django.dispatch import receiver
+from product import search
+from product.snapshot import mark_stale
+from product.models import Category, Leaderboard, Product, Review
+from product.tasks import (purge_deleted,
+                           sync_category_name,
+                           sync_search,
+                           unindex_products,
+                           update_leaderboards,
+                           )
+from shared_model.basemodel import soft_deleted
+from shared_model.cache import bump_version
+from shared_model.purging import purging
+from tasks.queue import enqueue
+from user.models import User
+
+def invalidate_rating_summary(product_id):
+    """
+    Marks the cached rating summary of a product as stale once the
+    transaction commits
+    """
+    transaction.on_commit(partial(bump_version, 'ratings', product_id))
+
+@receiver(pre_save, sender=Review)
+def load_stored_rating(sender, instance, raw=False, **kwargs):
+    """
+    Signal to read the stored product and rating of a review loaded
+    without them (only() or defer()), so that update_product_rating
+    moves the aggregates from the right values
+    """
+    if raw or instance._state.adding or hasattr(instance, '_loaded_rating'):
+        return
+    stored = (Review.all_objects.filter(pk=instance.pk)
+                                .values_list('product_id', 'rating').first())
+    if stored is not None:
+        instance._loaded_rating = stored
+
+@receiver(post_save, sender=Review)
+def update_product_rating(sender, instance, created, raw=False, **kwargs):
+    """
+    Signal to keep the product rating aggregates in step with its reviews
+    """
+    if raw:
+        return
+    current = (instance.product_id, instance.rating)
+    previous = None if created else getattr(instance, '_loaded_rating', current)
+    if previous != current:
+        if previous is not None:
+            Product.add_rating(*previous, delta=-1)
+            invalidate_rating_summary(previous[0])
+        Product.add_rating(*current)
+        invalidate_rating_summary(current[0])
+        product_ids = {str(current[0])} | ({str(previous[0])} if previous else set())
+        enqueue(update_leaderboards, product_ids=sorted(product_ids))
+    instance._loaded_rating = current
+
+@receiver(post_delete, sender=Review)
+def remove_product_rating(sender, instance, **kwargs):
+    """
+    Signal to remove a deleted review from the product rating aggregates
+    """
+    if purging(Product):
+        # the product is deleted in the same purge
+        return
+    product_id, rating = getattr(instance, '_loaded_rating',
+                                 (instance.product_id, instance.rating))
+    Product.add_rating(product_id, rating, delta=-1)
+    invalidate_rating_summary(product_id)
+    enqueue(update_leaderboards, product_ids=[str(product_id)])
+
+@receiver(post_save, sender=Product)
+def rank_product(sender, instance, raw=False, **kwargs):
+    """
+    Signal to queue moving a saved product on the category leaderboards,
+    connected before update_category_count, which forgets the category
+    the product is leaving
+    """
+    if raw:
+        return
+    previous = getattr(instance, '_loaded_category_id', None)
+    left = [str(previous)] if previous not in (None, instance.category_id) else []
+    enqueue(update_leaderboards, product_ids=[str(instance.pk)], category_ids=left)
+
+@receiver(post_save, sender=Product)
+def update_category_count(sender, instance, created, raw=False, **kwargs):
+    """
+    Signal to keep the category product count in step with its products
+    """
+    if raw:
+        return
+    previous = None if created else getattr(instance, '_loaded_category_id',
+                                            instance.category_id)
+    if previous != instance.category_id:
+        if previous is not None:
+            Category.add_products(previous, delta=-1)
+        Category.add_products(instance.category_id)
+    instance._loaded_category_id = instance.category_id
+
+@receiver(post_delete, sender=Product)
+def remove_category_count(sender, instance, **kwargs):
+    """
+    Signal to remove a deleted product from its category product count
+    and leaderboards
+    """
+    if instance.deleted_at is not None:
+        # counted out when it was soft deleted, or its category is gone
+        return
+    category_id = getattr(instance, '_loaded_category_id', instance.category_id)
+    Category.add_products(category_id, delta=-1)
+    enqueue(update_leaderboards, product_ids=[str(instance.pk)],
+            category_ids=[str(category_id)])
+
+@receiver(post_delete, sender=Product)
+def invalidate_deleted_product(sender, instance, **kwargs):
+    """
+    Signal to drop cached payloads of deleted products, including those
+    removed through a cascade
+    """
+    # Django clears instance.pk after the delete, so bind it now
+    transaction.on_commit(partial(bump_version, 'product', instance.pk))
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, raw=False, **kwargs):
+    """
+    Signal to queue writing a saved product to the full-text search table
+    """
+    if not raw:
+        enqueue(sync_search, product_id=str(instance.pk))
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    """
+    Signal to queue removing a deleted product from the full-text search
+    table
+    """
+    if purging(Product):
+        # already a background job, removed in the purge batch transaction
+        search.remove_products([instance.pk])
+    else:
+        enqueue(sync_search, product_id=str(instance.pk))
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def mark_snapshot_stale(sender, instance, raw=False, update_fields=None, **kwargs):
+    """
+    Signal to mark the catalog snapshot stale once a saved or deleted
+    product is committed, whatever wrote it
+    """
+    if raw or (update_fields is not None and update_fields <= {'quantity'}):
+        # the snapshot does not render stock
+        return
+    transaction.on_commit(mark_stale)
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def mark_snapshot_stale_for_seller(sender, instance, created=False, raw=False,
+                                   update_fields=None, **kwargs):
+    """
+    Signal to mark the catalog snapshot stale once a change to a seller,
+    whose email the snapshot renders, is committed
+    """
+    if raw or created or (update_fields is not None and 'email' not in update_fields):
+        # new users sell nothing yet, logins only write last_login
+        return
+    transaction.on_commit(mark_stale)
+
+@receiver(post_save, sender=Category)
+def reindex_category_name(sender, instance, created, raw=False, **kwargs):
+    """
+    Signal to queue updating the category name stored in the search table
+    """
+    if not created and not raw:
+        enqueue(sync_category_name, category_id=str(instance.pk))
+
+@receiver(soft_deleted, sender=Product)
+def hide_product(sender, instance, **kwargs):
+    """
+    Signal to count a soft deleted product out of its category, drop it
+    from search and the leaderboards, queue its purge and mark the
+    catalog snapshot stale
+    """
+    category_id = getattr(instance, '_loaded_category_id', instance.category_id)
+    Category.add_products(category_id, delta=-1)
+    enqueue(sync_search, product_id=str(instance.pk))
+    enqueue(update_leaderboards, product_ids=[str(instance.pk)],
+            category_ids=[str(category_id)])
+    enqueue(purge_deleted)
+    transaction.on_commit(mark_stale)
+
+@receiver(soft_deleted, sender=Category)
+def hide_category(sender, instance, **kwargs):
+    """
+    Signal to hide the products of a soft deleted category in one UPDATE,
+    drop them from search and the category leaderboards, queue their
+    purge and mark the catalog snapshot stale
+    """
+    products = Product.objects.filter(category_id=instance.pk)
+    product_ids = [str(pk) for pk in products.values_list('pk', flat=True)]
+    products.update(deleted_at=instance.deleted_at, updated_at=instance.deleted_at)
+    if product_ids:
+        enqueue(unindex_products, product_ids=product_ids)
+    # the boards of the category only hold its products
+    Leaderboard.objects.filter(category_id=instance.pk).delete()
+    enqueue(purge_deleted)
+    transaction.on_commit(mark_stale)
+
+@receiver(post_migrate)
+def create_search_table(sender, using, **kwargs):
+    """
+    Signal to create the full-text search table after migrate
+    """
+    if sender.name == 'product':
+        search.create_table(connections[using])
@@ -0,0 +1,275 @@
+"""
+Catalog snapshot served from a memory-mapped file
+
+The build_catalog_snapshot command writes every listed product, rendered
+once as the JSON the product list returns, into one file laid out as:
+
+* a header (HEADER)
+* the JSON of each product, in ``(created_at, id)`` order
+* a position index, one POSITION entry per product in the same order,
+  which keyset pages are found in by binary search
+* an id index, one BY_ID entry per product sorted by id, for lookups
+
+Each worker maps the file read-only and answers anonymous list pages and
+product lookups by slicing the map, without touching the database. A
+rebuild writes a new file and renames it over the old one, so a worker
+keeps reading the file it has mapped until it notices the new one.
+
+Writes to products and their sellers (see product.signal) and bulk
+imports mark the snapshot stale by setting the modification time of a
+marker file next to it (``<path>.stale``) to the commit time. A snapshot
+built before that time is not served, requests go to the database until
+the next build.
+"""
+import bisect
+import json
+import mmap
+import os
+import struct
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+from uuid import UUID
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from .pagination import PaginationError, decode_cursor, make_page
+
+MAGIC = b'ECSNAP02'
+# magic, product count, position index offset, id index offset, build
+# start in nanoseconds since the epoch
+HEADER = struct.Struct('<8sQQQq')
+# created_at, updated_at and the seller's updated_at in microseconds since
+# the epoch, id, offset and length of the product JSON
+POSITION = struct.Struct('<qqq16sQI')
+# id, number of the product in the position index
+BY_ID = struct.Struct('<16sI')
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+SnapshotRow = namedtuple('SnapshotRow', ['id', 'created_at', 'updated_at', 'user__updated_at',
+                                         'offset', 'length'])
+
+
+class SnapshotError(ValueError):
+    """
+    Raised when a file is not a catalog snapshot
+    """
+
+
+def _microseconds(value):
+    return (value - EPOCH) // MICROSECOND
+
+
+def _datetime(value):
+    return EPOCH + value * MICROSECOND
+
+
+def marker_path(path):
+    return '{}.stale'.format(path)
+
+
+def mark_stale(path=None):
+    """
+    Marks the snapshot as stale as of now, call it once the write that
+    changed the catalog has committed
+
+    Args:
+        path (str): snapshot file, defaults to CATALOG_SNAPSHOT_PATH
+    """
+    path = path or getattr(settings, 'CATALOG_SNAPSHOT_PATH', None)
+    if not path:
+        return
+    marker = marker_path(path)
+    now = time.time_ns()
+    with open(marker, 'a'):
+        pass
+    # set explicitly, the file system clock may lag behind time.time_ns()
+    os.utime(marker, ns=(now, now))
+
+
+def stale_since(path):
+    """
+    Returns when the catalog last changed in nanoseconds since the epoch,
+    None if it was never marked stale
+    """
+    try:
+        return os.stat(marker_path(path)).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def write(path, rows, serialize):
+    """
+    Writes a snapshot of the given rows and swaps it in, returns the
+    number of products written
+
+    The build start is recorded before ``rows`` is read, so a write that
+    commits while the rows are being read leaves the snapshot stale.
+
+    Args:
+        path (str): snapshot file
+        rows (iterable): rows with ``id``, ``created_at``, ``updated_at``
+            and ``user__updated_at`` in ``(created_at, id)`` order
+        serialize (callable): turns one row into its list representation
+    """
+    built_at = time.time_ns()
+    temporary = '{}.{}.tmp'.format(path, os.getpid())
+    positions = bytearray()
+    ids = []
+    try:
+        with open(temporary, 'wb') as file:
+            file.write(bytes(HEADER.size))
+            offset = HEADER.size
+            for number, row in enumerate(rows):
+                data = json.dumps(serialize(row), cls=DjangoJSONEncoder).encode()
+                file.write(data)
+                positions += POSITION.pack(_microseconds(row.created_at),
+                                           _microseconds(row.updated_at),
+                                           _microseconds(row.user__updated_at),
+                                           row.id.bytes, offset, len(data))
+                ids.append((row.id.bytes, number))
+                offset += len(data)
+            file.write(positions)
+            ids.sort()
+            file.write(b''.join(BY_ID.pack(*entry) for entry in ids))
+            file.seek(0)
+            file.write(HEADER.pack(MAGIC, len(ids), offset,
+                                   offset + len(positions), built_at))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, path)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+    return len(ids)
+
+
+class Snapshot:
+    """
+    Read-only view of a snapshot file mapped into memory
+    """
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            self.inode = os.fstat(file.fileno()).st_ino
+            self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.path = path
+        if len(self.data) < HEADER.size:
+            raise SnapshotError("{} is not a catalog snapshot".format(path))
+        magic, self.count, self.positions, self.ids, self.built_at = HEADER.unpack_from(self.data)
+        if magic != MAGIC:
+            raise SnapshotError("{} is not a catalog snapshot".format(path))
+
+    def is_stale(self):
+        changed = stale_since(self.path)
+        return changed is not None and changed >= self.built_at
+
+    def row(self, number):
+        created_at, updated_at, seller_updated_at, pk, offset, length = POSITION.unpack_from(
+            self.data, self.positions + number * POSITION.size)
+        return SnapshotRow(UUID(bytes=pk), _datetime(created_at), _datetime(updated_at),
+                           _datetime(seller_updated_at), offset, length)
+
+    def _key(self, number):
+        created_at, _, _, pk, _, _ = POSITION.unpack_from(
+            self.data, self.positions + number * POSITION.size)
+        return created_at, pk
+
+    def payload(self, row):
+        """
+        Returns the JSON of a product as bytes
+        """
+        return self.data[row.offset:row.offset + row.length]
+
+    def get(self, pk):
+        """
+        Returns the JSON of the product with the given id as bytes, None
+        when it is not in the snapshot
+
+        Args:
+            pk (UUID): id of the product
+        """
+        key = pk.bytes
+        number = bisect.bisect_left(range(self.count), key, key=self._id_at)
+        if number == self.count or self._id_at(number) != key:
+            return None
+        _, position = BY_ID.unpack_from(self.data, self.ids + number * BY_ID.size)
+        return self.payload(self.row(position))
+
+    def _id_at(self, number):
+        return BY_ID.unpack_from(self.data, self.ids + number * BY_ID.size)[0]
+
+    def page(self, cursor=None, page_size=20):
+        """
+        Returns the same Page as product.pagination.paginate over the
+        snapshotted products, with SnapshotRow items
+
+        Args:
+            cursor (str): cursor returned with a previous page, may be None
+            page_size (int): maximum number of rows on the page
+        """
+        start, reverse = 0, False
+        if cursor:
+            created_at, pk, reverse = decode_cursor(cursor)
+            try:
+                key = (_microseconds(created_at), pk.bytes)
+            except TypeError as exc:
+                raise PaginationError("Invalid cursor") from exc
+            positions = range(self.count)
+            if reverse:
+                start = bisect.bisect_left(positions, key, key=self._key)
+            else:
+                start = bisect.bisect_right(positions, key, key=self._key)
+        if reverse:
+            numbers = range(start - 1, max(start - page_size - 1, 0) - 1, -1)
+        else:
+            numbers = range(start, min(start + page_size + 1, self.count))
+        return make_page([self.row(number) for number in numbers], cursor, page_size, reverse)
+
+    def page_body(self, page):
+        """
+        Returns the JSON body of a product list page as bytes, byte for
+        byte the one JsonResponse writes for the same page
+        """
+        return b''.join((b'{"results": [',
+                         b', '.join(self.payload(row) for row in page.items),
+                         b'], "next": ', json.dumps(page.next).encode(),
+                         b', "previous": ', json.dumps(page.previous).encode(),
+                         b'}'))
+
+
+_opened = None
+
+
+def current():
+    """
+    Returns the mapped snapshot named by CATALOG_SNAPSHOT_PATH, None when
+    it is not configured, not built yet or stale
+
+    The file is mapped again once a rebuild has replaced it.
+    """
+    global _opened
+    path = getattr(settings, 'CATALOG_SNAPSHOT_PATH', None)
+    if not path:
+        return None
+    try:
+        inode = os.stat(path).st_ino
+    except FileNotFoundError:
+        return None
+    snapshot = _opened
+    if snapshot is None or snapshot.path != path or snapshot.inode != inode:
+        snapshot = _opened = Snapshot(path)
+    return None if snapshot.is_stale() else snapshot
+
+
+def lookup(pk):
+    """
+    Returns the serialized product with the given id from the current
+    snapshot, None when the snapshot cannot answer
+
+    Args:
+        pk (UUID): id of the product
+    """
+    snapshot = current()
+    payload = snapshot.get(pk) if snapshot is not None else None
+    return json.loads(payload) if payload is not None else None
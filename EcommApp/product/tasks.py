@@ -0,0 +1,61 @@
+from uuid import UUID
+from product import leaderboards, search
+from product.models import Category, Product
+from shared_model.purging import purge
+from tasks.queue import task
+
+@task()
+def sync_search(product_id):
+    """
+    Task to write a product to the full-text search table, or remove it
+    when it no longer exists
+    """
+    product = Product.objects.select_related('category').filter(pk=product_id).first()
+    if product is None:
+        search.remove_products([UUID(product_id)])
+    else:
+        search.index_products([product])
+
+@task()
+def unindex_products(product_ids):
+    """
+    Task to remove hidden products from the full-text search table
+    """
+    search.remove_products([UUID(product_id) for product_id in product_ids])
+
+@task()
+def sync_category_name(category_id):
+    """
+    Task to update the category name stored in the search table
+    """
+    category = Category.objects.filter(pk=category_id).first()
+    if category is not None:
+        search.rename_category(category)
+
+@task(atomic=False)
+def purge_deleted(batch_size=200):
+    """
+    Task to remove soft deleted categories and products with everything
+    depending on them, committing one batch at a time
+    """
+    for model in (Category, Product):
+        purge(model, batch_size=batch_size)
+
+@task()
+def update_leaderboards(product_ids, category_ids=()):
+    """
+    Task to move changed products to their place on the leaderboards of
+    their category, and off those of the categories they left
+    """
+    leaderboards.update(product_ids, category_ids)
+
+@task(worker_only=True)
+def refresh_related(product_ids):
+    """
+    Task to recompute the related products a wishlist change of the given
+    products can move
+    """
+    # NumPy and SciPy are loaded by the run_tasks worker only, the task
+    # is not run by the thread pool of the web processes
+    from product import recommendations
+    recommendations.refresh(product_ids)
@@ -1,8 +1,43 @@
+from django.conf import settings
 from django.urls import path
-from .views import list_create, retrieve_update_delete
+from .views import (alist_create,
+                    aretrieve_update_delete,
+                    bulk_import,
+                    category_leaderboard,
+                    category_list,
+                    facets,
+                    list_create,
+                    product_reviews,
+                    related_products,
+                    reservation_create,
+                    reservation_update,
+                    retrieve_update_delete,
+                    search,
+                    wishlist_items,
+                    )
+
+# Under ASGI the async views avoid a thread hop per request
+if getattr(settings, 'PRODUCT_ASYNC_VIEWS', False):
+    list_view, detail_view = alist_create, aretrieve_update_delete
+else:
+    list_view, detail_view = list_create, retrieve_update_delete
 
 urlpatterns = [
-    path("products?", list_create, name="list_create"),
-    path("products/<str:pk>", retrieve_update_delete,
+    path("products", list_view, name="list_create"),
+    path("products/import", bulk_import, name="bulk_import"),
+    path("products/search", search, name="search"),
+    path("products/facets", facets, name="facets"),
+    path("products/<str:pk>", detail_view,
                               name="retrieve_update_delete"),
+    path("products/<str:pk>/reviews", product_reviews, name="product_reviews"),
+    path("products/<str:pk>/related", related_products, name="related_products"),
+    path("categories", category_list, name="category_list"),
+    path("categories/<str:pk>/leaderboards/<str:board>", category_leaderboard,
+         name="category_leaderboard"),
+    path("wishlist/items", wishlist_items, name="wishlist_items"),
+    path("reservations", reservation_create, name="reservation_create"),
+    path("reservations/<str:pk>/confirm", reservation_update,
+         {"action": "confirm"}, name="reservation_confirm"),
+    path("reservations/<str:pk>/release", reservation_update,
+         {"action": "release"}, name="reservation_release"),
 ]
@@ -1,23 +1,154 @@
+import codecs
+from uuid import UUID
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.utils.http import parse_header_parameters
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.exceptions import APIException
+from rest_framework.parsers import JSONParser
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
 from .models import (Product,
                      Category,
+                     RelatedProduct,
                      Review,
-                     Wishlist,
                      ) 
 from user.models import User
-from serializer import ProductSerializer
+from EcommApp.metrics import timed_serialization
+from .serializer import (CategorySerializer,
+                         ProductListSerializer,
+                         ProductSerializer,
+                         ReservationSerializer,
+                         ReviewSerializer,
+                         WishlistItemsSerializer,
+                         )
+from .cache import aget_product_payload, get_product_payload, get_rating_summary
+from .importer import import_products
+from . import leaderboards, snapshot
+from .filters import FilterError, facet_counts, filter_products, has_filters
+from .reservations import OutOfStock, confirm, release, reserve
+from .search import search_ids
+from .wishlist import (add_products,
+                       aflags_for,
+                       flags_for,
+                       mark_wishlisted,
+                       remove_products,
+                       set_flags,
+                       )
+from .conditional import (aqueryset_validators,
+                          conditional_response,
+                          page_validators,
+                          payload_validators,
+                          queryset_validators,
+                          set_validators,
+                          )
+from .pagination import (PaginationError,
+                         apaginate,
+                         astream_json_array,
+                         get_page_size,
+                         paginate,
+                         stream_json_array,
+                         )
+
+def list_rows(queryset):
+    """
+    Returns the rows of a product list with the functions serializing one
+    row and a page of rows
+
+    Uses the ProductListSerializer fast path when PRODUCT_FAST_LIST is set.
+    """
+    if getattr(settings, 'PRODUCT_FAST_LIST', False):
+        return (ProductListSerializer.setup_queryset(queryset),
+                ProductListSerializer.serializer(),
+                ProductListSerializer.many)
+    return (ProductSerializer.setup_eager_loading(queryset),
+            lambda product: ProductSerializer(product).data,
+            lambda products: ProductSerializer(products, many=True).data)
+
+def snapshot_for(request, user):
+    """
+    Returns the catalog snapshot when it can answer a product list
+    request, None otherwise
+
+    Pages of signed in users carry wishlist flags and the snapshot holds
+    neither filters nor the streamed export.
+    """
+    if (user.is_authenticated or request.GET.get('stream') in ('1', 'true')
+            or has_filters(request.GET)):
+        return None
+    return snapshot.current()
+
+def snapshot_page_response(request, catalog):
+    """
+    Returns a product list page read from the catalog snapshot, the same
+    response list_create builds from the database
+    """
+    try:
+        page = catalog.page(cursor=request.GET.get('cursor'),
+                            page_size=get_page_size(request.GET.get('limit')))
+    except PaginationError as error:
+        return JsonResponse({'message': str(error)}, status=400)
+    etag, last_modified = page_validators(page)
+    response = conditional_response(request, etag, last_modified)
+    if response is not None:
+        return response
+    with timed_serialization():
+        body = catalog.page_body(page)
+    return set_validators(HttpResponse(body, content_type='application/json'),
+                          etag, last_modified)
 
 @api_view(['GET', 'POST'])
 def list_create(request):
     """
     method for listing and creating products
+
+    GET accepts ``cursor`` and ``limit`` query parameters for keyset
+    pagination, or ``stream=1`` to write out the whole catalog as a
+    streamed JSON array. Pages returned to a signed in user flag the
+    products on their wishlist. The filters of product.filters narrow
+    down both modes. Both answer conditional requests (product.conditional)
+    before serializing anything.
+    Anonymous unfiltered pages are served from the catalog snapshot
+    (product.snapshot) while it is fresh.
     """
     if request.method == 'GET':
-        products = Product.objects.all()
-        serializer = ProductSerializer(products, many=True)
-        return JsonResponse(serializer.data, safe=False)
+        catalog = snapshot_for(request, request.user)
+        if catalog is not None:
+            return snapshot_page_response(request, catalog)
+        try:
+            products, serialize, serialize_many = list_rows(
+                filter_products(Product.objects.all(), request.GET))
+        except FilterError as error:
+            return JsonResponse({'message': str(error)}, status=400)
+        if request.GET.get('stream') in ('1', 'true'):
+            etag, last_modified = queryset_validators(products)
+            response = conditional_response(request, etag, last_modified)
+            if response is not None:
+                return response
+            rows = stream_json_array(products.order_by('created_at', 'id'), serialize)
+            return set_validators(StreamingHttpResponse(rows, content_type='application/json'),
+                                  etag, last_modified)
+        try:
+            page = paginate(products,
+                            cursor=request.GET.get('cursor'),
+                            page_size=get_page_size(request.GET.get('limit')))
+        except PaginationError as error:
+            return JsonResponse({'message': str(error)}, status=400)
+        wishlisted = flags_for(request.user, [row.id for row in page.items])
+        etag, last_modified = page_validators(page, wishlisted)
+        response = conditional_response(request, etag, last_modified)
+        if response is not None:
+            return response
+        with timed_serialization():
+            results = serialize_many(page.items)
+        return set_validators(JsonResponse({'results': set_flags(results, wishlisted),
+                                            'next': page.next,
+                                            'previous': page.previous}),
+                              etag, last_modified)
     elif request.method == 'POST':
         data = JSONParser().parse(request)
         serializer = ProductSerializer(data=data)
@@ -25,22 +156,243 @@ def list_create(request):
             serializer.save()
             return JsonResponse(serializer.data, status=201)
         return JsonResponse(serializer.errors, status=400)
-    
+
+@api_view(['GET'])
+def search(request):
+    """
+    method for full-text searching products by name, description and
+    category name
+
+    Takes the search text in ``q`` and returns the best matches first,
+    ``limit`` and ``offset`` select the page of results.
+    """
+    try:
+        page_size = get_page_size(request.GET.get('limit'))
+        offset = int(request.GET.get('offset') or 0)
+    except (PaginationError, ValueError):
+        return JsonResponse({'message': 'Invalid limit or offset'}, status=400)
+    if offset < 0:
+        return JsonResponse({'message': 'Invalid limit or offset'}, status=400)
+
+    ids = search_ids(request.GET.get('q', ''), page_size, offset)
+    products = ProductSerializer.setup_eager_loading(Product.objects).in_bulk(ids)
+    ranked = [products[pk] for pk in ids if pk in products]
+    with timed_serialization():
+        serializer = ProductSerializer(ranked, many=True)
+        results = serializer.data
+    return JsonResponse({'results': mark_wishlisted(results, request.user)})
+
+@api_view(['GET'])
+def facets(request):
+    """
+    method returning product counts per category and per price bucket
+
+    Takes the same filters as the product list, the counts cover the
+    products matching them.
+    """
+    try:
+        products = filter_products(Product.objects.all(), request.GET)
+    except FilterError as error:
+        return JsonResponse({'message': str(error)}, status=400)
+    return JsonResponse(facet_counts(products))
+
+IMPORT_CONTENT_TYPES = {
+    'text/csv': 'csv',
+    'application/x-ndjson': 'jsonl',
+    'application/jsonl': 'jsonl',
+}
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def bulk_import(request):
+    """
+    method for importing many products at once for the requesting user
+
+    The body is CSV (``text/csv``, with a header row) or JSON lines
+    (``application/x-ndjson``), in the encoding named by the ``charset``
+    parameter (UTF-8 by default), and is read line by line. Lines that do
+    not decode are reported as malformed rows.
+    """
+    media_type, params = parse_header_parameters(request.content_type or '')
+    fmt = IMPORT_CONTENT_TYPES.get(media_type.lower())
+    encoding = params.get('charset', 'utf-8')
+    try:
+        codecs.lookup(encoding)
+    except LookupError:
+        fmt = None
+    if fmt is None:
+        return JsonResponse({'message': 'Unsupported content type'}, status=415)
+    stream = request.stream
+    lines = iter(stream.readline, b'') if stream else ()
+    report = import_products(lines, request.user, fmt, encoding=encoding)
+    status = 201 if report.created else 400
+    return JsonResponse(report.as_dict(), status=status)
+
+@api_view(['GET'])
+def category_list(request):
+    """
+    method for listing categories with their product counts
+
+    The counts are read from the stored counter, so the product table is
+    not touched. Accepts the same ``cursor`` and ``limit`` parameters as
+    the product list.
+    """
+    try:
+        page = paginate(Category.objects.all(),
+                        cursor=request.GET.get('cursor'),
+                        page_size=get_page_size(request.GET.get('limit')))
+    except PaginationError as error:
+        return JsonResponse({'message': str(error)}, status=400)
+    with timed_serialization():
+        serializer = CategorySerializer(page.items, many=True)
+        return JsonResponse({'results': serializer.data,
+                             'next': page.next,
+                             'previous': page.previous})
+
+@api_view(['GET'])
+def category_leaderboard(request, pk, board):
+    """
+    method listing the best products of a category on one leaderboard
+
+    ``board`` is one of product.leaderboards.BOARDS, ``limit`` selects how
+    many products are returned, at most LEADERBOARD_SIZE. The ranking is
+    read from one stored row, however many products the category holds.
+    """
+    try:
+        pk = UUID(pk)
+        if board not in leaderboards.BOARDS or not Category.objects.filter(pk=pk).exists():
+            raise Category.DoesNotExist
+    except (ValueError, Category.DoesNotExist):
+        return JsonResponse({'message': 'The leaderboard does not exist'},
+                            status=404)
+    try:
+        ids = [UUID(pk) for pk in leaderboards.top(pk, board,
+                                                    get_page_size(request.GET.get('limit')))]
+    except PaginationError as error:
+        return JsonResponse({'message': str(error)}, status=400)
+    products = ProductSerializer.setup_eager_loading(Product.objects).in_bulk(ids)
+    ranked = [products[pk] for pk in ids if pk in products]
+    with timed_serialization():
+        results = ProductSerializer(ranked, many=True).data
+    return JsonResponse({'results': mark_wishlisted(results, request.user)})
+
+@api_view(['GET', 'POST', 'DELETE'])
+@permission_classes([IsAuthenticated])
+def wishlist_items(request):
+    """
+    method for listing, adding and removing wishlist products in batches
+
+    GET returns the wishlisted products with the same ``cursor`` and
+    ``limit`` parameters as the product list. POST and DELETE take up to
+    100 product ids as ``{"products": [...]}``, adding products already on
+    the wishlist or removing ones that are not is a no-op.
+    """
+    if request.method == 'GET':
+        products = ProductSerializer.setup_eager_loading(
+            Product.objects.filter(items__wishlist__user_id=request.user.pk).distinct())
+        try:
+            page = paginate(products,
+                            cursor=request.GET.get('cursor'),
+                            page_size=get_page_size(request.GET.get('limit')))
+        except PaginationError as error:
+            return JsonResponse({'message': str(error)}, status=400)
+        with timed_serialization():
+            serializer = ProductSerializer(page.items, many=True)
+            return JsonResponse({'results': serializer.data,
+                                 'next': page.next,
+                                 'previous': page.previous})
+
+    serializer = WishlistItemsSerializer(data=request.data)
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=400)
+    product_ids = serializer.validated_data['products']
+    if request.method == 'POST':
+        return JsonResponse({'added': add_products(request.user.pk, product_ids)})
+    return JsonResponse({'removed': remove_products(request.user.pk, product_ids)})
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def reservation_create(request):
+    """
+    method for holding stock of one or more products
+
+    Takes ``{"items": [{"product": <id>, "quantity": <n>}, ...]}``. Either
+    every item is held or, when one product is short, none is.
+    """
+    serializer = ReservationSerializer(data=request.data)
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=400)
+    items = [(item['product'], item['quantity'])
+             for item in serializer.validated_data['items']]
+    try:
+        reservation = reserve(request.user.pk, items)
+    except OutOfStock as error:
+        return JsonResponse({'message': str(error), 'product': error.product_id},
+                            status=409)
+    return JsonResponse({'id': reservation.pk,
+                         'status': reservation.status,
+                         'expires_at': reservation.expires_at,
+                         'items': [{'product': item.product_id, 'quantity': item.quantity}
+                                   for item in reservation.items.all()]},
+                        status=201)
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def reservation_update(request, pk, action):
+    """
+    method for confirming or releasing a held reservation of the
+    requesting user
+    """
+    try:
+        pk = UUID(pk)
+    except ValueError:
+        return JsonResponse({'message': 'The reservation does not exist'},
+                            status=404)
+    change = confirm if action == 'confirm' else release
+    if not change(pk, user_id=request.user.pk):
+        return JsonResponse({'message': 'The reservation is not held'}, status=409)
+    return JsonResponse({'id': pk, 'status': 'confirmed' if action == 'confirm' else 'released'})
+
+def load_product(pk):
+    """
+    Loads and serializes a product for the product payload cache
+    """
+    product = ProductSerializer.setup_eager_loading(Product.objects).get(pk=pk)
+    dependencies = [('category', product.category_id),
+                    (product.user._meta.model_name, product.user_id)]
+    with timed_serialization():
+        return ProductSerializer(product).data, dependencies
+
+def payload_response(request, payload):
+    """
+    Returns the response for a cached product payload, or a 304 when the
+    client already has it
+    """
+    etag, last_modified = payload_validators(payload)
+    response = conditional_response(request, etag, last_modified)
+    if response is None:
+        response = JsonResponse(payload)
+    return set_validators(response, etag, last_modified)
+
 def retrieve_update_delete(request, pk):
     """
     method for retrieving, updating and deleting products
+
+    GET responses are served from the catalog snapshot while it is fresh,
+    from the product payload cache otherwise, and answer conditional
+    requests.
     """
     try:
-        product = Product.objects.get(pk=pk)
-    except Product.DoesNotExist:
+        pk = UUID(pk)
+        if request.method == 'GET':
+            payload = snapshot.lookup(pk) or get_product_payload(pk, lambda: load_product(pk))
+            return payload_response(request, payload)
+        product = ProductSerializer.setup_eager_loading(Product.objects).get(pk=pk)
+    except (ValueError, Product.DoesNotExist):
         return JsonResponse({'message': 'The product does not exist'},
                             status=404)
     
-    if request.method == 'GET':
-        serializer = ProductSerializer(product)
-        return JsonResponse(serializer.data)
-    
-    elif request.method == 'PUT':
+    if request.method == 'PUT':
         data = JSONParser().parse(request)
         serializer = ProductSerializer(product, data=data)
         if serializer.is_valid():
@@ -49,6 +401,167 @@ def retrieve_update_delete(request, pk):
         return JsonResponse(serializer.errors, status=400)
     
     elif request.method == 'DELETE':
-        product.delete()
+        # hidden at once, shared_model.purging removes it and its
+        # reviews and wishlist items in the background
+        product.soft_delete()
         return JsonResponse({'message': 'Product was deleted successfully'},
-                            status=204)
\ No newline at end of file
+                            status=204)
+
+def load_rating_summary(pk):
+    """
+    Loads the rating summary of a product for the rating summary cache
+    """
+    fields = ['rating_count', 'rating_sum'] + ['rating_{}'.format(rating)
+                                               for rating in range(1, 6)]
+    return Product.objects.only(*fields).get(pk=pk).rating_summary()
+
+@api_view(['GET'])
+def product_reviews(request, pk):
+    """
+    method for listing the reviews of a product
+
+    Takes the same ``cursor`` and ``limit`` parameters as the product
+    list. Every page carries the cached rating summary of the product.
+    """
+    try:
+        pk = UUID(pk)
+        summary = get_rating_summary(pk, lambda: load_rating_summary(pk))
+    except (ValueError, Product.DoesNotExist):
+        return JsonResponse({'message': 'The product does not exist'},
+                            status=404)
+    try:
+        page = paginate(ReviewSerializer.setup_eager_loading(Review.objects.filter(product_id=pk)),
+                        cursor=request.GET.get('cursor'),
+                        page_size=get_page_size(request.GET.get('limit')))
+    except PaginationError as error:
+        return JsonResponse({'message': str(error)}, status=400)
+    with timed_serialization():
+        serializer = ReviewSerializer(page.items, many=True)
+        return JsonResponse({'summary': summary,
+                             'results': serializer.data,
+                             'next': page.next,
+                             'previous': page.previous})
+
+@api_view(['GET'])
+def related_products(request, pk):
+    """
+    method listing the products most often wishlisted with a product,
+    best first, each with its similarity ``score``
+
+    Reads the table product.recommendations precomputes, ``limit``
+    selects how many products are returned.
+    """
+    try:
+        pk = UUID(pk)
+        limit = min(get_page_size(request.GET.get('limit')),
+                    getattr(settings, 'RELATED_PRODUCTS_SIZE', 20))
+    except PaginationError as error:
+        return JsonResponse({'message': str(error)}, status=400)
+    except ValueError:
+        return JsonResponse({'message': 'The product does not exist'},
+                            status=404)
+    scores = dict(RelatedProduct.objects.filter(product_id=pk)
+                                        .order_by('rank')
+                                        .values_list('related_id', 'score')[:limit])
+    if not scores and not Product.objects.filter(pk=pk).exists():
+        return JsonResponse({'message': 'The product does not exist'},
+                            status=404)
+    products = ProductSerializer.setup_eager_loading(Product.objects).in_bulk(scores)
+    ranked = [products[related] for related in scores if related in products]
+    with timed_serialization():
+        results = ProductSerializer(ranked, many=True).data
+    for result, product in zip(results, ranked):
+        result['score'] = round(scores[product.pk], 4)
+    return JsonResponse({'results': mark_wishlisted(results, request.user)})
+
+async def aauthenticate(request):
+    """
+    Returns the user of a request as the DRF views authenticate it, with
+    the REST_FRAMEWORK authenticators
+
+    request.auser() only reads the session, a request carrying an access
+    token would be anonymous. Raises APIException for bad credentials.
+    """
+    authenticated = Request(request, authenticators=[
+        authenticator() for authenticator in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+    return await sync_to_async(lambda: authenticated.user)()
+
+@csrf_exempt
+async def alist_create(request):
+    """
+    async version of list_create for ASGI deployments
+
+    GET runs on the async ORM, POST is handed to list_create, which does
+    its own CSRF checks like every DRF view.
+    """
+    if request.method != 'GET':
+        return await sync_to_async(list_create)(request)
+
+    streaming = request.GET.get('stream') in ('1', 'true')
+    if not streaming:
+        # only pages depend on the user
+        try:
+            user = await aauthenticate(request)
+        except APIException as error:
+            detail = error.detail if isinstance(error.detail, dict) else {'detail': error.detail}
+            return JsonResponse(detail, status=error.status_code)
+        catalog = snapshot_for(request, user)
+        if catalog is not None:
+            return snapshot_page_response(request, catalog)
+    try:
+        products, serialize, serialize_many = list_rows(
+            filter_products(Product.objects.all(), request.GET))
+    except FilterError as error:
+        return JsonResponse({'message': str(error)}, status=400)
+    if streaming:
+        etag, last_modified = await aqueryset_validators(products)
+        response = conditional_response(request, etag, last_modified)
+        if response is not None:
+            return response
+        rows = astream_json_array(products.order_by('created_at', 'id'), serialize)
+        return set_validators(StreamingHttpResponse(rows, content_type='application/json'),
+                              etag, last_modified)
+    try:
+        page = await apaginate(products,
+                               cursor=request.GET.get('cursor'),
+                               page_size=get_page_size(request.GET.get('limit')))
+    except PaginationError as error:
+        return JsonResponse({'message': str(error)}, status=400)
+    wishlisted = await aflags_for(user, [row.id for row in page.items])
+    etag, last_modified = page_validators(page, wishlisted)
+    response = conditional_response(request, etag, last_modified)
+    if response is not None:
+        return response
+    with timed_serialization():
+        results = serialize_many(page.items)
+    return set_validators(JsonResponse({'results': set_flags(results, wishlisted),
+                                        'next': page.next,
+                                        'previous': page.previous}),
+                          etag, last_modified)
+
+async def aload_product(pk):
+    """
+    Async version of load_product
+    """
+    product = await ProductSerializer.setup_eager_loading(Product.objects).aget(pk=pk)
+    dependencies = [('category', product.category_id),
+                    (product.user._meta.model_name, product.user_id)]
+    with timed_serialization():
+        return ProductSerializer(product).data, dependencies
+
+async def aretrieve_update_delete(request, pk):
+    """
+    async version of retrieve_update_delete for ASGI deployments
+
+    GET runs on the async ORM and cache API, PUT and DELETE are handed to
+    retrieve_update_delete.
+    """
+    if request.method != 'GET':
+        return await sync_to_async(retrieve_update_delete)(request, pk)
+    try:
+        pk = UUID(pk)
+        payload = snapshot.lookup(pk) or await aget_product_payload(pk, lambda: aload_product(pk))
+    except (ValueError, Product.DoesNotExist):
+        return JsonResponse({'message': 'The product does not exist'},
+                            status=404)
+    return payload_response(request, payload)
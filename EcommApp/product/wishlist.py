@@ -0,0 +1,134 @@
+"""
+Batch wishlist writes and wishlisted flags for product listings
+
+Every write goes to WishlistItem, whose unique (wishlist, product) index
+makes adds idempotent and backs the single query that tells which
+products of a page the current user has wishlisted. Writes queue the
+refresh of the related products (product.recommendations) they affect.
+"""
+from tasks.queue import enqueue
+from .models import Product, Wishlist, WishlistItem
+from .tasks import refresh_related
+
+
+def add_products(user_id, product_ids):
+    """
+    Adds products to the wishlist of a user and returns the number of
+    products added
+
+    Products that do not exist or are already on the wishlist are left
+    out, and so is a product the unique index skips because a concurrent
+    request added it first.
+
+    Args:
+        user_id (UUID): id of the user
+        product_ids (list): ids of the products to add
+    """
+    wishlist = Wishlist.for_user(user_id)
+    missing = (Product.objects.filter(pk__in=product_ids)
+                              .exclude(items__wishlist=wishlist)
+                              .values_list('pk', flat=True))
+    items = [WishlistItem(wishlist=wishlist, product_id=pk) for pk in missing]
+    if not items:
+        return 0
+    WishlistItem.objects.bulk_create(items, ignore_conflicts=True)
+    # ignore_conflicts reports no skipped rows, the ids generated here
+    # tell the inserted ones
+    added = list(WishlistItem.objects.filter(pk__in=[item.pk for item in items])
+                                     .values_list('product_id', flat=True))
+    if added:
+        enqueue(refresh_related, product_ids=[str(pk) for pk in added])
+    return len(added)
+
+
+def remove_products(user_id, product_ids):
+    """
+    Removes products from every wishlist of a user in one DELETE and
+    returns the number of removed items
+
+    Args:
+        user_id (UUID): id of the user
+        product_ids (list): ids of the products to remove
+    """
+    items = WishlistItem.objects.filter(wishlist__user_id=user_id, product_id__in=product_ids)
+    # only products that were on a wishlist move recommendations
+    product_ids = set(items.values_list('product_id', flat=True))
+    removed, _ = items.delete()
+    if removed:
+        enqueue(refresh_related, product_ids=sorted(str(pk) for pk in product_ids))
+    return removed
+
+
+def wishlisted_ids(user_id, product_ids):
+    """
+    Returns the set of the given product ids wishlisted by a user, in
+    one query
+
+    Args:
+        user_id (UUID): id of the user
+        product_ids (iterable): ids of the products to look up
+    """
+    return set(WishlistItem.objects.filter(wishlist__user_id=user_id,
+                                           product_id__in=product_ids)
+                                   .values_list('product_id', flat=True))
+
+
+async def awishlisted_ids(user_id, product_ids):
+    """
+    Async version of wishlisted_ids
+    """
+    return {pk async for pk in WishlistItem.objects.filter(wishlist__user_id=user_id,
+                                                           product_id__in=product_ids)
+                                                   .values_list('product_id', flat=True)}
+
+
+def flags_for(user, product_ids):
+    """
+    Returns the set of the given product ids wishlisted by the requesting
+    user, or None for an anonymous user
+
+    Args:
+        user (User): requesting user, may be anonymous
+        product_ids (list): ids of the listed products
+    """
+    if not user.is_authenticated:
+        return None
+    return wishlisted_ids(user.pk, product_ids) if product_ids else set()
+
+
+async def aflags_for(user, product_ids):
+    """
+    Async version of flags_for
+    """
+    if not user.is_authenticated:
+        return None
+    return await awishlisted_ids(user.pk, product_ids) if product_ids else set()
+
+
+def set_flags(results, wishlisted):
+    """
+    Sets a ``wishlisted`` flag on serialized products, leaves them
+    untouched when ``wishlisted`` is None
+
+    Args:
+        results (list): serialized products
+        wishlisted (set): ids returned by flags_for
+    """
+    if wishlisted is None:
+        return results
+    wishlisted = {str(pk) for pk in wishlisted}
+    for item in results:
+        item['wishlisted'] = item['id'] in wishlisted
+    return results
+
+
+def mark_wishlisted(results, user):
+    """
+    Sets a ``wishlisted`` flag on serialized products for an
+    authenticated user, leaves them untouched otherwise
+
+    Args:
+        results (list): serialized products
+        user (User): requesting user, may be anonymous
+    """
+    return set_flags(results, flags_for(user, [item['id'] for item in results]))
@@ -4,15 +4,49 @@
     21/01/2025
 """
 
-from uuid import uuid4
 from datetime import datetime, UTC
-from django.db import models
+from django.db import models, transaction
+from django.dispatch import Signal
+from shared_model.cache import bump_version
+from shared_model.ids import uuid7
+
+# Sent with ``sender`` and ``instance`` inside the transaction that soft
+# deletes a row
+soft_deleted = Signal()
+
+
+class SoftDeleteManager(models.Manager):
+    """Manager hiding soft deleted rows"""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
 
 class Basemodel(models.Model):
-    """Basemodel for all models"""
-    id = models.UUIDField(primary_key=True, default=uuid4, editable=False)
+    """Basemodel for all models
+
+    Primary keys are time-ordered (see shared_model.ids), so rows are
+    inserted in primary key order.
+
+    ``objects`` hides soft deleted rows, ``all_objects`` still sees them
+    until shared_model.purging removes them. Forward relation access
+    (``review.product``) goes through the base manager and sees them too,
+    reverse managers (``category.products``, ``product.reviews``) are
+    built on ``objects`` and hide them.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    objects = SoftDeleteManager()
+    all_objects = models.Manager()
+
+    # Denormalized counters kept up to date with F-expression updates.
+    # Saving an existing row leaves them out so a stale instance cannot
+    # overwrite them. Fields deferred with only() or defer() stay out too,
+    # as Django leaves them out of saves of deferred instances.
+    counter_fields = ()
 
     def __str__(self):
         """String representation of the model"""
@@ -21,9 +55,48 @@ class Basemodel(models.Model):
     def save(self, *args, **kwargs):
         """
         Save method
+
+        Saving an existing row writes every field but ``deleted_at``,
+        which only soft_delete() sets, so an instance loaded before the
+        row was soft deleted cannot bring it back.
         """
         self.updated_at = datetime.now(UTC)
+        if (not self._state.adding
+                and kwargs.get('update_fields') is None
+                and not kwargs.get('force_insert')):
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'deleted_at'
+                and field.name not in self.counter_fields
+                and field.attname not in deferred
+            ]
         super().save(*args, **kwargs)
+        transaction.on_commit(self.invalidate_cache)
+
+    def soft_delete(self):
+        """
+        Hides the row from ``objects`` with one UPDATE and returns whether
+        it was not deleted already
+
+        The row and its dependents stay in the database until
+        shared_model.purging removes them in batches.
+        """
+        now = datetime.now(UTC)
+        with transaction.atomic():
+            rows = type(self)._base_manager.filter(pk=self.pk, deleted_at__isnull=True)
+            if not rows.update(deleted_at=now, updated_at=now):
+                return False
+            self.deleted_at = self.updated_at = now
+            soft_deleted.send(sender=type(self), instance=self)
+            transaction.on_commit(self.invalidate_cache)
+        return True
+
+    def invalidate_cache(self):
+        """
+        Marks cached data built from this row as stale
+        """
+        bump_version(self._meta.model_name, self.pk)
 
     def __eq__(self, other):
         """
@@ -37,5 +110,11 @@ class Basemodel(models.Model):
         """
         return self.id != other.id
 
+    def __hash__(self):
+        """
+        Hash method, needed since __eq__ is overridden
+        """
+        return hash(self.id)
+
     class Meta:
         abstract = True
\ No newline at end of file
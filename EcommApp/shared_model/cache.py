@@ -0,0 +1,93 @@
+#!/usr/bin/python3
+"""Row version tokens used to invalidate cached data
+
+Every Basemodel row has a random version token in the cache. Saving or
+deleting the row replaces its token, so any cached value stamped with the
+old token can be recognised as stale without having to find it.
+"""
+
+from uuid import uuid4
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+
+
+def get_cache():
+    """Returns the cache backend named by ``MODEL_CACHE_ALIAS``"""
+    return caches[getattr(settings, 'MODEL_CACHE_ALIAS', 'default')]
+
+
+class InProcessAsyncCache:
+    """Async API over an in-process cache
+
+    Django implements the async methods of every built-in backend with
+    sync_to_async, which costs a thread hop per call. A local memory
+    cache never waits on I/O, so its sync methods are called directly.
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    async def aget(self, key, default=None):
+        return self.cache.get(key, default)
+
+    async def aget_many(self, keys):
+        return self.cache.get_many(keys)
+
+    async def aadd(self, key, value, timeout=None):
+        return self.cache.add(key, value, timeout)
+
+    async def aset(self, key, value, timeout=None):
+        return self.cache.set(key, value, timeout)
+
+    async def adelete(self, key):
+        return self.cache.delete(key)
+
+
+def get_async_cache():
+    """Returns an object with the async cache API for ``MODEL_CACHE_ALIAS``"""
+    cache = get_cache()
+    if isinstance(cache, LocMemCache):
+        return InProcessAsyncCache(cache)
+    return cache
+
+
+def version_key(model_name, pk):
+    """Returns the cache key holding the version token of a row"""
+    return "version:{}:{}".format(model_name, pk)
+
+
+def bump_version(model_name, pk):
+    """Replaces the version token of a row
+
+    args:
+        model_name: str, lower case model name, e.g. ``category``
+        pk: UUID, primary key of the row
+    """
+    get_cache().set(version_key(model_name, pk), uuid4().hex, None)
+
+
+def current_versions(keys):
+    """Returns the version token of each key, creating missing ones
+
+    args:
+        keys: list, keys built with version_key
+    """
+    cache = get_cache()
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            cache.add(key, uuid4().hex, None)
+            found[key] = cache.get(key)
+    return found
+
+
+async def acurrent_versions(keys):
+    """Async version of current_versions"""
+    cache = get_async_cache()
+    found = await cache.aget_many(keys)
+    for key in keys:
+        if key not in found:
+            await cache.aadd(key, uuid4().hex, None)
+            found[key] = await cache.aget(key)
+    return found
@@ -0,0 +1,102 @@
+#!/usr/bin/python3
+"""Helpers shared by the bulk import paths
+
+Input is CSV with a header row or JSON lines, read lazily row by row.
+"""
+
+import csv
+import json
+
+FORMATS = ('csv', 'jsonl')
+DEFAULT_CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+
+
+class ImportReport:
+    """Collects the outcome of an import
+
+    attributes:
+        created: int, number of rows written
+        error_count: int, number of rejected rows
+        errors: list, details of the first MAX_REPORTED_ERRORS rejected rows
+    """
+    def __init__(self):
+        self.created = 0
+        self.error_count = 0
+        self.errors = []
+
+    def add_error(self, row_number, errors):
+        """Records a rejected row
+
+        args:
+            row_number: int, 1-based number of the row in the input
+            errors: dict, field errors of the row
+        """
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': row_number, 'errors': errors})
+
+    def as_dict(self):
+        return {'created': self.created,
+                'error_count': self.error_count,
+                'errors': self.errors}
+
+
+def _decode(lines, encoding, failures):
+    """Yields the lines decoded, a line that cannot be decoded is decoded
+    with replacement characters and counted in ``failures``"""
+    for line in lines:
+        try:
+            yield line.decode(encoding)
+        except UnicodeDecodeError:
+            failures.append(line)
+            yield line.decode(encoding, errors='replace')
+
+
+def read_rows(lines, fmt, encoding=None):
+    """Yields (row_number, row) pairs from an iterable of text lines
+
+    Rows that cannot be decoded, or that the csv module rejects, are
+    yielded as (row_number, None).
+
+    args:
+        lines: iterable, lines of text, or of bytes when encoding is given
+        fmt: str, one of FORMATS
+        encoding: str, optional encoding of byte lines
+    """
+    failures = []
+    if encoding is not None:
+        lines = _decode(lines, encoding, failures)
+    if fmt == 'csv':
+        reader = csv.DictReader(lines)
+        row_number = 0
+        while True:
+            row_number += 1
+            try:
+                row = next(reader)
+            except StopIteration:
+                break
+            except csv.Error:
+                row = None
+            if failures:
+                failures.clear()
+                row = None
+            yield row_number, row
+    elif fmt == 'jsonl':
+        row_number = 0
+        for line in lines:
+            if failures:
+                failures.clear()
+                row_number += 1
+                yield row_number, None
+                continue
+            if not line.strip():
+                continue
+            row_number += 1
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield row_number, row if isinstance(row, dict) else None
+    else:
+        raise ValueError("Unsupported import format: {}".format(fmt))
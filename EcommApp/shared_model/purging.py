@@ -0,0 +1,88 @@
+#!/usr/bin/python3
+"""Batched removal of soft deleted rows
+
+Deleting a row through the ORM collects every cascaded dependent in
+Python and removes them all in one transaction. purge() instead walks the
+CASCADE relations itself and deletes dependents bottom up, at most
+``batch_size`` rows per statement and each batch in its own transaction,
+so memory stays bounded and writers only wait for one batch at a time.
+Delete signals still run for every removed row. Receivers maintaining
+data held by a row that is being purged as well can skip that work,
+see purging().
+
+Run it outside of a transaction, otherwise the batches are not committed
+separately.
+"""
+
+import time
+from contextvars import ContextVar
+from django.db import models, transaction
+
+DEFAULT_BATCH_SIZE = 200
+# Seconds slept after each batch. A waiting SQLite writer polls the lock
+# with growing sleeps and would otherwise find it taken again every time.
+DEFAULT_PAUSE = 0.02
+
+# models whose rows are being deleted by the current cascade walk
+_purging = ContextVar('purging', default=frozenset())
+
+
+def purging(model):
+    """Returns whether the current delete removes rows of model, or rows
+    cascading from them
+    """
+    return model in _purging.get()
+
+
+def _cascades(model):
+    """Yields the (model, field name) of relations cascading from model"""
+    for relation in model._meta.related_objects:
+        if ((relation.one_to_many or relation.one_to_one)
+                and relation.on_delete is models.CASCADE):
+            yield relation.related_model, relation.field.name
+
+
+def delete_rows(model, pks, batch_size=DEFAULT_BATCH_SIZE, pause=DEFAULT_PAUSE):
+    """Deletes rows and everything cascading from them in batches
+
+    Returns the number of deleted rows, dependents included.
+
+    args:
+        model: Model, model of the rows
+        pks: list, primary keys of at most batch_size rows
+        batch_size: int, most rows deleted per statement
+        pause: float, seconds slept after each batch
+    """
+    deleted = 0
+    token = _purging.set(_purging.get() | {model})
+    try:
+        for related, field_name in _cascades(model):
+            dependents = related._base_manager.filter(**{field_name + '__in': pks})
+            dependents = dependents.values_list('pk', flat=True)
+            while batch := list(dependents[:batch_size]):
+                deleted += delete_rows(related, batch, batch_size, pause)
+        with transaction.atomic():
+            # the collector only finds dependents written since the walk above
+            count, _ = model._base_manager.filter(pk__in=pks).delete()
+    finally:
+        _purging.reset(token)
+    if pause:
+        time.sleep(pause)
+    return deleted + count
+
+
+def purge(model, batch_size=DEFAULT_BATCH_SIZE, pause=DEFAULT_PAUSE):
+    """Removes the soft deleted rows of a model and their dependents
+
+    Returns the number of deleted rows, dependents included.
+
+    args:
+        model: Model, a Basemodel subclass
+        batch_size: int, most rows deleted per statement
+        pause: float, seconds slept after each batch
+    """
+    deleted = 0
+    doomed = model._base_manager.filter(deleted_at__isnull=False).values_list('pk', flat=True)
+    while batch := list(doomed[:batch_size]):
+        deleted += delete_rows(model, batch, batch_size, pause)
+    return deleted
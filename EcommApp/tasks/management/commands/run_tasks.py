@@ -0,0 +1,46 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from tasks.queue import prune_done, run_batch
+
+# Seconds between two prunes of done tasks
+PRUNE_INTERVAL = 60
+
+
+class Command(BaseCommand):
+    """
+    Runs queued background tasks
+    """
+    help = "Run queued background tasks in batches, polling for new ones"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help="Number of tasks claimed at a time")
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help="Seconds to wait when no task is due")
+        parser.add_argument('--once', action='store_true',
+                            help="Exit once no task is due")
+        parser.add_argument('--keep-done', type=float,
+                            default=getattr(settings, 'TASKS_KEEP_DONE', None),
+                            help="Delete done tasks after this many seconds, "
+                                 "defaults to TASKS_KEEP_DONE, kept forever when unset")
+
+    def handle(self, *args, **options):
+        total = 0
+        pruned_at = None
+        while True:
+            ran = run_batch(options['batch_size'])
+            total += ran
+            if ran:
+                continue
+            # done tasks are pruned while the queue is idle
+            if options['keep_done'] is not None and (
+                    pruned_at is None or time.monotonic() - pruned_at >= PRUNE_INTERVAL):
+                prune_done(options['keep_done'])
+                pruned_at = time.monotonic()
+            if options['once']:
+                break
+            close_old_connections()
+            time.sleep(options['poll_interval'])
+        self.stdout.write(self.style.SUCCESS("Ran {} tasks".format(total)))
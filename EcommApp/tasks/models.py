@@ -0,0 +1,60 @@
+from django.db import models
+from django.utils import timezone
+from shared_model.ids import uuid7
+
+
+class Task(models.Model):
+    """
+    Model for a queued background task, see tasks.queue
+
+    Not a Basemodel: queue bookkeeping neither soft deletes nor has
+    cached data to invalidate.
+
+    Attributes:
+        name: str, registered name of the task function
+        kwargs: dict, JSON keyword arguments of the call
+        key: str, optional idempotency key, a task with a key that was
+            already enqueued is not enqueued again
+        status: str, one of the STATUS_CHOICES
+        attempts: int, number of runs started
+        max_attempts: int, runs allowed before the task is marked failed
+        run_after: datetime, earliest time of the next run
+        locked_until: datetime, end of the lease of the worker running it
+        claim: UUID, token of the worker batch that claimed it
+        last_error: str, error of the last failed run
+    """
+    id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    name = models.CharField(max_length=150)
+    kwargs = models.JSONField(default=dict)
+    key = models.CharField(max_length=200, null=True, blank=True, unique=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    claim = models.UUIDField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default='')
+
+    class Meta:
+        # serves the workers' search for due and abandoned tasks
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='task_status_run_after_idx'),
+            models.Index(fields=['claim'], name='task_claim_idx'),
+        ]
+
+    def __str__(self):
+        return "{} - {} ({})".format(self.name, self.id, self.status)
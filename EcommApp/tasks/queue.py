@@ -0,0 +1,237 @@
+"""
+Database backed background task queue
+
+Tasks are functions registered with the ``task`` decorator in the
+``tasks`` module of an app. ``enqueue`` writes a Task row in the current
+transaction, so the task only becomes visible to workers once the write
+that caused it commits, and is rolled back with it. Rows are claimed in
+batches with one conditional UPDATE, run in their own transaction and
+retried with exponential backoff until ``max_attempts`` runs have
+failed. A claim is a lease: a task whose worker died is picked up again
+once ``TASKS_LEASE`` seconds have passed, so tasks run at least once and
+should be idempotent. Done tasks with a key are kept to drop duplicates
+until the ``run_tasks`` command prunes them (``TASKS_KEEP_DONE``).
+
+``TASKS_MODE`` selects who runs them:
+
+* ``thread``: a small in-process thread pool drains the queue after
+  every commit that enqueued work, and again when a delayed or retried
+  task comes due, the ``run_tasks`` command may run alongside it. Tasks
+  registered with ``worker_only`` are left to ``run_tasks``
+* ``worker``: only the ``run_tasks`` command runs them
+* ``eager``: tasks run inline when enqueued, without a Task row, which
+  is what the test suite uses
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from datetime import timedelta
+from functools import partial
+from uuid import uuid4
+from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from tasks.models import Task
+
+logger = logging.getLogger(__name__)
+
+registry = {}
+
+# Longest wait between two retries of a task, in seconds
+MAX_BACKOFF = 3600
+
+_executor = None
+
+
+def task(name=None, max_attempts=5, atomic=True, worker_only=False):
+    """
+    Decorator registering a function as a task
+
+    The function takes JSON serializable keyword arguments.
+
+    Args:
+        name (str): name of the task, defaults to ``module.function``
+        max_attempts (int): runs allowed before the task is marked failed
+        atomic (bool): whether a run is one transaction, turn off for
+            tasks committing their work in batches
+        worker_only (bool): whether only the ``run_tasks`` command runs
+            it, never the thread pool of a web process
+    """
+    def register(function):
+        function.task_name = name or '{}.{}'.format(function.__module__, function.__name__)
+        function.max_attempts = max_attempts
+        function.atomic = atomic
+        function.worker_only = worker_only
+        registry[function.task_name] = function
+        return function
+    return register
+
+
+def enqueue(function, key=None, delay=0, **kwargs):
+    """
+    Queues a call of a task and returns whether it was queued
+
+    The row is written in the current transaction, so the task is only
+    picked up once that transaction commits. A call with a ``key`` that
+    was already enqueued is dropped.
+
+    Args:
+        function (callable): function registered with ``task``
+        key (str): optional idempotency key
+        delay (int): seconds to wait before the first run
+        kwargs: JSON serializable arguments of the call
+    """
+    mode = getattr(settings, 'TASKS_MODE', 'thread')
+    if mode == 'eager':
+        function(**kwargs)
+        return True
+    queued = Task(name=function.task_name,
+                  kwargs=kwargs,
+                  key=key,
+                  max_attempts=function.max_attempts,
+                  run_after=timezone.now() + timedelta(seconds=delay))
+    try:
+        # savepoint, a duplicate key must not break the caller's transaction
+        with transaction.atomic():
+            queued.save(force_insert=True)
+    except IntegrityError:
+        if key is None:
+            raise
+        return False
+    if mode == 'thread' and not function.worker_only:
+        transaction.on_commit(partial(_schedule_drain, delay))
+    return True
+
+
+def _due():
+    now = timezone.now()
+    return (Q(status=Task.QUEUED, run_after__lte=now) |
+            Q(status=Task.RUNNING, locked_until__lt=now))
+
+
+def claim(batch_size, worker=True):
+    """
+    Claims up to ``batch_size`` due tasks, and tasks whose lease ran out,
+    and returns them
+
+    Args:
+        batch_size (int): most tasks claimed
+        worker (bool): whether the caller is the ``run_tasks`` command,
+            the thread pool leaves worker only tasks alone
+    """
+    token = uuid4()
+    due = Task.objects.filter(_due())
+    if not worker:
+        due = due.exclude(name__in=[name for name, function in registry.items()
+                                    if function.worker_only])
+    due = due.order_by('run_after').values('pk')[:batch_size]
+    # the due condition is checked again by the UPDATE, so a task is
+    # claimed by one worker only
+    Task.objects.filter(_due(), pk__in=due).update(
+        status=Task.RUNNING,
+        claim=token,
+        locked_until=timezone.now() + timedelta(seconds=getattr(settings, 'TASKS_LEASE', 300)),
+        attempts=F('attempts') + 1,
+    )
+    return list(Task.objects.filter(claim=token).order_by('run_after'))
+
+
+def execute(claimed):
+    """
+    Runs a claimed task and records the outcome, returns whether it
+    succeeded
+
+    Args:
+        claimed (Task): task returned by claim
+    """
+    own = Task.objects.filter(pk=claimed.pk, claim=claimed.claim)
+    function = registry.get(claimed.name)
+    try:
+        if function is None:
+            raise LookupError("Unknown task {}".format(claimed.name))
+        with transaction.atomic() if function.atomic else nullcontext():
+            function(**claimed.kwargs)
+    except Exception as error:
+        logger.exception("task %s %s failed (attempt %s of %s)", claimed.name,
+                         claimed.pk, claimed.attempts, claimed.max_attempts)
+        if function is None or claimed.attempts >= claimed.max_attempts:
+            own.update(status=Task.FAILED, claim=None, locked_until=None,
+                       last_error=repr(error))
+        else:
+            backoff = min(2 ** claimed.attempts, MAX_BACKOFF)
+            own.update(status=Task.QUEUED, claim=None, locked_until=None,
+                       last_error=repr(error),
+                       run_after=timezone.now() + timedelta(seconds=backoff))
+            if getattr(settings, 'TASKS_MODE', 'thread') == 'thread' and not function.worker_only:
+                _schedule_drain(backoff)
+        return False
+    if claimed.key is None:
+        own.delete()
+    else:
+        # kept so that the idempotency key keeps dropping duplicates,
+        # until prune_done removes it
+        own.update(status=Task.DONE, claim=None, locked_until=None,
+                   updated_at=timezone.now())
+    return True
+
+
+def prune_done(keep):
+    """
+    Deletes the done tasks finished more than ``keep`` seconds ago and
+    returns the number deleted, their keys may be enqueued again
+
+    Args:
+        keep (float): seconds done tasks are kept for
+    """
+    cutoff = timezone.now() - timedelta(seconds=keep)
+    deleted, _ = Task.objects.filter(status=Task.DONE, updated_at__lt=cutoff).delete()
+    return deleted
+
+
+def run_batch(batch_size=100, worker=True):
+    """
+    Claims and runs one batch of due tasks, returns the number run
+    """
+    claimed = claim(batch_size, worker)
+    for item in claimed:
+        execute(item)
+    return len(claimed)
+
+
+def drain(batch_size=100, worker=True):
+    """
+    Runs batches until no task is due, returns the number run
+    """
+    total = 0
+    while ran := run_batch(batch_size, worker):
+        total += ran
+    return total
+
+
+def _drain_in_thread():
+    try:
+        drain(worker=False)
+    except Exception:
+        logger.exception("draining the task queue failed")
+    finally:
+        # pool threads keep no connection between drains
+        connections.close_all()
+
+
+def _schedule_drain(delay=0):
+    """
+    Drains the queue in the thread pool, after ``delay`` seconds
+    """
+    global _executor
+    if delay > 0:
+        # nothing else drains the queue when the task comes due
+        timer = threading.Timer(delay, _schedule_drain)
+        timer.daemon = True
+        timer.start()
+        return
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=getattr(settings, 'TASKS_THREADS', 2),
+                                       thread_name_prefix='tasks')
+    _executor.submit(_drain_in_thread)
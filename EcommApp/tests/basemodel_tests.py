@@ -0,0 +1,34 @@
+import pytest
+from datetime import datetime, timedelta, UTC
+from shared_model.ids import uuid7, uuid7_floor, uuid7_timestamp
+
+
+def test_uuid7_is_time_ordered():
+    """
+    Tests that uuid7 ids sort in generation order and are valid UUIDs
+    """
+    ids = [uuid7() for _ in range(10000)]
+    assert ids == sorted(ids)
+    assert len(set(ids)) == len(ids)
+    assert all(value.version == 7 for value in ids)
+
+
+def test_uuid7_floor_bounds_created_at():
+    """
+    Tests that uuid7_floor gives a primary key lower bound for a moment
+    """
+    before = datetime.now(UTC) - timedelta(seconds=1)
+    value = uuid7()
+    assert uuid7_floor(before) < value
+    assert uuid7_floor(before + timedelta(days=1)) > value
+    assert abs(uuid7_timestamp(value) / 1000 - before.timestamp()) < 60
+
+
+@pytest.mark.django_db
+def test_models_use_time_ordered_ids(make_products):
+    """
+    Tests that Basemodel rows get uuid7 primary keys in insert order
+    """
+    products = make_products(5)
+    assert [p.id for p in products] == sorted(p.id for p in products)
+    assert products[0].id.version == 7
@@ -0,0 +1,70 @@
+import gzip
+import json
+import pytest
+from asgiref.sync import async_to_sync
+from django.urls import reverse
+from EcommApp.compression import (acompress_stream,
+                                  accepted_encodings,
+                                  choose_compressor,
+                                  GzipCompressor,
+                                  )
+
+
+def test_accept_encoding_negotiation():
+    """
+    Tests that codings with q=0 are refused and gzip is the fallback
+    """
+    assert accepted_encodings("gzip;q=0, deflate, br;q=0.5") == {"deflate", "br"}
+    assert choose_compressor("gzip, deflate") is GzipCompressor
+    assert choose_compressor("*") is GzipCompressor
+    assert choose_compressor("identity, gzip;q=0") is None
+
+
+@pytest.mark.django_db
+def test_list_responses_are_compressed(client, make_products):
+    """
+    Tests that paged and streamed lists are gzipped when accepted and
+    decompress to the plain response
+    """
+    make_products(30)
+    url = reverse("list_create")
+    plain = client.get(url, {"limit": 30})
+    assert "Content-Encoding" not in plain
+
+    response = client.get(url, {"limit": 30}, HTTP_ACCEPT_ENCODING="gzip, deflate")
+    assert response["Content-Encoding"] == "gzip"
+    assert response["ETag"] == "W/" + plain["ETag"]
+    assert "Accept-Encoding" in response["Vary"]
+    assert len(response.content) < len(plain.content)
+    assert gzip.decompress(response.content) == plain.content
+
+    plain = b"".join(client.get(url, {"stream": "1"}).streaming_content)
+    response = client.get(url, {"stream": "1"}, HTTP_ACCEPT_ENCODING="gzip")
+    assert response["Content-Encoding"] == "gzip"
+    assert gzip.decompress(b"".join(response.streaming_content)) == plain
+    assert len(json.loads(plain)) == 30
+
+
+@pytest.mark.django_db
+def test_small_responses_are_not_compressed(client):
+    """
+    Tests that bodies below COMPRESSION_MIN_SIZE are sent as is
+    """
+    response = client.get(reverse("list_create"), HTTP_ACCEPT_ENCODING="gzip")
+    assert "Content-Encoding" not in response
+
+
+def test_async_streams_are_one_gzip_member():
+    """
+    Tests that an async stream is compressed as a single gzip stream
+    """
+    async def chunks():
+        for chunk in (b"[", b"1", b",", b"2", b"]"):
+            yield chunk
+
+    async def collect():
+        return b"".join([data async for data in acompress_stream(chunks(), GzipCompressor())])
+
+    body = async_to_sync(collect)()
+    assert gzip.decompress(body) == b"[1,2]"
+    assert body.count(b"\x1f\x8b") == 1
@@ -1,48 +1,63 @@
 import pytest
+from django.core.cache import caches
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from user.authentication import full_users
 from user.models import (
     User,
     UserProfile
 )
 from product.models import (
     Product,
-    ProductCategory,
-    ProductReview,
+    Category,
+    Review,
     Wishlist
 )
 
+@pytest.fixture(autouse=True)
+def clear_caches():
+    """
+    Empties every cache so that cached data does not leak between tests
+    """
+    for cache in caches.all():
+        cache.clear()
+    full_users.clear()
+
+@pytest.fixture(autouse=True)
+def eager_tasks(settings):
+    """
+    Runs background tasks inline so that tests see their effects
+    """
+    settings.TASKS_MODE = "eager"
+
 @pytest.fixture
-def User() -> User:
+def user() -> User:
     """
     Creates a test user for the test cases
     """
-    return User.objects.create_user(username="test_user",
+    return User.objects.create_user(email="test_user@example.com",
+                                    username="test_user",
                                     password="testpasswd"
                                     )
 
 @pytest.fixture
-def UserProfile(User) -> UserProfile:
+def user_profile(user) -> UserProfile:
     """
-    Creates a test user profile for the test cases
+    Returns the profile created for the test user
     """
-    return UserProfile.objects.create(user=User,
-                                      first_name="test",
-                                      last_name="user",
-                                      phone_number="1234567890",
-                                      address="test address",
-                                      date_of_birth="2021-01-01"
-                                      )
+    return UserProfile.objects.get(user=user)
 
 @pytest.fixture
-def ProductCategory() -> ProductCategory:
+def category() -> Category:
     """
     Creates a test product category for the test cases
     """
-    return ProductCategory.objects.create(name="test_category",
-                                          description="test description"
-                                          )
+    return Category.objects.create(name="test_category",
+                                   description="test description"
+                                   )
 
 @pytest.fixture
-def Product(User, ProductCategory) -> Product:
+def product(user, category) -> Product:
     """
     Creates a test product for the test cases
     """
@@ -50,25 +65,64 @@ def Product(User, ProductCategory) -> Product:
                                   description="test description",
                                   price=100.00,
                                   quantity=10,
-                                  user_id=User,
-                                  category_id=ProductCategory
+                                  user=user,
+                                  category=category
                                   )
+
+@pytest.fixture
+def make_products(user, category):
+    """
+    Returns a factory that creates ``count`` test products
+    """
+    def make(count, **fields):
+        return [Product.objects.create(name="product {}".format(index),
+                                       description="test description",
+                                       price=fields.get("price", 100.00),
+                                       quantity=fields.get("quantity", 10),
+                                       user=fields.get("user", user),
+                                       category=fields.get("category", category)
+                                       )
+                for index in range(count)]
+    return make
+
 @pytest.fixture
-def ProductReview(User, Product) -> ProductReview:
+def review(user, product) -> Review:
     """
     Creates a test product review for the test cases
     """
-    return ProductReview.objects.create(product_id=Product,
-                                        user_id=User,
-                                        rating=5,
-                                        review="test review"
-                                        )
+    return Review.objects.create(product=product,
+                                 user=user,
+                                 rating=5,
+                                 review="test review"
+                                 )
 
 @pytest.fixture
-def Wishlist(User, Product) -> Wishlist:
+def wishlist(user) -> Wishlist:
     """
     Creates a test wishlist for the test cases
     """
-    return Wishlist.objects.create(user_id=User,
-                                   product_id=Product
-                                   )
\ No newline at end of file
+    return Wishlist.objects.create(user=user)
+
+@pytest.fixture
+def assert_constant_queries():
+    """
+    Returns a helper that fails when the number of queries run by a
+    request grows with the number of rows it returns
+
+    The helper takes ``request`` (runs the endpoint), ``grow`` (creates
+    the given number of extra rows) and the result ``sizes`` to compare.
+    """
+    def check(request, grow, sizes=(1, 10)):
+        counts = []
+        created = 0
+        for size in sizes:
+            grow(size - created)
+            created = size
+            with CaptureQueriesContext(connection) as queries:
+                request()
+            counts.append(len(queries))
+        assert len(set(counts)) == 1, (
+            "query count grows with result size: {}".format(
+                dict(zip(sizes, counts))))
+        return counts[0]
+    return check
@@ -0,0 +1,43 @@
+import pytest
+from django.db import transaction
+from django.db.utils import ConnectionHandler, OperationalError
+from EcommApp.database import ReadWriteRouter, sqlite_databases
+from product.models import Product
+
+
+@pytest.mark.django_db
+def test_production_profile_tunes_connections(tmp_path):
+    """
+    Tests that production connections open in WAL mode with the tuned
+    pragmas and that the replica connection refuses writes
+    """
+    databases = ConnectionHandler(sqlite_databases(str(tmp_path / "db.sqlite3"), "production"))
+    try:
+        with databases["default"].cursor() as cursor:
+            assert cursor.execute("PRAGMA journal_mode").fetchone() == ("wal",)
+            assert cursor.execute("PRAGMA synchronous").fetchone() == (1,)
+            cursor.execute("CREATE TABLE item (id INTEGER)")
+        assert databases["default"].transaction_mode == "IMMEDIATE"
+        with databases["replica"].cursor() as cursor:
+            assert cursor.execute("SELECT count(*) FROM item").fetchone() == (0,)
+            with pytest.raises(OperationalError):
+                cursor.execute("INSERT INTO item VALUES (1)")
+    finally:
+        databases.close_all()
+
+    with pytest.raises(ValueError):
+        sqlite_databases("db.sqlite3", "staging")
+
+
+@pytest.mark.django_db(transaction=True)
+def test_router_reads_from_replica_outside_transactions():
+    """
+    Tests that reads go to the replica unless the primary is inside a
+    transaction, and that writes always go to the primary
+    """
+    router = ReadWriteRouter()
+    assert router.db_for_read(Product) == "replica"
+    assert router.db_for_write(Product) == "default"
+    with transaction.atomic():
+        assert router.db_for_read(Product) == "default"
+    assert not router.allow_migrate("replica", "product")
@@ -0,0 +1,78 @@
+import logging
+import pytest
+from django.urls import reverse
+from EcommApp.metrics import Histogram, registry
+
+
+@pytest.fixture(autouse=True)
+def reset_registry():
+    """
+    Starts every test with empty request metrics
+    """
+    registry.reset()
+
+
+def test_histogram_percentiles():
+    """
+    Tests that percentiles come from the bucket bounds, capped at max
+    """
+    histogram = Histogram()
+    for value in [0.5] * 90 + [30] * 9 + [700]:
+        histogram.add(value)
+    assert (histogram.percentile(0.5), histogram.percentile(0.9)) == (1, 1)
+    assert histogram.percentile(0.99) == 50
+    assert histogram.as_dict()["max"] == 700
+
+
+@pytest.mark.django_db
+def test_requests_are_recorded_per_url_name(client, user, make_products, settings):
+    """
+    Tests that the middleware records timings and queries per URL name and
+    that the metrics endpoint is limited to staff
+    """
+    settings.METRICS_SLOW_QUERY_MS = 0
+    make_products(3)
+    client.get(reverse("list_create"))
+    client.get(reverse("list_create"))
+
+    url = reverse("metrics")
+    assert client.get(url).status_code in (401, 403)
+    user.is_staff = True
+    user.save()
+    client.force_login(user)
+    snapshot = client.get(url).json()
+
+    list_metrics = snapshot["endpoints"]["list_create"]
+    assert list_metrics["wall_ms"]["count"] == 2
+    assert list_metrics["queries"]["mean"] >= 1
+    assert list_metrics["serialization_ms"]["max"] > 0
+    assert any(query["url_name"] == "list_create" and "product_product" in query["sql"]
+               for query in snapshot["slow_queries"])
+
+
+@pytest.mark.django_db
+def test_metrics_are_logged_periodically(client, settings, caplog):
+    """
+    Tests that the metrics are written to the log once the interval passed
+    """
+    settings.METRICS_LOG_INTERVAL = 0
+    with caplog.at_level(logging.INFO, logger="EcommApp.metrics"):
+        client.get(reverse("category_list"))
+    assert "category_list" in caplog.text
+
+
+@pytest.mark.django_db
+def test_streamed_bodies_are_measured(client, make_products):
+    """
+    Tests that the queries run while a streamed body is sent are counted
+    and that the request is recorded once the response is closed
+    """
+    make_products(3)
+    response = client.get(reverse("list_create"), {"stream": "1"})
+    assert "list_create" not in registry.snapshot()["endpoints"]
+    b"".join(response.streaming_content)
+    response.close()
+    list_metrics = registry.snapshot()["endpoints"]["list_create"]
+    assert list_metrics["wall_ms"]["count"] == 1
+    # the validators aggregate and the streamed rows
+    assert list_metrics["queries"]["max"] >= 2
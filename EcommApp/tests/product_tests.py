@@ -1,4 +1,1072 @@
+import io
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
 import pytest
+from asgiref.sync import async_to_sync
+from django.core.management import call_command
+from django.db import OperationalError, connection, connections
+from django.utils import timezone
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIRequestFactory
+from product import search
+from product.cache import detail_key, get_product_payload
+from product.models import (Category, Leaderboard, Product, RelatedProduct, Reservation, Review,
+                            Wishlist, WishlistItem)
+from shared_model.cache import get_cache
+from tasks.models import Task
+from user.models import User
+from product.serializer import ReviewSerializer
+from product.tasks import unindex_products
+from product.reservations import OutOfStock, reserve
+from product.views import alist_create, aretrieve_update_delete
+from product.wishlist import add_products, remove_products
 
 
+@pytest.mark.django_db
+def test_list_products_is_cursor_paginated(client, make_products):
+    """
+    Tests that walking the next cursors returns every product exactly once
+    """
+    products = make_products(5)
+    url = reverse("list_create")
 
+    seen = []
+    response = client.get(url, {"limit": 2})
+    while True:
+        body = response.json()
+        seen.extend(item["id"] for item in body["results"])
+        if body["next"] is None:
+            break
+        response = client.get(url, {"limit": 2, "cursor": body["next"]})
+
+    assert seen == [str(product.id) for product in products]
+
+
+@pytest.mark.django_db
+def test_list_products_previous_cursor(client, make_products):
+    """
+    Tests that the previous cursor returns the page before
+    """
+    make_products(4)
+    url = reverse("list_create")
+    first = client.get(url, {"limit": 2}).json()
+    second = client.get(url, {"limit": 2, "cursor": first["next"]}).json()
+
+    assert first["previous"] is None
+    back = client.get(url, {"limit": 2, "cursor": second["previous"]}).json()
+    assert back["results"] == first["results"]
+
+
+@pytest.mark.django_db
+def test_list_products_rejects_bad_cursor(client):
+    """
+    Tests that malformed cursors and limits are rejected
+    """
+    url = reverse("list_create")
+    assert client.get(url, {"cursor": "not-a-cursor"}).status_code == 400
+    assert client.get(url, {"limit": "zero"}).status_code == 400
+
+
+@pytest.mark.django_db
+def test_list_products_stream(client, make_products):
+    """
+    Tests that stream mode writes out the whole catalog as a JSON array
+    """
+    products = make_products(3)
+    response = client.get(reverse("list_create"), {"stream": "1"})
+
+    assert response.streaming
+    body = json.loads(b"".join(response.streaming_content))
+    assert [item["id"] for item in body] == [str(p.id) for p in products]
+
+
+@pytest.mark.django_db
+def test_list_products_query_count_is_constant(client, make_products,
+                                               assert_constant_queries):
+    """
+    Tests that listing products does not run one query per product
+    """
+    url = reverse("list_create")
+    assert_constant_queries(lambda: client.get(url, {"limit": 50}),
+                            make_products)
+    assert_constant_queries(lambda: b"".join(
+                                client.get(url, {"stream": "1"}).streaming_content),
+                            make_products,
+                            sizes=(11, 20))
+
+
+@pytest.mark.django_db
+def test_retrieve_product_is_one_query(client, product,
+                                       django_assert_num_queries):
+    """
+    Tests that the product detail loads the user and category in one query
+    """
+    url = reverse("retrieve_update_delete", args=[product.id])
+    with django_assert_num_queries(1):
+        response = client.get(url)
+    assert response.json()["category"] == str(product.category)
+
+
+@pytest.mark.django_db
+def test_rating_aggregates_follow_reviews(product, user, review):
+    """
+    Tests that the stored rating aggregates track review changes
+    """
+    product.refresh_from_db()
+    assert (product.rating_count, product.rating_sum) == (1, 5)
+
+    request = APIRequestFactory().put("/")
+    serializer = ReviewSerializer(Review.objects.get(pk=review.pk),
+                                  data={"rating": 2},
+                                  partial=True,
+                                  context={"request": request,
+                                           "product_pk": product.pk,
+                                           "user_pk": user})
+    assert serializer.is_valid(), serializer.errors
+    serializer.save()
+    product.refresh_from_db()
+    assert product.average_rating() == 2.0
+    assert product.rating_histogram() == {1: 0, 2: 1, 3: 0, 4: 0, 5: 0}
+
+    # reviews loaded without their rating or product
+    for fields in (("id", "review"), ("id", "rating")):
+        deferred = Review.objects.only(*fields).get(pk=review.pk)
+        deferred.rating = 4 if deferred.rating == 2 else 2
+        deferred.save()
+        product.refresh_from_db()
+        assert (product.rating_count, product.rating_sum) == (1, deferred.rating)
+
+    Review.objects.all().delete()
+    product.refresh_from_db()
+    assert (product.rating_count, product.rating_sum, product.rating_2) == (0, 0, 0)
+
+
+@pytest.mark.django_db
+def test_recompute_ratings_repairs_drift(product, review):
+    """
+    Tests that the recompute_ratings command repairs drifted aggregates
+    """
+    Product.objects.filter(pk=product.pk).update(rating_count=7, rating_5=0)
+    call_command("recompute_ratings", batch_size=1)
+    product.refresh_from_db()
+    assert (product.rating_count, product.rating_sum, product.rating_5) == (1, 5, 1)
+
+
+@pytest.mark.django_db
+def test_category_product_count_follows_products(user, category, make_products):
+    """
+    Tests that the category counter follows creates, moves and deletes
+    """
+    other = Category.objects.create(name="other")
+    first, second, _ = make_products(3)
+    category.refresh_from_db()
+    assert category.total_products() == 3
+
+    moved = Product.objects.get(pk=first.pk)
+    moved.category = other
+    moved.save()
+    second.delete()
+    category.refresh_from_db()
+    other.refresh_from_db()
+    assert (category.total_products(), other.total_products()) == (1, 1)
+
+    user.delete()
+    category.refresh_from_db()
+    other.refresh_from_db()
+    assert (category.product_count, other.product_count) == (0, 0)
+
+
+@pytest.mark.django_db
+def test_reconcile_category_counts(category, make_products):
+    """
+    Tests that the reconcile command repairs drifted category counters
+    """
+    make_products(2)
+    Category.objects.update(product_count=9)
+    call_command("reconcile_category_counts", batch_size=1)
+    category.refresh_from_db()
+    assert category.product_count == 2
+
+
+@pytest.mark.django_db
+def test_deleted_product_is_hidden_then_purged(client, settings, user, category, product, review,
+                                               django_capture_on_commit_callbacks):
+    """
+    Tests that deleting a product hides it at once and that the purge
+    removes it with its reviews and wishlist items
+    """
+    settings.TASKS_MODE = "worker"
+    WishlistItem.objects.create(wishlist=Wishlist.for_user(user.pk), product=product)
+    url = reverse("retrieve_update_delete", args=[product.id])
+    assert client.get(url).status_code == 200
+
+    with django_capture_on_commit_callbacks(execute=True):
+        assert client.delete(url).status_code == 204
+    assert client.get(url).status_code == 404
+    assert client.get(reverse("product_reviews", args=[product.id])).status_code == 404
+    assert Product.all_objects.filter(pk=product.pk).exists()
+    category.refresh_from_db()
+    assert category.product_count == 0
+
+    call_command("run_tasks", once=True)
+    assert not Product.all_objects.exists()
+    assert not Review.objects.exists()
+    assert not WishlistItem.objects.exists()
+    category.refresh_from_db()
+    assert category.product_count == 0
+
+
+@pytest.mark.django_db
+def test_stale_save_keeps_product_deleted(client, settings, category, product,
+                                          django_capture_on_commit_callbacks):
+    """
+    Tests that saving an instance loaded before its product was soft
+    deleted leaves the product deleted and counted out
+    """
+    settings.TASKS_MODE = "worker"
+    stale = Product.objects.get(pk=product.pk)
+    with django_capture_on_commit_callbacks(execute=True):
+        assert product.soft_delete()
+    stale.name = "stale"
+    stale.save()
+
+    url = reverse("retrieve_update_delete", args=[product.id])
+    assert client.get(url).status_code == 404
+    assert not Product.objects.filter(pk=product.pk).exists()
+    category.refresh_from_db()
+    assert category.product_count == 0
+
+    call_command("run_tasks", once=True)
+    assert not Product.all_objects.exists()
+    category.refresh_from_db()
+    assert category.product_count == 0
+
+
+@pytest.mark.django_db
+def test_deleted_category_is_purged_in_batches(client, settings, user, category, make_products):
+    """
+    Tests that deleting a category hides its products in one statement
+    and that the purge removes them in batches
+    """
+    settings.TASKS_MODE = "worker"
+    other = Category.objects.create(name="other")
+    kept = make_products(1, category=other)[0]
+    products = make_products(5)
+    for product in products:
+        Review.objects.create(product=product, user=user, rating=4, review="fine")
+
+    call_command("run_tasks", once=True, stdout=io.StringIO())
+    assert Leaderboard.objects.filter(category=category).exists()
+
+    category.soft_delete()
+    assert [item["id"] for item in client.get(reverse("list_create")).json()["results"]] == [str(kept.id)]
+    assert Product.all_objects.count() == 6
+    # hidden from search and the leaderboards before the purge
+    assert not Leaderboard.objects.filter(category=category).exists()
+    unindex = Task.objects.get(name=unindex_products.task_name)
+    unindex_products(**unindex.kwargs)
+    unindex.delete()
+    assert search.search_ids("product", 10) == [kept.pk]
+
+    with CaptureQueriesContext(connection) as queries:
+        call_command("purge_deleted", batch_size=2)
+    assert list(Product.all_objects.all()) == [kept]
+    assert not Category.all_objects.filter(pk=category.pk).exists()
+    assert not Review.objects.exists()
+    # five reviews and five products take three batches each
+    deletes = [query["sql"] for query in queries
+               if query["sql"].startswith('DELETE FROM "product_product"')]
+    assert len(deletes) == 3
+
+
+@pytest.mark.django_db
+def test_category_list_does_not_query_products(client, make_products,
+                                               django_assert_num_queries):
+    """
+    Tests that the category list serves counts in a single query
+    """
+    make_products(3)
+    with django_assert_num_queries(1):
+        body = client.get(reverse("category_list")).json()
+    assert body["results"][0]["total_products"] == 3
+
+
+@pytest.mark.django_db
+def test_import_products_command(tmp_path, user, category):
+    """
+    Tests that the import command writes valid rows and skips bad ones
+    """
+    path = tmp_path / "catalog.csv"
+    path.write_text("name,description,price,quantity,category\n"
+                    "lamp,desk lamp,10.50,3,test_category\n"
+                    "chair,,not-a-price,1,test_category\n"
+                    "table,,99.00,2,missing\n"
+                    "sofa,,300.00,1,test_category\n")
+    call_command("import_products", str(path), seller=user.email, chunk_size=2)
+
+    assert sorted(Product.objects.values_list("name", flat=True)) == ["lamp", "sofa"]
+    category.refresh_from_db()
+    assert category.product_count == 2
+
+
+@pytest.mark.django_db
+def test_import_uses_oldest_category_of_a_name(tmp_path, user, category):
+    """
+    Tests that rows naming a category shared by several categories go to
+    the oldest one
+    """
+    Category.objects.create(name=category.name)
+    path = tmp_path / "catalog.csv"
+    path.write_text("name,description,price,quantity,category\n"
+                    "lamp,desk lamp,10.50,3,test_category\n")
+    call_command("import_products", str(path), seller=user.email)
+
+    assert Product.objects.get().category == category
+
+
+@pytest.mark.django_db
+def test_bulk_import_endpoint(client, user, category):
+    """
+    Tests that the import endpoint needs a user and reports row errors
+    """
+    url = reverse("bulk_import")
+    body = ('{"name": "lamp", "price": "1.00", "quantity": 1, "category": "test_category"}\n'
+            'not json\n'
+            '{"name": "desk", "price": "2.00", "quantity": 0, "category": "test_category"}\n')
+    assert client.post(url, body, content_type="application/x-ndjson").status_code in (401, 403)
+
+    client.force_login(user)
+    response = client.post(url, body, content_type="application/x-ndjson")
+    report = response.json()
+    assert response.status_code == 201
+    assert report["created"] == 1
+    assert [error["row"] for error in report["errors"]] == [2, 3]
+    assert Product.objects.get().user == user
+
+    # media type parameters, undecodable bytes and rows the csv module rejects
+    header = b"name,price,quantity,category\n"
+    body = (header + b"caf\xe9,1.00,1,test_category\n" + b"bad\0,1.00,1,test_category\n"
+            + b"\xff,1.00,1,test_category\n")
+    response = client.post(url, body, content_type="text/csv; charset=utf-8")
+    assert response.status_code == 400
+    assert [error["row"] for error in response.json()["errors"]] == [1, 2, 3]
+    # the test client encodes text bodies in the given charset
+    response = client.post(url, "name,price,quantity,category\ncaf\xe9,1.00,1,test_category\n",
+                           content_type="Text/CSV; charset=latin-1")
+    assert response.status_code == 201
+    assert Product.objects.filter(name="caf\xe9").exists()
+    assert client.post(url, "", content_type="text/plain; charset=utf-8").status_code == 415
+
+
+@pytest.mark.django_db
+def test_saving_stale_instance_keeps_counters(category, product, review):
+    """
+    Tests that saving an instance loaded before the counters changed does
+    not overwrite them
+    """
+    stale = Product.objects.get(pk=product.pk)
+    Review.objects.create(product=product, user=product.user, rating=1)
+    stale.name = "renamed"
+    stale.save()
+    category.name = "renamed"
+    category.save()
+
+    stale.refresh_from_db()
+    category.refresh_from_db()
+    assert (stale.name, stale.rating_count, stale.rating_sum) == ("renamed", 2, 6)
+    assert (category.name, category.product_count) == ("renamed", 1)
+
+
+@pytest.mark.django_db
+def test_full_save_keeps_stock(product):
+    """
+    Tests that a full save of an instance loaded before a sale does not
+    write its stale stock back, and that restocks are written explicitly
+    """
+    stale = Product.objects.get(pk=product.pk)
+    assert Product.take_stock(product.pk, 4)
+    stale.name = "renamed"
+    stale.save()
+    stale.refresh_from_db()
+    assert (stale.name, stale.quantity) == ("renamed", product.quantity - 4)
+
+    stale.quantity = 99
+    stale.save(update_fields=["quantity", "updated_at"])
+    stale.refresh_from_db()
+    assert stale.quantity == 99
+
+
+@pytest.mark.django_db
+def test_saving_deferred_instance_skips_deferred_fields(settings, product):
+    """
+    Tests that saving an instance loaded with only() writes the loaded
+    fields without loading or writing the deferred ones
+    """
+    settings.TASKS_MODE = "worker"
+    partial = Product.objects.only("name").get(pk=product.pk)
+    partial.name = "renamed"
+    with CaptureQueriesContext(connection) as queries:
+        partial.save()
+    assert not [query["sql"] for query in queries if '"description"' in query["sql"]]
+    product.refresh_from_db()
+    assert (product.name, product.description) == ("renamed", "test description")
+
+
+@pytest.mark.django_db
+def test_product_detail_is_cached_and_invalidated(client, product, category,
+                                                  django_assert_num_queries,
+                                                  django_capture_on_commit_callbacks):
+    """
+    Tests that product detail hits are served from the cache until the
+    product or its category is saved, and that deletes drop the entry
+    """
+    url = reverse("retrieve_update_delete", args=[product.id])
+    client.get(url)
+    with django_assert_num_queries(0):
+        assert client.get(url).json()["id"] == str(product.id)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        category.name = "renamed"
+        category.save()
+    with django_assert_num_queries(1):
+        client.get(url)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        product.delete()
+    assert client.get(url).status_code == 404
+
+
+@pytest.mark.django_db
+def test_product_cache_serves_stale_while_reloading(settings, product):
+    """
+    Tests that an expired entry is served stale while another caller
+    holds the reload lock
+    """
+    settings.PRODUCT_CACHE_TIMEOUT = 0
+    loads = []
+
+    def load():
+        loads.append(1)
+        return {"name": "v{}".format(len(loads))}, []
+
+    assert get_product_payload(product.pk, load) == {"name": "v1"}
+    get_cache().add(detail_key(product.pk) + ":lock", 1)
+    assert get_product_payload(product.pk, load) == {"name": "v1"}
+    get_cache().delete(detail_key(product.pk) + ":lock")
+    assert get_product_payload(product.pk, load) == {"name": "v2"}
+
+
+@pytest.mark.django_db
+def test_search_ranks_and_follows_writes(client, user, category):
+    """
+    Tests that search ranks name matches first and stays in sync with
+    product and category changes
+    """
+    url = reverse("search")
+    lamp = Product.objects.create(name="Brass desk lamp", description="warm light",
+                                  price=10, quantity=1, user=user, category=category)
+    shade = Product.objects.create(name="Shade", description="fits any lamp",
+                                   price=5, quantity=1, user=user, category=category)
+
+    names = [item["name"] for item in client.get(url, {"q": "lamp"}).json()["results"]]
+    assert names == ["Brass desk lamp", "Shade"]
+    assert client.get(url, {"q": "bra"}).json()["results"][0]["id"] == str(lamp.id)
+
+    category.name = "Lighting"
+    category.save()
+    assert len(client.get(url, {"q": "lighting"}).json()["results"]) == 2
+
+    shade.delete()
+    assert [item["id"] for item in client.get(url, {"q": "lamp"}).json()["results"]] == [str(lamp.id)]
+    assert client.get(url, {"q": "\" OR *"}).json()["results"] == []
+
+
+@pytest.mark.django_db
+def test_search_rows_are_removed_in_one_statement(make_products):
+    """
+    Tests that removing search rows deletes all given products with one
+    statement and that importing new products deletes none
+    """
+    products = make_products(3)
+    with CaptureQueriesContext(connection) as queries:
+        search.remove_products([product.pk for product in products[:2]])
+    assert len(queries) == 1
+    assert search.search_ids("product", 10) == [products[2].pk]
+
+    created = Product.objects.select_related("category").filter(
+        pk__in=[product.pk for product in make_products(2)])
+    search.remove_products([product.pk for product in created])
+    with CaptureQueriesContext(connection) as queries:
+        search.index_products(created, new=True)
+    assert len(search.search_ids("product", 10)) == 3
+    assert not [query for query in queries if query["sql"].startswith("DELETE")]
+
+
+@pytest.mark.django_db
+def test_rebuild_search_index(client, settings, make_products):
+    """
+    Tests that the rebuild command restores a dropped search table,
+    without the soft deleted products awaiting their purge
+    """
+    products = make_products(4)
+    settings.TASKS_MODE = "worker"
+    products[3].soft_delete()
+    with connection.cursor() as cursor:
+        cursor.execute("DELETE FROM product_search")
+    call_command("rebuild_search_index")
+    assert len(client.get(reverse("search"), {"q": "product"}).json()["results"]) == 3
+    assert products[3].pk not in search.search_ids("product", 10)
+
+
+@pytest.mark.django_db
+def test_async_views_match_sync_views(client, make_products):
+    """
+    Tests that the async list and detail views return what the sync
+    views return
+    """
+    products = make_products(3)
+    factory = RequestFactory()
+    url = reverse("list_create")
+
+    response = async_to_sync(alist_create)(factory.get(url, {"limit": 2}))
+    assert json.loads(response.content) == client.get(url, {"limit": 2}).json()
+
+    response = async_to_sync(alist_create)(factory.get(url, {"stream": "1"}))
+    chunks = async_to_sync(_collect)(response.streaming_content)
+    assert [item["id"] for item in json.loads("".join(chunks))] == [str(p.id) for p in products]
+
+    detail = reverse("retrieve_update_delete", args=[products[0].id])
+    response = async_to_sync(aretrieve_update_delete)(factory.get(detail), str(products[0].id))
+    assert json.loads(response.content) == client.get(detail).json()
+    response = async_to_sync(aretrieve_update_delete)(factory.get(detail), "missing")
+    assert response.status_code == 404
+
+
+@pytest.mark.django_db
+def test_async_list_authenticates_tokens(client, user, make_products):
+    """
+    Tests that the async list authenticates access tokens as the sync
+    list does, flagging the wishlisted products of the token's user
+    """
+    products = make_products(2)
+    add_products(user.pk, [products[0].pk])
+    access = client.post(reverse("token_obtain_pair"),
+                         {"email": user.email, "password": "testpasswd"}).json()["access"]
+    url = reverse("list_create")
+    request = RequestFactory().get(url, HTTP_AUTHORIZATION="Bearer " + access)
+    response = async_to_sync(alist_create)(request)
+    assert [item["wishlisted"] for item in json.loads(response.content)["results"]] == [True, False]
+    assert json.loads(response.content) == client.get(url, HTTP_AUTHORIZATION="Bearer " + access).json()
+
+    request = RequestFactory().get(url, HTTP_AUTHORIZATION="Bearer broken")
+    assert async_to_sync(alist_create)(request).status_code == 401
+
+
+async def _collect(chunks):
+    return [chunk.decode() async for chunk in chunks]
+
+
+@pytest.mark.django_db
+def test_review_validation_is_one_query(product, user, review, django_assert_num_queries):
+    """
+    Tests that validating a review checks the product and any previous
+    review with a single query
+    """
+    request = APIRequestFactory().post("/")
+    serializer = ReviewSerializer(data={"rating": 4},
+                                  context={"request": request,
+                                           "product_pk": product.pk,
+                                           "user_pk": user})
+    with django_assert_num_queries(1):
+        assert not serializer.is_valid()
+    assert "already reviewed" in str(serializer.errors)
+
+
+@pytest.mark.django_db
+def test_wishlist_batch_add_and_remove(client, user, make_products):
+    """
+    Tests that wishlist items are added and removed in batches, and that
+    adding a product twice keeps a single row
+    """
+    products = make_products(3)
+    url = reverse("wishlist_items")
+    ids = [str(product.id) for product in products]
+    assert client.post(url, {"products": ids}, content_type="application/json").status_code in (401, 403)
+
+    client.force_login(user)
+    assert client.post(url, {"products": ids[:2]}, content_type="application/json").json() == {"added": 2}
+    assert client.post(url, {"products": ids}, content_type="application/json").json() == {"added": 1}
+    assert WishlistItem.objects.count() == 3
+    assert Wishlist.objects.filter(user=user).count() == 1
+    assert [item["id"] for item in client.get(url).json()["results"]] == ids
+
+    response = client.delete(url, {"products": ids[1:]}, content_type="application/json")
+    assert response.json() == {"removed": 2}
+    assert client.post(url, {"products": ["nope"]}, content_type="application/json").status_code == 400
+
+
+@pytest.mark.django_db
+def test_product_list_flags_wishlisted_products(client, user, make_products,
+                                                assert_constant_queries):
+    """
+    Tests that a signed in user's product pages carry wishlisted flags
+    looked up with one query per page
+    """
+    products = make_products(3)
+    url = reverse("list_create")
+    assert "wishlisted" not in client.get(url).json()["results"][0]
+
+    client.force_login(user)
+    client.post(reverse("wishlist_items"), {"products": [str(products[1].id)]},
+                content_type="application/json")
+    flags = [item["wishlisted"] for item in client.get(url).json()["results"]]
+    assert flags == [False, True, False]
+    assert_constant_queries(lambda: client.get(url, {"limit": 50}), make_products)
+
+
+@pytest.mark.django_db
+def test_list_products_filters(client, user, category, make_products):
+    """
+    Tests the category, price, stock and rating filters of the product list
+    """
+    other = Category.objects.create(name="other")
+    cheap, pricey = make_products(2, price=5)[0], make_products(1, price=500)[0]
+    sold_out = make_products(1, price=20, quantity=0, category=other)[0]
+    Review.objects.create(product=pricey, user=user, rating=4)
+    Review.objects.create(product=cheap, user=user, rating=2)
+    url = reverse("list_create")
+
+    def ids(**params):
+        return {item["id"] for item in client.get(url, params).json()["results"]}
+
+    assert ids(category=str(other.id)) == {str(sold_out.id)}
+    assert ids(min_price="10", max_price="100") == {str(sold_out.id)}
+    assert str(sold_out.id) not in ids(in_stock="1")
+    assert ids(min_rating="3.5") == {str(pricey.id)}
+    assert ids(category=str(category.id), min_price="400") == {str(pricey.id)}
+    assert client.get(url, {"min_price": "abc"}).status_code == 400
+    assert client.get(url, {"category": "nope"}).status_code == 400
+
+
+@pytest.mark.django_db
+def test_facets_are_one_query(client, category, make_products, django_assert_num_queries):
+    """
+    Tests that category and price facet counts come from a single query
+    and follow the filters
+    """
+    other = Category.objects.create(name="other")
+    make_products(2, price=5)
+    make_products(1, price=2000, category=other)
+    url = reverse("facets")
+    with django_assert_num_queries(1):
+        body = client.get(url).json()
+    assert [(item["name"], item["count"]) for item in body["categories"]] == [
+        ("test_category", 2), ("other", 1)]
+    assert (body["price"][0]["count"], body["price"][-1]["count"]) == (2, 1)
+    assert body["price"][-1]["max"] is None
+
+    body = client.get(url, {"min_price": "100"}).json()
+    assert [item["name"] for item in body["categories"]] == ["other"]
+
+
+@pytest.mark.django_db
+def test_category_listing_uses_composite_index(category, make_products):
+    """
+    Tests that a category page is read from the (category, created_at, id)
+    index without a sort step
+    """
+    make_products(3)
+    queryset = Product.objects.filter(category=category).order_by("created_at", "id")[:20]
+    plan = queryset.explain()
+    assert "product_category_created_idx" in plan
+    assert "TEMP B-TREE" not in plan
+
+
+@pytest.mark.django_db
+def test_product_reviews_are_paginated(client, product, make_products, assert_constant_queries):
+    """
+    Tests that review pages walk every review once and do not query per row
+    """
+    users = [product.user] + [User.objects.create_user(email="user{}@example.com".format(index),
+                                                        username="user{}".format(index))
+                              for index in range(11)]
+    reviews = [Review.objects.create(product=product, user=user, rating=3) for user in users[:3]]
+    url = reverse("product_reviews", args=[product.id])
+
+    first = client.get(url, {"limit": 2}).json()
+    second = client.get(url, {"limit": 2, "cursor": first["next"]}).json()
+    assert [item["id"] for item in first["results"] + second["results"]] == [
+        str(review.id) for review in reviews]
+    assert second["next"] is None
+    assert client.get(reverse("product_reviews", args=["missing"])).status_code == 404
+
+    created = iter(users[3:])
+    assert_constant_queries(lambda: client.get(url, {"limit": 50}),
+                            lambda count: [Review.objects.create(product=product,
+                                                                 user=next(created),
+                                                                 rating=4)
+                                           for _ in range(count)],
+                            sizes=(2, 8))
+
+
+@pytest.mark.django_db
+def test_rating_summary_is_cached_until_reviews_change(client, product, review,
+                                                       django_assert_num_queries,
+                                                       django_capture_on_commit_callbacks):
+    """
+    Tests that the rating summary is served from the cache and refreshed
+    when a review is added
+    """
+    url = reverse("product_reviews", args=[product.id])
+    client.get(url)
+    with django_assert_num_queries(1):
+        summary = client.get(url).json()["summary"]
+    assert (summary["count"], summary["average"], summary["histogram"]["5"]) == (1, 5.0, 1)
+
+    other = User.objects.create_user(email="other@example.com", username="other")
+    with django_capture_on_commit_callbacks(execute=True):
+        Review.objects.create(product=product, user=other, rating=2)
+    summary = client.get(url).json()["summary"]
+    assert (summary["count"], summary["average"]) == (2, 3.5)
+
+
+@pytest.mark.django_db
+def test_reservations_hold_and_release_stock(client, user, make_products):
+    """
+    Tests that reservations take stock for every item or none, and that
+    releasing, confirming and expiry move stock back at most once
+    """
+    lamp, desk = make_products(2, quantity=5)
+    url = reverse("reservation_create")
+    client.force_login(user)
+
+    def stock():
+        return list(Product.objects.order_by("created_at").values_list("quantity", flat=True))
+
+    body = {"items": [{"product": str(lamp.id), "quantity": 2},
+                      {"product": str(desk.id), "quantity": 5}]}
+    response = client.post(url, body, content_type="application/json")
+    assert response.status_code == 201
+    held = response.json()["id"]
+    assert stock() == [3, 0]
+
+    response = client.post(url, {"items": [{"product": str(lamp.id), "quantity": 1},
+                                           {"product": str(desk.id), "quantity": 1}]},
+                           content_type="application/json")
+    assert response.json()["product"] == str(desk.id)
+    assert response.status_code == 409 and stock() == [3, 0]
+
+    release = reverse("reservation_release", args=[held])
+    assert client.post(release).status_code == 200
+    assert client.post(release).status_code == 409
+    assert client.post(reverse("reservation_confirm", args=[held])).status_code == 409
+    assert stock() == [5, 5]
+
+    expired = reserve(user.pk, [(lamp.id, 4)])
+    Reservation.objects.filter(pk=expired.pk).update(expires_at=timezone.now() - timedelta(seconds=1))
+    assert client.post(reverse("reservation_confirm", args=[expired.pk])).status_code == 409
+    call_command("release_expired_reservations")
+    assert stock() == [5, 5]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_hot_product_is_never_oversold(product, user):
+    """
+    Tests that many threads reserving one product never take more than
+    its stock
+
+    The in-memory test database reports lock conflicts instead of waiting
+    on them like a database file does, so a locked attempt is retried.
+    benchmarks/stock.py measures throughput on a database file.
+    """
+    stock, threads, attempts = 200, 16, 40
+    Product.objects.filter(pk=product.pk).update(quantity=stock)
+    outcomes = []
+    lock = threading.Lock()
+
+    def buy(_):
+        try:
+            held, short = 0, 0
+            for _ in range(attempts):
+                while True:
+                    try:
+                        reserve(user.pk, [(product.pk, 1)])
+                        held += 1
+                    except OutOfStock:
+                        short += 1
+                    except OperationalError:
+                        continue
+                    break
+            with lock:
+                outcomes.append((held, short))
+        finally:
+            connections.close_all()
+
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(buy, range(threads)))
+
+    held = sum(held for held, _ in outcomes)
+    product.refresh_from_db()
+    assert held == stock == Reservation.objects.count()
+    assert product.quantity == 0
+    assert sum(short for _, short in outcomes) == threads * attempts - stock
+
+
+@pytest.mark.django_db
+def test_fast_list_matches_product_serializer(client, settings, user, category,
+                                              make_products, django_assert_num_queries):
+    """
+    Tests that the fast list path returns byte for byte the responses of
+    ProductSerializer, paged and streamed, with one query per page
+    """
+    make_products(2, price=5)
+    for price, description in (("19.99", None), ("0.5", "café \"lamp\""), ("12345678.9", "")):
+        Product.objects.create(name="lamp", description=description, price=price,
+                               quantity=1, user=user, category=category)
+    url = reverse("list_create")
+    client.force_login(user)
+
+    def responses():
+        first = client.get(url, {"limit": 3})
+        return (first.content,
+                client.get(url, {"limit": 3, "cursor": first.json()["next"]}).content,
+                b"".join(client.get(url, {"stream": "1"}).streaming_content))
+
+    expected = responses()
+    settings.PRODUCT_FAST_LIST = True
+    assert responses() == expected
+    client.logout()
+    with django_assert_num_queries(1):
+        client.get(url, {"limit": 3})
+
+
+@pytest.mark.django_db
+def test_conditional_get(client, product, make_products, django_assert_num_queries,
+                         django_capture_on_commit_callbacks):
+    """
+    Tests that detail, list and stream responses carry validators and
+    answer a matching If-None-Match with a 304 before serializing
+    """
+    make_products(2)
+    detail = reverse("retrieve_update_delete", args=[product.id])
+    url = reverse("list_create")
+    etags = {}
+    for name, params in (("detail", None), ("page", {"limit": 2}), ("stream", {"stream": "1"})):
+        response = client.get(detail if name == "detail" else url, params)
+        assert response.status_code == 200 and response["Last-Modified"]
+        etags[name] = response["ETag"]
+
+    with django_assert_num_queries(0):
+        assert client.get(detail, HTTP_IF_NONE_MATCH=etags["detail"]).status_code == 304
+    with django_assert_num_queries(1):
+        response = client.get(url, {"limit": 2}, HTTP_IF_NONE_MATCH=etags["page"])
+    assert response.status_code == 304 and response["ETag"] == etags["page"]
+    with django_assert_num_queries(1):
+        assert client.get(url, {"stream": "1"},
+                          HTTP_IF_NONE_MATCH=etags["stream"]).status_code == 304
+
+    with django_capture_on_commit_callbacks(execute=True):
+        product.name = "renamed"
+        product.save()
+    assert client.get(detail, HTTP_IF_NONE_MATCH=etags["detail"]).status_code == 200
+    assert client.get(url, {"limit": 2}, HTTP_IF_NONE_MATCH=etags["page"]).status_code == 200
+    assert client.get(url, {"stream": "1"}, HTTP_IF_NONE_MATCH=etags["stream"]).status_code == 200
+
+    # the pages render the seller's email
+    for name, params in (("page", {"limit": 2}), ("stream", {"stream": "1"})):
+        etags[name] = client.get(url, params)["ETag"]
+    with django_capture_on_commit_callbacks(execute=True):
+        product.user.email = "renamed@example.com"
+        product.user.save()
+    response = client.get(url, {"limit": 2}, HTTP_IF_NONE_MATCH=etags["page"])
+    assert response.status_code == 200 and "renamed@example.com" in response.content.decode()
+    assert client.get(url, {"stream": "1"}, HTTP_IF_NONE_MATCH=etags["stream"]).status_code == 200
+
+
+@pytest.mark.django_db
+def test_catalog_snapshot_serves_list_without_queries(client, settings, tmp_path, make_products,
+                                                      django_assert_num_queries,
+                                                      django_capture_on_commit_callbacks):
+    """
+    Tests that the catalog snapshot answers anonymous pages and lookups
+    with the database responses, and is bypassed once a write marks it
+    stale until it is rebuilt
+    """
+    products = make_products(5)
+    url = reverse("list_create")
+    detail = reverse("retrieve_update_delete", args=[products[1].id])
+    first = client.get(url, {"limit": 2})
+    cursor = first.json()["next"]
+    middle = client.get(url, {"limit": 2, "cursor": cursor})
+    back = client.get(url, {"limit": 2, "cursor": middle.json()["previous"]})
+    expected = [first, middle, back, client.get(detail)]
+
+    settings.CATALOG_SNAPSHOT_PATH = str(tmp_path / "catalog.snapshot")
+    call_command("build_catalog_snapshot", stdout=io.StringIO())
+    with django_assert_num_queries(0):
+        served = [client.get(url, {"limit": 2}),
+                  client.get(url, {"limit": 2, "cursor": cursor}),
+                  client.get(url, {"limit": 2, "cursor": middle.json()["previous"]}),
+                  client.get(detail)]
+        assert client.get(url, {"limit": 2}, HTTP_IF_NONE_MATCH=first["ETag"]).status_code == 304
+        assert client.get(url, {"cursor": "bogus"}).status_code == 400
+    for response, reference in zip(served, expected):
+        assert response.content == reference.content
+        assert response["ETag"] == reference["ETag"]
+    # filtered pages are not in the snapshot
+    with django_assert_num_queries(1):
+        client.get(url, {"in_stock": "1"})
+
+    with django_capture_on_commit_callbacks(execute=True):
+        response = client.put(detail, {"name": "renamed", "price": "5.00"},
+                              content_type="application/json")
+    assert response.status_code == 200
+    with django_assert_num_queries(1):
+        assert client.get(url, {"limit": 2}).json()["results"][1]["name"] == "renamed"
+
+    call_command("build_catalog_snapshot", stdout=io.StringIO())
+    with django_assert_num_queries(0):
+        assert client.get(detail).json()["name"] == "renamed"
+
+    # writes outside the API, to the product or its seller
+    with django_capture_on_commit_callbacks(execute=True):
+        product = Product.objects.get(pk=products[1].pk)
+        product.name = "saved"
+        product.save()
+    assert client.get(detail).json()["name"] == "saved"
+    call_command("build_catalog_snapshot", stdout=io.StringIO())
+    with django_capture_on_commit_callbacks(execute=True):
+        product.user.email = "seller@example.com"
+        product.user.save()
+    assert client.get(detail).json()["user"] == "seller@example.com"
+
+
+def leaderboard_ids(category, board):
+    return [entry[-1] for entry in
+            Leaderboard.objects.get(category=category, board=board).entries[:2]]
+
+
+@pytest.mark.django_db
+def test_leaderboards_follow_writes_and_match_rebuild(settings, user, category, make_products,
+                                                      django_capture_on_commit_callbacks):
+    """
+    Tests that the leaderboards updated on every product and review write
+    rank products as a rebuild from the products table does
+    """
+    settings.LEADERBOARD_SIZE = 2
+    other = Category.objects.create(name="other")
+    products = make_products(7)
+    for price, product in zip([30, 10, 50, 20, 70, 40, 60], products):
+        product.price = price
+        product.save()
+    for rating, product in zip([3, 5, 4, 2], products):
+        Review.objects.create(product=product, user=user, rating=rating, review="ok")
+
+    assert leaderboard_ids(category, Leaderboard.CHEAPEST) == [str(products[1].id),
+                                                               str(products[3].id)]
+    assert leaderboard_ids(category, Leaderboard.TOP_RATED) == [str(products[1].id),
+                                                                str(products[2].id)]
+    assert leaderboard_ids(category, Leaderboard.NEWEST) == [str(products[6].id),
+                                                             str(products[5].id)]
+
+    products[1].category = other
+    products[1].save()
+    products[4].price = 1
+    products[4].save()
+    Review.objects.filter(product=products[2]).delete()
+    Review.objects.create(product=products[3], user=user, rating=5, review="great")
+    with django_capture_on_commit_callbacks(execute=True):
+        products[6].soft_delete()
+        products[0].delete()
+
+    updated = {(board.category_id, board.board): leaderboard_ids(board.category, board.board)
+               for board in Leaderboard.objects.select_related('category')}
+    assert updated[(category.pk, Leaderboard.CHEAPEST)] == [str(products[4].id),
+                                                             str(products[3].id)]
+    assert updated[(category.pk, Leaderboard.TOP_RATED)] == [str(products[3].id)]
+    assert updated[(other.pk, Leaderboard.NEWEST)] == [str(products[1].id)]
+    call_command("rebuild_leaderboards", stdout=io.StringIO())
+    rebuilt = {(board.category_id, board.board): leaderboard_ids(board.category, board.board)
+               for board in Leaderboard.objects.select_related('category')}
+    assert rebuilt == updated
+
+    # a save changing no ranked field leaves the boards unwritten
+    versions = dict(Leaderboard.objects.values_list("pk", "version"))
+    products[3].description = "changed"
+    products[3].save()
+    assert dict(Leaderboard.objects.values_list("pk", "version")) == versions
+
+
+@pytest.mark.django_db
+def test_category_leaderboard_reads_are_constant(client, category, make_products,
+                                                 assert_constant_queries):
+    """
+    Tests that a leaderboard is served in the same number of queries
+    whatever the size of the category
+    """
+    url = reverse("category_leaderboard", args=[category.id, Leaderboard.NEWEST])
+    assert_constant_queries(lambda: client.get(url), make_products, sizes=(3, 30))
+    results = client.get(url, {"limit": 5}).json()["results"]
+    assert len(results) == 5
+    newest = Product.objects.order_by("-created_at")[:5]
+    assert [item["id"] for item in results] == [str(product.id) for product in newest]
+    assert client.get(reverse("category_leaderboard",
+                              args=[category.id, "loudest"])).status_code == 404
+
+
+def related_rows():
+    return sorted((row.product_id, row.rank, row.related_id, round(row.score, 6))
+                  for row in RelatedProduct.objects.all())
+
+
+@pytest.mark.django_db
+def test_related_products_follow_wishlists(client, user, make_products):
+    """
+    Tests that related products are ranked by how often they are
+    wishlisted together and that refreshing after wishlist changes
+    stores what a full recomputation does
+    """
+    products = make_products(5)
+    others = [User.objects.create_user(email="fan{}@example.com".format(index),
+                                       username="fan{}".format(index),
+                                       password="testpasswd")
+              for index in range(2)]
+    add_products(user.pk, [product.pk for product in products[:3]])
+    add_products(others[0].pk, [products[0].pk, products[1].pk])
+    add_products(others[1].pk, [products[0].pk, products[3].pk])
+
+    url = reverse("related_products", args=[products[0].id])
+    results = client.get(url).json()["results"]
+    assert [item["id"] for item in results] == [str(products[index].id) for index in (1, 2, 3)]
+    assert [item["score"] for item in results] == [0.8165, 0.5774, 0.5774]
+    assert client.get(url, {"limit": 1}).json()["results"][0]["id"] == str(products[1].id)
+    assert client.get(reverse("related_products", args=[products[4].id])).json() == {"results": []}
+    assert client.get(reverse("related_products", args=[user.id])).status_code == 404
+
+    remove_products(others[0].pk, [products[1].pk])
+    results = client.get(url).json()["results"]
+    assert [item["id"] for item in results] == [str(products[index].id) for index in (1, 2, 3)]
+    assert {item["score"] for item in results} == {0.5774}
+    remove_products(user.pk, [product.pk for product in products[1:3]])
+    refreshed = related_rows()
+    call_command("compute_related_products", stdout=io.StringIO())
+    assert related_rows() == refreshed
+    assert [item["id"] for item in client.get(url).json()["results"]] == [str(products[3].id)]
+
+
+@pytest.mark.django_db
+def test_related_products_are_constant_queries(client, user, product, make_products,
+                                               assert_constant_queries):
+    """
+    Tests that related products are served in the same number of queries
+    whatever their number
+    """
+    def grow(count):
+        add_products(user.pk, [product.pk] + [item.pk for item in make_products(count)])
+
+    url = reverse("related_products", args=[product.id])
+    assert_constant_queries(lambda: client.get(url), grow, sizes=(2, 10))
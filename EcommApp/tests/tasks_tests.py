@@ -0,0 +1,155 @@
+import io
+from datetime import timedelta
+import pytest
+from django.core.management import call_command
+from django.utils import timezone
+from product import leaderboards, search
+from product.models import Leaderboard, Product
+from tasks.models import Task
+from tasks.queue import _schedule_drain, claim, enqueue, execute, run_batch, task
+from user.models import User, UserProfile
+
+calls = []
+
+@task(name="tests.record", max_attempts=2)
+def record(value, fail=False):
+    calls.append(value)
+    if fail:
+        raise RuntimeError("failed {}".format(value))
+
+@task(name="tests.record_in_worker", worker_only=True)
+def record_in_worker(value):
+    calls.append(value)
+
+@pytest.fixture
+def worker_mode(settings):
+    settings.TASKS_MODE = "worker"
+    calls.clear()
+
+
+@pytest.mark.django_db
+def test_tasks_run_once_per_idempotency_key(worker_mode):
+    """
+    Tests that a key enqueued twice runs once and keeps dropping
+    duplicates after it ran
+    """
+    assert enqueue(record, key="once", value=1)
+    assert not enqueue(record, key="once", value=2)
+    enqueue(record, value=3)
+    assert run_batch() == 2
+    assert sorted(calls) == [1, 3]
+    assert not enqueue(record, key="once", value=4)
+    # unkeyed tasks are deleted once done
+    assert list(Task.objects.values_list("key", "status")) == [("once", Task.DONE)]
+
+
+@pytest.mark.django_db
+def test_run_tasks_prunes_old_done_tasks(worker_mode):
+    """
+    Tests that run_tasks deletes done tasks once they are older than
+    --keep-done, which lets their keys be enqueued again
+    """
+    enqueue(record, key="old", value=1)
+    enqueue(record, key="new", value=2)
+    call_command("run_tasks", once=True, keep_done=3600, stdout=io.StringIO())
+    Task.objects.filter(key="old").update(updated_at=timezone.now() - timedelta(hours=2))
+    call_command("run_tasks", once=True, keep_done=3600, stdout=io.StringIO())
+    assert list(Task.objects.values_list("key", flat=True)) == ["new"]
+    assert enqueue(record, key="old", value=3)
+
+
+@pytest.mark.django_db
+def test_failed_tasks_are_retried_with_backoff(worker_mode):
+    """
+    Tests that a failing task is queued again with a delay and marked
+    failed after max_attempts runs
+    """
+    enqueue(record, value=1, fail=True)
+    assert run_batch() == 1
+    queued = Task.objects.get()
+    assert (queued.status, queued.attempts) == (Task.QUEUED, 1)
+    assert queued.run_after > timezone.now()
+    assert "failed 1" in queued.last_error
+    assert run_batch() == 0
+
+    Task.objects.update(run_after=timezone.now())
+    assert run_batch() == 1
+    failed = Task.objects.get()
+    assert (failed.status, failed.attempts) == (Task.FAILED, 2)
+    assert calls == [1, 1]
+
+
+@pytest.mark.django_db
+def test_worker_only_tasks_are_left_to_workers(settings, django_capture_on_commit_callbacks):
+    """
+    Tests that the thread pool neither drains for nor claims worker only
+    tasks, which the run_tasks worker still runs
+    """
+    settings.TASKS_MODE = "thread"
+    calls.clear()
+    with django_capture_on_commit_callbacks() as callbacks:
+        enqueue(record_in_worker, value=1)
+    assert not [callback for callback in callbacks
+                if getattr(callback, "func", None) is _schedule_drain]
+    enqueue(record, value=2)
+    assert run_batch(worker=False) == 1
+    assert calls == [2]
+    assert run_batch() == 1
+    assert calls == [2, 1]
+
+
+@pytest.mark.django_db
+def test_thread_mode_drains_again_when_retries_are_due(settings, monkeypatch):
+    """
+    Tests that in thread mode a failed task schedules a drain for when
+    its retry comes due
+    """
+    settings.TASKS_MODE = "thread"
+    scheduled = []
+    monkeypatch.setattr("tasks.queue._schedule_drain", scheduled.append)
+    enqueue(record, value=1, fail=True)
+    assert run_batch() == 1
+    assert scheduled == [2]
+
+
+@pytest.mark.django_db
+def test_tasks_are_claimed_once(worker_mode):
+    """
+    Tests that claimed tasks are not claimed again until their lease runs
+    out, and that a stale worker cannot record an outcome
+    """
+    enqueue(record, value=1)
+    claimed = claim(10)
+    assert len(claimed) == 1
+    assert claim(10) == []
+
+    Task.objects.update(locked_until=timezone.now() - timedelta(seconds=1))
+    reclaimed = claim(10)
+    assert [item.attempts for item in reclaimed] == [2]
+    # the first worker lost its lease, its outcome is ignored
+    execute(claimed[0])
+    assert Task.objects.get().status == Task.RUNNING
+    execute(reclaimed[0])
+    assert not Task.objects.exists()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_signal_tasks_run_after_commit(worker_mode, category):
+    """
+    Tests that side effects queued by signals only reach workers after
+    commit and that the run_tasks command drains them
+    """
+    user = User.objects.create_user(email="queued@example.com", username="queued",
+                                    password="testpasswd")
+    product = Product.objects.create(name="queued lamp", description="lamp", price=10,
+                                     quantity=1, user=user, category=category)
+    assert not UserProfile.objects.filter(user=user).exists()
+    assert search.search_ids("lamp", 10) == []
+    # profile, search and leaderboard updates
+    assert Task.objects.filter(status=Task.QUEUED).count() == 3
+
+    call_command("run_tasks", once=True, batch_size=1)
+    assert UserProfile.objects.filter(user=user).exists()
+    assert search.search_ids("lamp", 10) == [product.pk]
+    assert leaderboards.top(category.pk, Leaderboard.NEWEST) == [str(product.pk)]
+    assert not Task.objects.exists()
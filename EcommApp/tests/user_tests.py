@@ -1,4 +1,7 @@
 import pytest
+from django.core.management import call_command
+from django.urls import reverse
+from user.authentication import ClaimsUser
 from user.models import (
     User,
     UserProfile
@@ -9,5 +12,73 @@ def test_user_profile_exist():
     """
     Tests that the user profile is indeed created
     """
-    user = User.objects.create_user(username="test_user", password="")
-    assert UserProfile.objects.filter(user=user).exists()
\ No newline at end of file
+    user = User.objects.create_user(email="test_user@example.com",
+                                    username="test_user",
+                                    password="")
+    assert UserProfile.objects.filter(user=user).exists()
+
+@pytest.mark.django_db
+def test_import_users_creates_profiles(tmp_path, settings, user):
+    """
+    Tests that bulk imported users get hashed passwords and exactly one
+    profile each, and that taken emails and usernames are rejected
+    """
+    settings.PASSWORD_HASHERS = ["django.contrib.auth.hashers.MD5PasswordHasher"]
+    path = tmp_path / "users.csv"
+    path.write_text("email,username,password,first_name,date_of_birth\n"
+                    "ada@example.com,ada,secret1,Ada,1990-01-02\n"
+                    "bob@example.com,bob,,Bob,\n"
+                    "ADA@example.com,ada2,secret2,,\n"
+                    "{},carl,secret3,,\n"
+                    "dan@example.com,ada,secret4,,\n"
+                    "not-an-email,eve,secret5,,\n".format(user.email))
+    call_command("import_users", str(path), chunk_size=2, workers=2)
+
+    ada = User.objects.get(username="ada")
+    assert ada.check_password("secret1")
+    assert not User.objects.get(username="bob").has_usable_password()
+    assert ada.userprofile.first_name == "Ada"
+    assert str(ada.userprofile.date_of_birth) == "1990-01-02"
+    assert set(User.objects.values_list("username", flat=True)) == {"test_user", "ada", "bob", "ada2"}
+    assert UserProfile.objects.count() == User.objects.count()
+
+@pytest.mark.django_db
+def test_token_authentication_skips_user_lookup(client, user, django_assert_num_queries):
+    """
+    Tests that requests carrying an access token are authenticated from
+    its claims without loading the user, and that tokens can be refreshed
+    """
+    user.is_staff = True
+    user.save()
+    response = client.post(reverse("token_obtain_pair"),
+                           {"email": user.email, "password": "testpasswd"})
+    assert response.status_code == 200
+    tokens = response.json()
+
+    with django_assert_num_queries(0):
+        response = client.get(reverse("metrics"),
+                              HTTP_AUTHORIZATION="Bearer " + tokens["access"])
+    assert response.status_code == 200
+
+    response = client.post(reverse("token_refresh"), {"refresh": tokens["refresh"]})
+    assert response.status_code == 200
+    assert client.get(reverse("metrics"),
+                      HTTP_AUTHORIZATION="Bearer " + response.json()["access"]).status_code == 200
+    assert client.get(reverse("metrics"),
+                      HTTP_AUTHORIZATION="Bearer broken").status_code == 401
+
+@pytest.mark.django_db
+def test_claims_user_caches_full_user(user, django_assert_num_queries):
+    """
+    Tests that the full user behind a token is loaded once per TTL
+    """
+    claims_user = ClaimsUser({"user_id": str(user.pk), "username": user.username})
+    assert claims_user.username == user.username
+    with django_assert_num_queries(1):
+        first = claims_user.get_full_user()
+        second = claims_user.get_full_user()
+    assert first == second == user
+    assert first.email == user.email and not first._state.adding
+    # each request gets its own instance
+    first.backend = "leaked"
+    assert first is not second and not hasattr(second, "backend")
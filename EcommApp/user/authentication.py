@@ -0,0 +1,87 @@
+"""
+Stateless JWT authentication
+
+Access tokens carry the user's id, username and is_staff flag, so
+``JWTStatelessUserAuthentication`` can authenticate a request from the
+token alone and ``request.user`` is a ClaimsUser built from its claims,
+without loading the CustomUser row. Code that really needs the model
+calls ``request.user.get_full_user()``, which is served from a short TTL
+in-process cache. The cache holds the field values of the row, every
+call builds a new instance from them, so requests on other threads never
+share one.
+
+Since the row is not read, a deactivated user keeps access until their
+access token expires (``SIMPLE_JWT['ACCESS_TOKEN_LIFETIME']``).
+"""
+import threading
+import time
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from user.models import User
+
+
+class TTLCache:
+    """
+    Small thread safe in-process cache whose entries expire after ``ttl``
+    seconds, evicting the oldest entry once ``max_size`` is reached
+    """
+    def __init__(self, ttl, max_size=1024):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.entries = {}
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self.entries[key]
+                return None
+            return entry[1]
+
+    def set(self, key, value):
+        with self.lock:
+            if key not in self.entries and len(self.entries) >= self.max_size:
+                del self.entries[next(iter(self.entries))]
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+full_users = TTLCache(getattr(settings, 'AUTH_FULL_USER_TTL', 30))
+
+
+class ClaimsUser(TokenUser):
+    """
+    User built from the claims of a validated access token
+    """
+    def get_full_user(self):
+        """
+        Returns a new CustomUser instance of this user, built from the
+        row cached for AUTH_FULL_USER_TTL seconds
+        """
+        names = [field.attname for field in User._meta.concrete_fields]
+        values = full_users.get(self.id)
+        if values is None:
+            values = User.objects.values_list(*names).get(pk=self.id)
+            full_users.set(self.id, values)
+        return User.from_db(DEFAULT_DB_ALIAS, names, values)
+
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """
+    Issues token pairs carrying the claims ClaimsUser is built from
+    """
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        token['username'] = user.username
+        token['is_staff'] = user.is_staff
+        token['is_superuser'] = user.is_superuser
+        return token
@@ -0,0 +1,37 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from shared_model.importing import DEFAULT_CHUNK_SIZE, FORMATS
+from user.provisioning import provision_users
+
+
+class Command(BaseCommand):
+    """
+    Imports users and their profiles from a CSV or JSON lines file
+    """
+    help = "Bulk create users and their profiles from a CSV or JSON lines file"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import")
+        parser.add_argument('--format', choices=FORMATS,
+                            help="Input format, guessed from the file extension by default")
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                            help="Number of rows validated and written per transaction")
+        parser.add_argument('--workers', type=int,
+                            help="Number of password hashing processes, defaults to the CPU count")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or path.rsplit('.', 1)[-1].lower()
+        if fmt not in FORMATS:
+            raise CommandError("Cannot guess the format of {}, use --format".format(path))
+
+        with open(path, newline='', encoding='utf-8') as lines:
+            report = provision_users(lines, fmt,
+                                     chunk_size=options['chunk_size'],
+                                     workers=options['workers'])
+
+        for error in report.errors:
+            self.stderr.write(json.dumps(error))
+        self.stdout.write(self.style.SUCCESS(
+            "Imported {} users, rejected {} rows".format(report.created,
+                                                          report.error_count)))
@@ -20,7 +20,9 @@ class CustommUserManager(BaseUserManager):
         if email is None:
             raise TypeError("Enter an email.")
 
-        user = self.model(email=email, **extra_fields)
+        user = self.model(email=self.normalize_email(email),
+                          username=username,
+                          **extra_fields)
         user.set_password(password)
         user.save()
         return user
@@ -57,6 +59,9 @@ class CustomUser(AbstractBaseUser, PermissionsMixin, Basemodel):
     objects = CustommUserManager()
 
 
+User = CustomUser
+
+
 class UserProfile(Basemodel):
     """Model for user profile
     
@@ -74,13 +79,3 @@ class UserProfile(Basemodel):
     phone_number = models.CharField(blank=True, max_length=15)
     address = models.TextField(null=True, blank=True)
     date_of_birth = models.DateField(null=True, blank=True)
-
-class Wishlist(models.Model):
-    """Model for user wishlist
-    
-    Attributes:
-        user_id: int, required
-        product_id: int, required
-    """
-    user_id = models.ForeignKey(User, on_delete=models.CASCADE)
-    product_id = models.ForeignKey('product.Product', on_delete=models.CASCADE)
\ No newline at end of file
@@ -0,0 +1,112 @@
+"""
+Bulk provisioning of users and their profiles
+
+Passwords are hashed across a process pool, since the password hasher is
+deliberately slow and CPU bound. Users and profiles of a chunk are then
+written with two ``bulk_create`` calls in one transaction, so no user is
+committed without its profile. bulk_create does not send ``post_save``,
+which keeps the per-row ``create_user_profile`` signal out of the way.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+import django
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.db.models import Q
+from shared_model.importing import DEFAULT_CHUNK_SIZE, ImportReport, read_rows
+from user.models import User, UserProfile
+from user.serializer import UserImportSerializer
+
+PROFILE_FIELDS = ('first_name', 'last_name', 'phone_number', 'address', 'date_of_birth')
+
+
+def _init_worker():
+    """
+    Sets Django up in pool workers started with the spawn method
+    """
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'EcommApp.settings')
+    django.setup()
+
+
+def _hash(password):
+    return make_password(password or None)
+
+
+def provision_users(lines, fmt, chunk_size=DEFAULT_CHUNK_SIZE, workers=None):
+    """
+    Creates users and their profiles from CSV or JSON lines input and
+    returns an ImportReport
+
+    Rows whose email or username is already taken, in the database or
+    earlier in the input, are rejected.
+
+    Args:
+        lines (iterable): lines of CSV (with a header) or JSON lines text
+        fmt (str): one of shared_model.importing.FORMATS
+        chunk_size (int): number of rows validated and written together
+        workers (int): number of hashing processes, defaults to the CPU count
+    """
+    report = ImportReport()
+    workers = workers or os.cpu_count() or 1
+    rows = read_rows(lines, fmt)
+    seen_emails, seen_usernames = set(), set()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            _provision_chunk(chunk, pool, workers, seen_emails, seen_usernames, report)
+    return report
+
+
+def _provision_chunk(chunk, pool, workers, seen_emails, seen_usernames, report):
+    """
+    Validates one chunk, drops taken emails and usernames with a single
+    query, hashes the passwords in the pool and writes the rows
+    """
+    valid = []
+    for row_number, row in chunk:
+        if row is None:
+            report.add_error(row_number, {'non_field_errors': ['Malformed row']})
+            continue
+        serializer = UserImportSerializer(data=row)
+        if not serializer.is_valid():
+            report.add_error(row_number, serializer.errors)
+            continue
+        data = serializer.validated_data
+        data['email'] = User.objects.normalize_email(data['email'])
+        valid.append((row_number, data))
+
+    emails = [data['email'] for _, data in valid]
+    usernames = [data['username'] for _, data in valid]
+    taken = User.objects.filter(Q(email__in=emails) | Q(username__in=usernames))
+    for email, username in taken.values_list('email', 'username'):
+        seen_emails.add(email)
+        seen_usernames.add(username)
+
+    accepted = []
+    for row_number, data in valid:
+        if data['email'] in seen_emails:
+            report.add_error(row_number, {'email': ['Email is already taken']})
+        elif data['username'] in seen_usernames:
+            report.add_error(row_number, {'username': ['Username is already taken']})
+        else:
+            seen_emails.add(data['email'])
+            seen_usernames.add(data['username'])
+            accepted.append(data)
+
+    hashes = pool.map(_hash, [data.get('password') for data in accepted],
+                      chunksize=max(1, len(accepted) // (4 * workers)))
+    users, profiles = [], []
+    for data, password in zip(accepted, hashes):
+        user = User(email=data['email'], username=data['username'], password=password)
+        users.append(user)
+        profiles.append(UserProfile(user=user, **{field: data[field]
+                                                  for field in PROFILE_FIELDS
+                                                  if field in data}))
+
+    with transaction.atomic():
+        User.objects.bulk_create(users)
+        UserProfile.objects.bulk_create(profiles)
+    report.created += len(users)
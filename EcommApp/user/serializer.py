@@ -0,0 +1,32 @@
+from rest_framework import serializers
+
+class UserImportSerializer(serializers.Serializer):
+    """
+    Validates one row of a bulk user import
+
+    Attributes:
+        email (EmailField): email of the user
+        username (CharField): username of the user
+        password (CharField): raw password, an empty one is unusable
+        first_name (CharField): first name for the profile
+        last_name (CharField): last name for the profile
+        phone_number (CharField): phone number for the profile
+        address (CharField): address for the profile
+        date_of_birth (DateField): date of birth for the profile
+    """
+    email = serializers.EmailField()
+    username = serializers.CharField(max_length=150)
+    password = serializers.CharField(required=False, allow_blank=True, trim_whitespace=False)
+    first_name = serializers.CharField(required=False, allow_blank=True, max_length=150)
+    last_name = serializers.CharField(required=False, allow_blank=True, max_length=150)
+    phone_number = serializers.CharField(required=False, allow_blank=True, max_length=15)
+    address = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+    date_of_birth = serializers.DateField(required=False, allow_null=True)
+
+    def to_internal_value(self, data):
+        """
+        Treats empty CSV cells of optional fields as missing
+        """
+        data = {key: value for key, value in data.items()
+                if value != '' or key in ('email', 'username', 'password')}
+        return super().to_internal_value(data)
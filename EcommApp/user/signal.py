@@ -1,6 +1,8 @@
 from django.db.models.signals import post_save
 from django.dispatch import receiver
-from user.models import User, UserProfile
+from tasks.queue import enqueue
+from user.models import User
+from user.tasks import create_profile
 
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
@@ -8,7 +10,9 @@ def create_user_profile(sender, instance, created, **kwargs):
     Signal to create a new user profile when a user is created
     """
     if created:
-        UserProfile.objects.create(user=instance)
+        # no idempotency key, get_or_create on the one-to-one profile is
+        # enough and a key would keep a Task row per user forever
+        enqueue(create_profile, user_id=str(instance.pk))
 
 # @receiver(post_save, sender=User)
 # def save_user_profile(sender, instance, **kwargs):
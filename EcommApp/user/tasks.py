@@ -0,0 +1,11 @@
+from tasks.queue import task
+from user.models import User, UserProfile
+
+@task()
+def create_profile(user_id):
+    """
+    Task to create the profile of a new user
+    """
+    user = User.objects.filter(pk=user_id).first()
+    if user is not None:
+        UserProfile.objects.get_or_create(user=user)